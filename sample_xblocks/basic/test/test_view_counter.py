@@ -4,10 +4,12 @@
 
 from unittest.mock import Mock
 
+import pytest
 from xblock.runtime import DictKeyValueStore, KvsFieldData
 from xblock.test.tools import TestRuntime as Runtime  # Workaround for pytest trying to collect "TestRuntime" as a test
 
 from sample_xblocks.basic.view_counter import ViewCounter
+from workbench.runtime import WorkbenchRuntime
 
 
 def test_view_counter_state():
@@ -24,3 +26,20 @@ def test_view_counter_state():
         # Make sure the html fragment we're expecting appears in the body_html
         assert f'<span class="views">{i + 1}</span>' in generated_html.body_html()
         assert tester.views == (i + 1)
+
+
+@pytest.mark.django_db
+def test_view_counter_counts_atomically():
+    usage_id = WorkbenchRuntime().parse_xml_string("<view_counter_demo/>")
+
+    # Two students view the block, each with a block loaded before the other's view.
+    first = WorkbenchRuntime("student_1").get_block(usage_id)
+    second = WorkbenchRuntime("student_2").get_block(usage_id)
+    assert first.views == second.views == 0
+
+    assert '<span class="views">1</span>' in first.student_view({}).body_html()
+    assert '<span class="views">2</span>' in second.student_view({}).body_html()
+    first.save()
+    second.save()
+
+    assert WorkbenchRuntime("student_3").get_block(usage_id).views == 2
@@ -6,6 +6,7 @@ from xblock.core import XBlock
 from xblock.fields import Integer, Scope
 
 
+@XBlock.wants('counter')
 class ViewCounter(XBlock):
     """
     A simple XBlock that implements a simple view counter
@@ -19,7 +20,12 @@ class ViewCounter(XBlock):
         Render out the template.
 
         """
-        self.views += 1
+        counter = self.runtime.service(self, 'counter')
+        if counter is not None:
+            # Every student shares the count, so increment it atomically.
+            counter.increment(self, 'views')
+        else:
+            self.views += 1
         html = VIEW_COUNTER_TEMPLATE.format(views=self.views)
         frag = Fragment(html)
         return frag
@@ -67,10 +67,13 @@ class ThumbsBlockBase:
             log.error('error!')
             return None
 
-        if data['voteType'] == 'up':
-            self.upvotes += 1
+        field_name = 'upvotes' if data['voteType'] == 'up' else 'downvotes'
+        counter = self.runtime.service(self, 'counter')  # pylint: disable=no-member
+        if counter is not None:
+            # Vote totals are shared by every student, so count atomically.
+            counter.increment(self, field_name)
         else:
-            self.downvotes += 1
+            setattr(self, field_name, getattr(self, field_name) + 1)
 
         self.voted = True
 
@@ -91,6 +94,7 @@ class ThumbsBlockBase:
         ]
 
 
+@XBlock.wants('counter')
 class ThumbsBlock(ThumbsBlockBase, XBlock):
     """
     An XBlock with thumbs-up/thumbs-down voting.
@@ -102,6 +106,7 @@ class ThumbsBlock(ThumbsBlockBase, XBlock):
     """
 
 
+@XBlockAside.wants('counter')
 class ThumbsAside(ThumbsBlockBase, XBlockAside):
     """
     An XBlockAside with thumbs-up/thumbs-down voting.
@@ -4,9 +4,89 @@ fields.
 """
 
 
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connection
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+from django.utils.timezone import now
 
-from .models import XBlockState
+from .models import XBlockFieldState, XBlockState, startswith_q
+
+
+def estimated_row_count(model):
+    """
+    Return an estimate of the number of rows in the table of `model`, or None
+    if the database can't tell without counting them.
+    """
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s",
+                [table],
+            )
+        elif connection.vendor == 'sqlite':
+            # ANALYZE records the row count first in the statistics of each index.
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("SELECT CAST(stat AS INTEGER) FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator that doesn't count the rows of a big unfiltered list.
+
+    The count of a whole table of more than `MAX_EXACT_COUNT` rows is
+    estimated by the database; filtered lists are counted exactly, so that
+    all their pages can be reached. Page numbers past either end show the
+    first or last page, and when an estimate turns out too high, the rows are
+    counted to find the last page.
+    """
+    MAX_EXACT_COUNT = 10000
+
+    estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if queryset.query.has_filters():
+            return queryset.count()
+        bounded = queryset.order_by().values('pk')[:self.MAX_EXACT_COUNT + 1].count()
+        if bounded <= self.MAX_EXACT_COUNT:
+            return bounded
+        estimate = estimated_row_count(queryset.model)
+        if estimate is None:
+            return queryset.count()
+        self.estimated = True
+        return max(estimate, bounded)
+
+    def validate_number(self, number):
+        """Return the first or last page number for numbers past either end."""
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            return 1 if int(number) < 1 else self.num_pages
+
+    def page(self, number):
+        page = super().page(number)
+        if self.estimated and page.number > 1 and not page.object_list:
+            # Count the rows instead of the estimate, which was too high.
+            self.estimated = False
+            self.count = self.object_list.count()
+            self.__dict__.pop('num_pages', None)
+            page = super().page(number)
+        return page
 
 
 @admin.register(XBlockState)
@@ -17,10 +97,52 @@ class XBlockStateAdmin(admin.ModelAdmin):
     You're only allowed to edit the state fields themselves, not the IDs or
     categories. Since things like `tag` and `scenario` are set on write, weird
     things could happen if you muck with them later on.
+
+    Searches only use indexed columns: a term matches a user id or scenario
+    exactly, or is a case-sensitive prefix of a scope id. Set
+    ``settings.WORKBENCH['admin_state_search']`` to also look for terms
+    anywhere in the state, which reads the whole table.
+
+    Rows are counted with `EstimatedCountPaginator`, and the unfiltered total
+    isn't counted at all.
     """
     list_display = ['scope_id', 'scope', 'user_id', 'state']
-    list_filter = ['scope', 'user_id', 'scenario', 'tag']
-    search_fields = ['user_id', 'scope_id', 'state']
+    # No user_id filter: it would list every user on every page.
+    list_filter = ['scope', 'scenario', 'tag']
+    search_fields = ['user_id', 'scope_id', 'scenario']
     readonly_fields = [
-        'scope', 'scope_id', 'scenario', 'tag', 'user_id', 'created'
+        'scope', 'scope_id', 'scenario', 'tag', 'user_id', 'created', 'touched', 'version'
     ]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_fields(self, request):
+        """Add the state to the searched fields when state search is on."""
+        if settings.WORKBENCH.get('admin_state_search'):
+            return self.search_fields + ['state']
+        return self.search_fields
+
+    def get_search_results(self, request, queryset, search_term):
+        """Match each term against the indexed columns, unless state search is on."""
+        if settings.WORKBENCH.get('admin_state_search'):
+            return super().get_search_results(request, queryset, search_term)
+        for term in search_term.split():
+            queryset = queryset.filter(Q(user_id=term) | Q(scenario=term) | startswith_q('scope_id', term))
+        return queryset, False
+
+    def save_model(self, request, obj, form, change):
+        """
+        Bump the row version, so that concurrent writers notice the edit, and
+        touch the row, so that it isn't expired as inactive.
+        """
+        if change:
+            obj.version = F('version') + 1
+            obj.touched = now()
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(XBlockFieldState)
+class XBlockFieldStateAdmin(XBlockStateAdmin):
+    """The `XBlockStateAdmin` screens, for the fields kept in rows of their own."""
+    list_display = ['scope_id', 'scope', 'user_id', 'field_name', 'state']
+    readonly_fields = ['scope', 'scope_id', 'scenario', 'tag', 'user_id', 'field_name', 'touched', 'version']
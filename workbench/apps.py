@@ -0,0 +1,28 @@
+"""
+Django application configuration for the workbench.
+"""
+
+
+from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):  # pylint: disable=unused-argument
+    """
+    Run the PRAGMAs in ``settings.WORKBENCH['sqlite_pragmas']`` on a new SQLite connection.
+    """
+    pragmas = settings.WORKBENCH.get('sqlite_pragmas')
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+class WorkbenchConfig(AppConfig):
+    """The XBlock workbench."""
+    name = 'workbench'
+
+    def ready(self):
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='workbench_sqlite_pragmas')
@@ -0,0 +1,657 @@
+"""
+Key-value stores the workbench can keep XBlock state in.
+
+The store used by the workbench is selected with ``settings.WORKBENCH['kvs']``::
+
+    WORKBENCH = {
+        'kvs': {
+            'backend': 'workbench.kvs.DbmKeyValueStore',
+            'options': {'path': 'var/workbench.kvs'},
+        },
+    }
+
+The default is the Django model backed `workbench.runtime.WorkbenchDjangoKeyValueStore`.
+
+Calls to the `KeyValueStore` operations of every store are counted and timed
+in `workbench.metrics`, labelled with the store class and the operation.
+Operations that other operations are built on are counted at each level.
+
+`CachedKeyValueStore` can be put in front of any store, with the store it
+wraps in its 'store' option, and so can `FrozenContentKeyValueStore`.
+
+"""
+
+
+import copy
+import dbm
+import functools
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from types import MappingProxyType
+
+from xblock.fields import Scope
+from xblock.runtime import KeyValueStore
+
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+from .metrics import REGISTRY
+
+DEFAULT_BACKEND = 'workbench.runtime.WorkbenchDjangoKeyValueStore'
+
+OPERATIONS = REGISTRY.counter('workbench_kvs_operations_total', "Key-value store operations.")
+OPERATION_SECONDS = REGISTRY.histogram('workbench_kvs_operation_seconds', "Time spent in key-value store operations.")
+BYTES_READ = REGISTRY.counter('workbench_kvs_bytes_read_total', "Size of the state read from storage, by scope.")
+BYTES_WRITTEN = REGISTRY.counter('workbench_kvs_bytes_written_total', "Size of the state written to storage, by scope.")
+
+# The store methods that are counted and timed.
+INSTRUMENTED_OPERATIONS = ('get', 'set', 'delete', 'has', 'get_many', 'set_many', 'has_many', 'increment', 'flush')
+
+
+def load_kvs(config):
+    """
+    Create the key-value store described by `config`.
+
+    `config` is either the dotted path of a `WorkbenchKeyValueStore` class,
+    or a dict with the class path in 'backend' and its constructor keyword
+    arguments in 'options'.
+    """
+    if isinstance(config, str):
+        config = {'backend': config}
+    cls = import_string(config.get('backend', DEFAULT_BACKEND))
+    return cls(**config.get('options', {}))
+
+
+def _instrumented(operation, method):
+    """Wrap the store `method` so that its calls are counted and timed as `operation`."""
+    @functools.wraps(method)
+    def instrumented(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            store = type(self).__name__
+            OPERATIONS.inc(store=store, op=operation)
+            OPERATION_SECONDS.observe(time.perf_counter() - start, store=store, op=operation)
+    instrumented.instrumented = True
+    return instrumented
+
+
+def _instrument(cls):
+    """Instrument the operations that the store class `cls` defines itself."""
+    for operation in INSTRUMENTED_OPERATIONS:
+        method = cls.__dict__.get(operation)
+        if method is not None and not getattr(method, 'instrumented', False):
+            setattr(cls, operation, _instrumented(operation, method))
+
+
+def _scope_name(scope):
+    """
+    Return the name stores use for `scope`: its name, or "children" or
+    "parent" for those special scopes, whose names are "Scope.children" and
+    "Scope.parent".
+    """
+    if scope in (Scope.children, Scope.parent):
+        return scope.name.partition('.')[2]
+    return scope.name
+
+
+def _in_scenario(scope_name, block_scope_id, scenario):
+    """
+    Return whether a key's block scope id belongs to the scenario with the slug `scenario`.
+
+    Keys of the preferences and user_info scopes don't belong to any scenario.
+    """
+    if scope_name in (Scope.preferences.name, Scope.user_info.name):
+        return False
+    return (block_scope_id or "").startswith(scenario + ".")
+
+
+class WorkbenchKeyValueStore(KeyValueStore):
+    """
+    The `KeyValueStore` interface the workbench expects of its stores.
+
+    On top of the XBlock `KeyValueStore` methods, workbench stores can be
+    cleared, prepared for scenario loading, read and written a batch of keys at
+    a time and can increment counters atomically. The implementations here are
+    correct for any store; stores override them when they can do better.
+    """
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _instrument(cls)
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+
+    def clear(self):
+        """Clear all data from the store."""
+        raise NotImplementedError()
+
+    def clear_scenario(self, scenario):
+        """Clear all the data of the scenario with the slug `scenario`."""
+        raise NotImplementedError()
+
+    def prep_for_scenario_loading(self):
+        """
+        Reset any state that's necessary before we load scenarios.
+
+        Loading a scenario appends to the children of its blocks, so stores
+        must forget all the children they know about.
+        """
+        raise NotImplementedError()
+
+    @contextmanager
+    def unit_of_work(self):
+        """Group the reads and writes made in this block. Stores may batch them."""
+        yield
+
+    def flush(self):
+        """Write out any changes the store is holding on to."""
+
+    def prefetch_scenario(self, scenario, user_id):
+        """
+        Get ready to read the state of the scenario with the slug `scenario`
+        for `user_id` in the current unit of work. Stores may load it all at
+        once, instead of one key at a time.
+        """
+
+    def get_many(self, keys):
+        """Return a dict mapping each of `keys` that has a stored value to that value."""
+        return {key: self.get(key) for key in keys if self.has(key)}
+
+    def has_many(self, keys):
+        """Return a dict mapping each of `keys` to whether it has a stored value."""
+        return {key: self.has(key) for key in keys}
+
+    def increment(self, key, delta=1, default=0):
+        """
+        Atomically add `delta` to the number stored for `key` and return the
+        result. A missing value counts as `default`.
+        """
+        with self._lock:
+            value = (self.get(key) if self.has(key) else default) + delta
+            self.set(key, value)
+            return value
+
+
+_instrument(WorkbenchKeyValueStore)
+
+
+class MemoryKeyValueStore(WorkbenchKeyValueStore):
+    """
+    A store that keeps everything in a dict in this process.
+
+    Nothing is persisted and nothing is shared between processes, which makes
+    it the fastest store for unit tests and load tests of a single process.
+    Values are copied in and out, so callers can't mutate what's stored.
+    """
+    def __init__(self):
+        super().__init__()
+        self._data = {}
+
+    def clear(self):
+        """Clear all data from the store."""
+        with self._lock:
+            self._data.clear()
+
+    def clear_scenario(self, scenario):
+        """Clear all the data of the scenario with the slug `scenario`."""
+        with self._lock:
+            for key in [key for key in self._data if _in_scenario(key.scope.name, key.block_scope_id, scenario)]:
+                del self._data[key]
+
+    def prep_for_scenario_loading(self):
+        """Forget all children, since loading scenarios appends to them."""
+        with self._lock:
+            for key in [key for key in self._data if key.scope == Scope.children]:
+                del self._data[key]
+
+    def get(self, key):
+        """Get state for a given `KeyValueStore.Key`."""
+        return copy.deepcopy(self._data[key])
+
+    def set(self, key, value):
+        """Set state for a given `KeyValueStore.Key` to `value`."""
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._data[key] = value
+
+    def set_many(self, update_dict):
+        """Set every `KeyValueStore.Key` in `update_dict` to its value."""
+        update_dict = copy.deepcopy(update_dict)
+        with self._lock:
+            self._data.update(update_dict)
+
+    def delete(self, key):
+        """Delete state for a given `KeyValueStore.Key`."""
+        with self._lock:
+            del self._data[key]
+
+    def has(self, key):
+        """Check if an entry exists for `KeyValueStore.Key`."""
+        return key in self._data
+
+
+class DbmKeyValueStore(WorkbenchKeyValueStore):
+    """
+    A store that keeps each field in a `dbm` database file, without the ORM.
+
+    Keys and values are stored as JSON. The `dbm` implementations don't
+    support concurrent writers, so only one process should use the file.
+    """
+    def __init__(self, path='var/workbench.kvs'):
+        super().__init__()
+        self.path = path
+        self._db = dbm.open(path, 'c')
+
+    @staticmethod
+    def _encode_key(key):
+        """Return the dbm key for the `KeyValueStore.Key` `key`."""
+        return json.dumps(
+            [key.scope.name, key.block_scope_id, key.user_id, key.field_name, key.block_family],
+            separators=(',', ':'),
+        ).encode('utf-8')
+
+    def clear(self):
+        """Clear all data from the store."""
+        with self._lock:
+            self._db.close()
+            self._db = dbm.open(self.path, 'n')
+
+    def clear_scenario(self, scenario):
+        """Clear all the data of the scenario with the slug `scenario`."""
+        with self._lock:
+            doomed = [
+                db_key for db_key in self._db.keys()
+                if _in_scenario(*json.loads(db_key)[:2], scenario)
+            ]
+            for db_key in doomed:
+                del self._db[db_key]
+
+    def prep_for_scenario_loading(self):
+        """Forget all children, since loading scenarios appends to them."""
+        with self._lock:
+            children = [
+                db_key for db_key in self._db.keys()
+                if json.loads(db_key)[0] == Scope.children.name
+            ]
+            for db_key in children:
+                del self._db[db_key]
+
+    def flush(self):
+        """Make sure all writes have reached the database file."""
+        sync = getattr(self._db, 'sync', None)
+        if sync is not None:
+            with self._lock:
+                sync()
+
+    def close(self):
+        """Close the database file."""
+        with self._lock:
+            self._db.close()
+
+    def get(self, key):
+        """Get state for a given `KeyValueStore.Key`."""
+        with self._lock:
+            return json.loads(self._db[self._encode_key(key)])
+
+    def set(self, key, value):
+        """Set state for a given `KeyValueStore.Key` to `value`."""
+        with self._lock:
+            self._db[self._encode_key(key)] = json.dumps(value, separators=(',', ':'))
+
+    def delete(self, key):
+        """Delete state for a given `KeyValueStore.Key`."""
+        with self._lock:
+            del self._db[self._encode_key(key)]
+
+    def has(self, key):
+        """Check if an entry exists for `KeyValueStore.Key`."""
+        with self._lock:
+            return self._encode_key(key) in self._db
+
+
+class _Missing:
+    """Cached in place of the values of keys that aren't in the store."""
+
+
+class CachedKeyValueStore(WorkbenchKeyValueStore):
+    """
+    A store that reads through a Django cache in front of another store.
+
+    `store` is the configuration of the wrapped store, as accepted by
+    `load_kvs`. Only the fields of the scopes named in `scopes` are cached,
+    in the cache `cache_alias` of ``settings.CACHES``, for `timeout` seconds.
+    Keys missing from the store are cached too.
+
+    Writes go to the wrapped store, and the cached values of the written keys
+    are deleted once the store has them, that is at the end of the outermost
+    unit of work. Keys written in a unit of work are read from the store
+    until then. Clearing the store clears the whole cache, so the cache
+    should not be used for anything else. With a cache shared by several
+    processes, values written by one are seen by the others straight away,
+    except when a read races a write: the value read may then be stale for
+    up to `timeout` seconds.
+    """
+    DEFAULT_SCOPES = ('content', 'settings', 'children', 'parent')
+
+    def __init__(self, store=DEFAULT_BACKEND, cache_alias='default', scopes=DEFAULT_SCOPES, timeout=300):
+        super().__init__()
+        self.store = load_kvs(store)
+        self.cache = caches[cache_alias]
+        self.scopes = frozenset(scopes)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _cache_key(self, key):
+        """Return the cache key of the `KeyValueStore.Key` `key`, or None if its scope isn't cached."""
+        if _scope_name(key.scope) not in self.scopes:
+            return None
+        encoded = json.dumps([key.scope.name, key.block_scope_id, key.user_id, key.field_name, key.block_family])
+        return "workbench.kvs." + hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+    def _cached_keys(self, keys):
+        """Return a dict mapping those of `keys` that can be read from the cache to their cache key."""
+        written = getattr(self._local, 'written', None) or ()
+        cache_keys = {key: self._cache_key(key) for key in keys}
+        return {
+            key: cache_key for key, cache_key in cache_keys.items()
+            if cache_key is not None and cache_key not in written
+        }
+
+    def _written(self, keys):
+        """Delete the cached values of `keys`, now or at the end of the current unit of work."""
+        cache_keys = [cache_key for cache_key in map(self._cache_key, keys) if cache_key is not None]
+        written = getattr(self._local, 'written', None)
+        if written is not None:
+            written.update(cache_keys)
+        elif cache_keys:
+            self.cache.delete_many(cache_keys)
+
+    def clear(self):
+        """Clear all data from the store and the cache."""
+        self.store.clear()
+        self.cache.clear()
+
+    def clear_scenario(self, scenario):
+        """Clear all the data of the scenario with the slug `scenario`, and the cache."""
+        self.store.clear_scenario(scenario)
+        self.cache.clear()
+
+    def prep_for_scenario_loading(self):
+        """Reset the wrapped store for scenario loading, and clear the cache."""
+        self.store.prep_for_scenario_loading()
+        self.cache.clear()
+
+    @contextmanager
+    def unit_of_work(self):
+        """Group the reads and writes made in this block in a unit of work of the wrapped store."""
+        if getattr(self._local, 'written', None) is not None:
+            with self.store.unit_of_work():
+                yield
+            return
+
+        self._local.written = set()
+        try:
+            with self.store.unit_of_work():
+                yield
+        finally:
+            written, self._local.written = self._local.written, None
+            if written:
+                self.cache.delete_many(list(written))
+
+    def flush(self):
+        """Write out any changes the wrapped store is holding on to."""
+        self.store.flush()
+
+    def prefetch_scenario(self, scenario, user_id):
+        """Let the wrapped store load the state of the scenario for `user_id` in advance."""
+        self.store.prefetch_scenario(scenario, user_id)
+
+    def close(self):
+        """Close the wrapped store, if it can be closed."""
+        close = getattr(self.store, 'close', None)
+        if close is not None:
+            close()
+
+    def get(self, key):
+        """Get state for a given `KeyValueStore.Key`."""
+        values = self.get_many([key])
+        if key not in values:
+            raise KeyError(key)
+        return values[key]
+
+    def has(self, key):
+        """Check if an entry exists for `KeyValueStore.Key`."""
+        return self.has_many([key])[key]
+
+    def get_many(self, keys):
+        """
+        Return a dict mapping each of `keys` that has a stored value to that
+        value, reading the keys that aren't cached from the wrapped store.
+        """
+        keys = list(keys)
+        cache_keys = self._cached_keys(keys)
+        cached = self.cache.get_many(list(cache_keys.values())) if cache_keys else {}
+
+        values = {}
+        uncached = []
+        for key in keys:
+            cache_key = cache_keys.get(key)
+            if cache_key in cached:
+                if not isinstance(cached[cache_key], _Missing):
+                    values[key] = cached[cache_key]
+            else:
+                uncached.append(key)
+
+        if uncached:
+            stored = self.store.get_many(uncached)
+            values.update(stored)
+            to_cache = {
+                cache_keys[key]: stored.get(key, _Missing())
+                for key in uncached if key in cache_keys
+            }
+            if to_cache:
+                self.cache.set_many(to_cache, self.timeout)
+        return values
+
+    def has_many(self, keys):
+        """Return a dict mapping each of `keys` to whether it has a stored value."""
+        keys = list(keys)
+        values = self.get_many(keys)
+        return {key: key in values for key in keys}
+
+    def set(self, key, value):
+        """Set state for a given `KeyValueStore.Key` to `value`."""
+        self.store.set(key, value)
+        self._written([key])
+
+    def set_many(self, update_dict):
+        """Set every `KeyValueStore.Key` in `update_dict` to its value."""
+        self.store.set_many(update_dict)
+        self._written(update_dict)
+
+    def delete(self, key):
+        """Delete state for a given `KeyValueStore.Key`."""
+        self.store.delete(key)
+        self._written([key])
+
+    def increment(self, key, delta=1, default=0):
+        """Atomically increment the number stored for `key` in the wrapped store, and return it."""
+        value = self.store.increment(key, delta, default)
+        self._written([key])
+        return value
+
+
+class FrozenContentKeyValueStore(WorkbenchKeyValueStore):
+    """
+    A store that keeps the fields of scenario content in this process, and
+    everything else in another store.
+
+    The fields of the scopes named in `scopes` (by default the content,
+    settings, children and parent scopes, which scenario loading writes and
+    renders only read) never reach `store`, the configuration of the wrapped
+    store as accepted by `load_kvs`. So only user data reaches the database.
+
+    Each block's fields are kept in a read-only mapping of compact JSON
+    texts, which a write replaces with an updated copy. Readers never see a
+    half-made change and always get a fresh copy of a value, so they can't
+    mutate what's stored. Every process parses the scenarios itself, so they
+    all hold the same content; but changes made later, e.g. through a studio
+    view, are only seen by the process that made them, and are lost when it
+    exits.
+    """
+    DEFAULT_SCOPES = ('content', 'settings', 'children', 'parent')
+
+    def __init__(self, store=DEFAULT_BACKEND, scopes=DEFAULT_SCOPES):
+        super().__init__()
+        self.store = load_kvs(store)
+        self.scopes = frozenset(scopes)
+        self._frozen = {}
+
+    def is_frozen(self, key):
+        """Return whether the `KeyValueStore.Key` `key` is kept in this process."""
+        return _scope_name(key.scope) in self.scopes
+
+    @staticmethod
+    def _block_key(key):
+        """Return the key of the mapping holding the fields of `key`'s block."""
+        return _scope_name(key.scope), key.block_scope_id, key.block_family
+
+    def _split(self, keys):
+        """Split `keys` into those kept in this process and the others."""
+        frozen, others = [], []
+        for key in keys:
+            (frozen if self.is_frozen(key) else others).append(key)
+        return frozen, others
+
+    def _replace(self, block_key, update=None, remove=()):
+        """Replace the fields of `block_key` with a copy that has `update` applied and `remove` removed."""
+        fields = dict(self._frozen.get(block_key, {}))
+        for field_name, value in (update or {}).items():
+            fields[field_name] = json.dumps(value, separators=(',', ':'))
+        for field_name in remove:
+            del fields[field_name]
+        if fields:
+            self._frozen[block_key] = MappingProxyType(fields)
+        else:
+            self._frozen.pop(block_key, None)
+
+    def _forget(self, predicate):
+        """Forget the fields of the blocks whose (scope name, block scope id) match `predicate`."""
+        with self._lock:
+            self._frozen = {
+                block_key: fields for block_key, fields in self._frozen.items()
+                if not predicate(block_key[0], block_key[1])
+            }
+
+    # Workbench-special methods.
+    def clear(self):
+        """Clear all data from this process and the wrapped store."""
+        self.store.clear()
+        with self._lock:
+            self._frozen = {}
+
+    def clear_scenario(self, scenario):
+        """Clear all the data of the scenario with the slug `scenario`."""
+        self.store.clear_scenario(scenario)
+        self._forget(lambda scope_name, block_scope_id: _in_scenario(scope_name, block_scope_id, scenario))
+
+    def prep_for_scenario_loading(self):
+        """Forget all children, since loading scenarios appends to them."""
+        self.store.prep_for_scenario_loading()
+        self._forget(lambda scope_name, _block_scope_id: scope_name == 'children')
+
+    def unit_of_work(self):
+        """Group the reads and writes made in this block in a unit of work of the wrapped store."""
+        return self.store.unit_of_work()
+
+    def flush(self):
+        """Write out any changes the wrapped store is holding on to."""
+        self.store.flush()
+
+    def prefetch_scenario(self, scenario, user_id):
+        """Let the wrapped store load the state of the scenario for `user_id` in advance."""
+        self.store.prefetch_scenario(scenario, user_id)
+
+    def close(self):
+        """Close the wrapped store, if it can be closed."""
+        close = getattr(self.store, 'close', None)
+        if close is not None:
+            close()
+
+    # KeyValueStore methods.
+    def get(self, key):
+        """Get state for a given `KeyValueStore.Key`."""
+        if not self.is_frozen(key):
+            return self.store.get(key)
+        fields = self._frozen.get(self._block_key(key), {})
+        if key.field_name not in fields:
+            raise KeyError(key)
+        return json.loads(fields[key.field_name])
+
+    def has(self, key):
+        """Check if an entry exists for `KeyValueStore.Key`."""
+        if not self.is_frozen(key):
+            return self.store.has(key)
+        return key.field_name in self._frozen.get(self._block_key(key), {})
+
+    def get_many(self, keys):
+        """Return a dict mapping each of `keys` that has a stored value to that value."""
+        frozen, others = self._split(keys)
+        values = self.store.get_many(others) if others else {}
+        for key in frozen:
+            fields = self._frozen.get(self._block_key(key), {})
+            if key.field_name in fields:
+                values[key] = json.loads(fields[key.field_name])
+        return values
+
+    def has_many(self, keys):
+        """Return a dict mapping each of `keys` to whether it has a stored value."""
+        frozen, others = self._split(keys)
+        found = self.store.has_many(others) if others else {}
+        for key in frozen:
+            found[key] = key.field_name in self._frozen.get(self._block_key(key), {})
+        return found
+
+    def set(self, key, value):
+        """Set state for a given `KeyValueStore.Key` to `value`."""
+        self.set_many({key: value})
+
+    def set_many(self, update_dict):
+        """Set every `KeyValueStore.Key` in `update_dict` to its value."""
+        frozen, others = self._split(update_dict)
+        if others:
+            self.store.set_many({key: update_dict[key] for key in others})
+        if frozen:
+            updates = {}
+            for key in frozen:
+                updates.setdefault(self._block_key(key), {})[key.field_name] = update_dict[key]
+            with self._lock:
+                for block_key, update in updates.items():
+                    self._replace(block_key, update=update)
+
+    def delete(self, key):
+        """Delete state for a given `KeyValueStore.Key`."""
+        if not self.is_frozen(key):
+            self.store.delete(key)
+            return
+        with self._lock:
+            if not self.has(key):
+                raise KeyError(key)
+            self._replace(self._block_key(key), remove=[key.field_name])
+
+    def increment(self, key, delta=1, default=0):
+        """Atomically add `delta` to the number stored for `key` and return the result."""
+        if not self.is_frozen(key):
+            return self.store.increment(key, delta, default)
+        return super().increment(key, delta, default)
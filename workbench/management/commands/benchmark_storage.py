@@ -0,0 +1,236 @@
+"""
+Benchmark the workbench state storage.
+
+The ``handler`` suite measures end-to-end throughput of XBlock handler requests
+made by many concurrent students, which is where SQLite settings matter most.
+The requests go to a copy of the scenario, whose state is deleted afterwards,
+so the shared state of the scenario itself is left as it was. Compare the
+default SQLite settings with the performance profile with::
+
+    python manage.py benchmark_storage --suite handler
+    WORKBENCH_SQLITE_PERFORMANCE=true python manage.py benchmark_storage --suite handler
+
+The ``blob`` suite measures the latency of writing and reading a single field
+of increasing size, without compression and with each available state
+compression. Its store has no shared state cache, so every read decodes (and
+decompresses) the row::
+
+    python manage.py benchmark_storage --suite blob --sizes 1024,65536,1048576
+
+The ``fields`` suite measures the latency of writing and reading a small
+counter that shares its scope with a field of each size, with the counter in
+the blob and in a row of its own (see `NormalizedFieldKeyValueStore`)::
+
+    python manage.py benchmark_storage --suite fields --sizes 1024,65536
+
+The rows written by the benchmarks are deleted afterwards.
+"""
+
+
+import random
+import threading
+import time
+
+from xblock.fields import Scope
+from xblock.runtime import KeyValueStore
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from workbench import state_codec
+from workbench.models import XBlockFieldState, XBlockState
+from workbench.runtime import (ID_MANAGER, WORKBENCH_KVS, NormalizedFieldKeyValueStore, WorkbenchDjangoKeyValueStore,
+                               WorkbenchRuntime)
+from workbench.scenarios import SCENARIOS, add_xml_scenario, get_scenarios, remove_scenario
+
+STUDENT_PREFIX = 'benchmark-student-'
+HANDLER_SCENARIO = 'benchmark-handler'
+BLOB_SCENARIO = 'benchmark-blob'
+FIELDS_SCENARIO = 'benchmark-fields'
+
+
+class Command(BaseCommand):
+    """Run a storage benchmark and report its throughput."""
+    help = "Benchmark the workbench state storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--suite', choices=['handler', 'blob', 'fields'], default='handler', help="Which benchmark to run.",
+        )
+        parser.add_argument('--threads', type=int, default=8, help="Number of concurrent clients.")
+        parser.add_argument('--requests', type=int, default=200, help="Number of requests per client.")
+        parser.add_argument('--scenario', default='thumbs.0', help="Scenario whose blocks get the requests.")
+        parser.add_argument('--handler', default='vote', help="Name of the handler to call.")
+        parser.add_argument('--data', default='{"voteType": "up"}', help="JSON body of the handler requests.")
+        parser.add_argument(
+            '--sizes', default='1024,16384,262144,1048576',
+            help="Comma-separated field sizes in characters, for the blob and fields suites.",
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=50, help="Writes and reads per size, for the blob and fields suites.",
+        )
+
+    def handle(self, *args, **options):
+        getattr(self, f"benchmark_{options['suite']}")(options)
+
+    def _report(self, label, count, elapsed):
+        """Write one result line."""
+        self.stdout.write(f"{label}: {count} in {elapsed:.2f}s, {count / elapsed:.1f}/s")
+
+    def benchmark_handler(self, options):
+        """Call a handler of a copy of the scenario from many threads, each acting as a different student."""
+        try:
+            scenario = get_scenarios()[options['scenario']]
+        except KeyError as ex:
+            raise CommandError(f"No scenario {options['scenario']!r}") from ex
+        add_xml_scenario(HANDLER_SCENARIO, HANDLER_SCENARIO, scenario.xml)
+        try:
+            self._run_handler_benchmark(options)
+        finally:
+            XBlockState.objects.filter(user_id__startswith=STUDENT_PREFIX).delete()
+            WORKBENCH_KVS.clear_scenario(HANDLER_SCENARIO)
+            ID_MANAGER.clear_scenario(HANDLER_SCENARIO)
+            remove_scenario(HANDLER_SCENARIO)
+
+    def _run_handler_benchmark(self, options):
+        """Call the handler of the `HANDLER_SCENARIO` copy from many threads."""
+        usage_id = self._find_handler_usage(SCENARIOS[HANDLER_SCENARIO], options['scenario'], options['handler'])
+        url = reverse('handler', args=(usage_id, options['handler'], ''))
+
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode")
+                journal_mode = cursor.fetchone()[0]
+            self.stdout.write(f"Database vendor {connection.vendor}, journal mode {journal_mode}")
+        else:
+            self.stdout.write(f"Database vendor {connection.vendor}")
+
+        errors = []
+
+        def client_thread(number):
+            client = Client()
+            student_url = f"{url}?student={STUDENT_PREFIX}{number}"
+            try:
+                for _ in range(options['requests']):
+                    response = client.post(student_url, options['data'], content_type='application/json')
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+            except Exception as ex:  # pylint: disable=broad-exception-caught
+                errors.append(ex)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=client_thread, args=(n,)) for n in range(options['threads'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        self._report("Handler requests", options['threads'] * options['requests'], elapsed)
+        if errors:
+            raise CommandError(f"{len(errors)} requests failed, e.g. {errors[0]!r}")
+
+    def benchmark_blob(self, options):
+        """Write and read a content field of each size, with each state compression."""
+        compressions = [None] + [
+            name for name in state_codec.COMPRESSORS
+            if name != 'zstd' or state_codec.zstandard is not None
+        ]
+        key = KeyValueStore.Key(
+            scope=Scope.content, user_id=None, block_scope_id=f"{BLOB_SCENARIO}.html.d0", field_name="data",
+        )
+        repeat = options['repeat']
+        try:
+            for size in [int(size) for size in options['sizes'].split(',')]:
+                value = self._html_text(size)
+                for compression in compressions:
+                    with override_settings(WORKBENCH={**settings.WORKBENCH, 'state_compression': compression}):
+                        # Cached reads would skip the decoding this measures.
+                        kvs = WorkbenchDjangoKeyValueStore(shared_cache_size=0)
+                        start = time.perf_counter()
+                        for number in range(repeat):
+                            kvs.set(key, value + str(number))
+                        write_time = time.perf_counter() - start
+
+                        start = time.perf_counter()
+                        for _ in range(repeat):
+                            kvs.get(key)
+                        read_time = time.perf_counter() - start
+
+                    stored = len(XBlockState.find_for_key(key).state)
+                    self.stdout.write(
+                        f"{size:>9} chars, {compression or 'uncompressed':<12}: "
+                        f"write {write_time / repeat * 1000:7.2f}ms, read {read_time / repeat * 1000:7.2f}ms, "
+                        f"stored {stored} chars"
+                    )
+        finally:
+            XBlockState.delete_scenario(BLOB_SCENARIO)
+
+    def benchmark_fields(self, options):
+        """Write and read a counter next to a field of each size, in the blob and in a row of its own."""
+        stores = [
+            ("blob", WorkbenchDjangoKeyValueStore()),
+            ("field row", NormalizedFieldKeyValueStore(fields=["count"])),
+        ]
+        repeat = options['repeat']
+        try:
+            for size in [int(size) for size in options['sizes'].split(',')]:
+                for number, (mode, kvs) in enumerate(stores):
+                    block_scope_id = f"{FIELDS_SCENARIO}.counter.d{size}.u{number}"
+                    big, count = (
+                        KeyValueStore.Key(
+                            scope=Scope.user_state, user_id=f"{STUDENT_PREFIX}0",
+                            block_scope_id=block_scope_id, field_name=field_name,
+                        )
+                        for field_name in ("data", "count")
+                    )
+                    kvs.set(big, self._html_text(size))
+
+                    start = time.perf_counter()
+                    for value in range(repeat):
+                        kvs.set(count, value)
+                    write_time = time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    for _ in range(repeat):
+                        kvs.get(count)
+                    read_time = time.perf_counter() - start
+
+                    self.stdout.write(
+                        f"{size:>9} chars beside, counter in {mode:<9}: "
+                        f"write {write_time / repeat * 1000:7.2f}ms, read {read_time / repeat * 1000:7.2f}ms"
+                    )
+        finally:
+            XBlockState.delete_scenario(FIELDS_SCENARIO)
+            XBlockFieldState.objects.filter(scenario=FIELDS_SCENARIO).delete()
+
+    @staticmethod
+    def _html_text(size):
+        """Return `size` characters of HTML-like text, about as compressible as real content."""
+        words = ["the", "xblock", "student", "answer", "problem", "<p>", "</p>", "course", "value", "submit"]
+        rand = random.Random(size)
+        text = []
+        length = 0
+        while length < size:
+            word = rand.choice(words) + rand.choice(["", str(rand.randrange(1000))])
+            text.append(word)
+            length += len(word) + 1
+        return " ".join(text)[:size]
+
+    @staticmethod
+    def _find_handler_usage(scenario, scenario_id, handler_name):
+        """Return the usage id of the first block in `scenario`, a copy of `scenario_id`, with the handler."""
+        runtime = WorkbenchRuntime()
+        pending = [scenario.usage_id]
+        while pending:
+            block = runtime.get_block(pending.pop(0))
+            if getattr(getattr(block, handler_name, None), '_is_xblock_handler', False):
+                return block.scope_ids.usage_id
+            pending.extend(getattr(block, 'children', []))
+        raise CommandError(f"No block in {scenario_id!r} has a {handler_name!r} handler")
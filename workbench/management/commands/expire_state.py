@@ -0,0 +1,96 @@
+"""
+Delete the XBlock state of users who haven't written any for a while.
+
+Any ``?student=`` value creates rows for a new user, so load tests and casual
+use leave lots of them behind. A user is inactive when none of their rows in
+`XBlockState` and `XBlockFieldState` was touched within
+``settings.WORKBENCH['user_state_ttl']`` seconds (or ``--ttl``). All the rows
+of inactive users are deleted, a batch at a time; users who wrote anything
+within the TTL keep all of their state::
+
+    python manage.py expire_state --ttl 86400
+    python manage.py expire_state --every 3600
+"""
+
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils.timezone import now
+
+from workbench.models import XBlockFieldState, XBlockState
+
+
+class Command(BaseCommand):
+    """Delete the `XBlockState` rows of users that weren't written to within the TTL."""
+    help = "Delete the stored XBlock state of users that wasn't written to within the user state TTL."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl', type=int, metavar='SECONDS',
+            help="Expire rows older than this. Defaults to settings.WORKBENCH['user_state_ttl'].",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of rows to delete per transaction.")
+        parser.add_argument(
+            '--every', type=float, metavar='SECONDS',
+            help="Keep running, expiring state every SECONDS seconds.",
+        )
+
+    def handle(self, *args, **options):
+        ttl = options['ttl'] if options['ttl'] is not None else settings.WORKBENCH.get('user_state_ttl')
+        if ttl is None:
+            raise CommandError("No TTL: pass --ttl or set WORKBENCH['user_state_ttl'].")
+
+        while True:
+            self.expire(timedelta(seconds=ttl), options['batch_size'])
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def expire(self, ttl, batch_size):
+        """Delete the rows of the users inactive for more than `ttl`, `batch_size` rows at a time."""
+        cutoff = now() - ttl
+        candidates = set()
+        for model in (XBlockState, XBlockFieldState):
+            candidates.update(
+                model.objects.filter(user_id__isnull=False).values('user_id')
+                .annotate(last_touched=Max('touched')).filter(last_touched__lt=cutoff)
+                .values_list('user_id', flat=True)
+            )
+
+        deleted = expired_users = 0
+        candidates = sorted(candidates)
+        for start in range(0, len(candidates), batch_size):
+            users = self.inactive_users(candidates[start:start + batch_size], cutoff)
+            expired_users += len(users)
+            for model in (XBlockState, XBlockFieldState):
+                rows = model.objects.filter(user_id__in=users)
+                while True:
+                    batch = list(rows.order_by().values_list('pk', flat=True)[:batch_size])
+                    if not batch:
+                        break
+                    with transaction.atomic():
+                        model.objects.filter(pk__in=batch).delete()
+                    deleted += len(batch)
+        if deleted:
+            XBlockState.user_ids_changed()
+        self.stdout.write(f"Expired {deleted} rows of {expired_users} users.")
+
+    @staticmethod
+    def inactive_users(users, cutoff):
+        """
+        Return the users of `users` without a row touched since `cutoff` in
+        either table: a user may be inactive in one and not in the other, or
+        have written since they were picked.
+        """
+        active = set()
+        for model in (XBlockState, XBlockFieldState):
+            active.update(
+                model.objects.filter(user_id__in=users, touched__gte=cutoff)
+                .values_list('user_id', flat=True).distinct()
+            )
+        return [user for user in users if user not in active]
@@ -0,0 +1,85 @@
+"""
+Delete the XBlock state of blocks that no longer exist.
+
+Rows are keyed by the definition and usage ids that `ScenarioIdManager` gives
+the blocks of each scenario. When a scenario is edited or removed, the rows of
+its old blocks stay behind. This command parses the scenarios with
+`parse_scenarios`, which gives their blocks the ids a freshly started
+workbench gives them without touching the stored state, and deletes the rows
+of `XBlockState` and `XBlockFieldState` whose ids its id manager doesn't know,
+a batch at a time. Rows of the preferences and user_info scopes don't belong
+to any block, and are kept. With ``--dry-run``, nothing is written::
+
+    python manage.py gc_state --dry-run
+    python manage.py gc_state --every 3600
+"""
+
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.functions import Length
+
+from workbench.models import XBlockFieldState, XBlockState
+from workbench.scenarios import parse_scenarios
+
+# The scopes whose rows aren't keyed by block ids.
+UNOWNED_SCOPES = ('type', 'all')
+
+
+class Command(BaseCommand):
+    """Delete the `XBlockState` rows of blocks that aren't in any scenario."""
+    help = "Delete the stored XBlock state of blocks that are no longer in any scenario."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of rows to check per transaction.")
+        parser.add_argument(
+            '--every', type=float, metavar='SECONDS',
+            help="Keep running, collecting garbage every SECONDS seconds.",
+        )
+
+    def handle(self, *args, **options):
+        runtime, scenarios = parse_scenarios()
+        if not scenarios:
+            raise CommandError("No scenarios are declared, so every row would look orphaned.")
+
+        while True:
+            self.collect(runtime.id_reader, options['batch_size'], options['dry_run'])
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def collect(self, id_manager, batch_size, dry_run):
+        """
+        Delete or count the rows whose ids `id_manager` doesn't know,
+        `batch_size` rows at a time.
+        """
+        seen = orphans = orphan_size = 0
+        for model in (XBlockState, XBlockFieldState):
+            last_pk = 0
+            while True:
+                batch = list(
+                    model.objects.filter(pk__gt=last_pk).exclude(scope__in=UNOWNED_SCOPES)
+                    .order_by('pk').values_list('pk', 'scope_id', Length('state'))[:batch_size]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1][0]
+                seen += len(batch)
+
+                orphaned = [
+                    (pk, size) for pk, scope_id, size in batch
+                    if scope_id is not None and not id_manager.is_known_id(scope_id)
+                ]
+                orphans += len(orphaned)
+                orphan_size += sum(size for _pk, size in orphaned)
+                if orphaned and not dry_run:
+                    with transaction.atomic():
+                        model.objects.filter(pk__in=[pk for pk, _size in orphaned]).delete()
+
+        if orphans and not dry_run:
+            XBlockState.user_ids_changed()
+        verb = "Would delete" if dry_run else "Deleted"
+        self.stdout.write(f"{verb} {orphans} of {seen} rows, {orphan_size} bytes of state.")
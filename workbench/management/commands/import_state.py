@@ -0,0 +1,95 @@
+"""
+Import XBlock state from JSON Lines written by ``export_state``.
+
+Lines are read and inserted with ``bulk_create`` a batch at a time, so memory
+use stays flat however large the snapshot is. The state is encoded with the
+configured state codec. Lines with a ``field_name`` are restored as
+`XBlockFieldState` rows, the others as `XBlockState` rows. Rows that already
+exist make the import fail, unless ``--ignore-conflicts`` is given, in which
+case the existing rows are kept::
+
+    python manage.py import_state snapshot.jsonl --batch-size 5000
+"""
+
+
+import sys
+from contextlib import ExitStack
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from workbench.management.commands.export_state import EXPORTED_FIELDS
+from workbench.models import XBlockFieldState, XBlockState
+from workbench.state_codec import encode_state, get_codec
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+class Command(BaseCommand):
+    """Create `XBlockState` and `XBlockFieldState` rows from a JSON Lines file."""
+    help = "Import XBlock state from JSON Lines written by export_state."
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="File to read from, '-' for stdin.")
+        parser.add_argument('--scenario', help="Only import the rows of the scenario with this slug.")
+        parser.add_argument('--user', help="Only import the rows of this user id.")
+        parser.add_argument(
+            '--scope', choices=[choice for choice, _ in XBlockState.BLOCK_SCOPE_NAMES],
+            help="Only import the rows of this scope.",
+        )
+        parser.add_argument('--batch-size', type=int, default=2000, help="Number of rows to insert at a time.")
+        parser.add_argument('--ignore-conflicts', action='store_true', help="Keep rows that already exist.")
+
+    def handle(self, *args, **options):
+        wanted = {
+            'scenario': options['scenario'],
+            'user_id': options['user'],
+            'scope': options['scope'],
+        }
+        wanted = {field: value for field, value in wanted.items() if value is not None}
+        codec = get_codec()
+
+        with ExitStack() as stack:
+            stack.callback(XBlockState.user_ids_changed)
+            if options['input'] == '-':
+                source = sys.stdin
+            else:
+                source = stack.enter_context(open(options['input'], encoding='utf-8'))
+            lines = (json.loads(line) for line in source if line.strip())
+            records = (
+                self.make_record(line, codec)
+                for line in lines
+                if all(line.get(field) == value for field, value in wanted.items())
+            )
+            count = 0
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                try:
+                    with transaction.atomic():
+                        for model in (XBlockState, XBlockFieldState):
+                            model.objects.bulk_create(
+                                [record for record in batch if isinstance(record, model)],
+                                ignore_conflicts=options['ignore_conflicts'],
+                            )
+                except IntegrityError as ex:
+                    raise CommandError(
+                        f"Some rows after the first {count} already exist, use --ignore-conflicts to keep them"
+                    ) from ex
+                count += len(batch)
+
+        self.stdout.write(f"Imported {count} rows.")
+
+    @staticmethod
+    def make_record(line, codec):
+        """Return the unsaved row for the exported `line`, with its state encoded with `codec`."""
+        fields = {field: line.get(field) for field in EXPORTED_FIELDS}
+        state = encode_state(line['state'], codec)
+        if 'field_name' in line:
+            return XBlockFieldState(field_name=line['field_name'], state=state, **fields)
+        return XBlockState(state=state, **fields)
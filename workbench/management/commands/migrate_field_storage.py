@@ -0,0 +1,195 @@
+"""
+Move stored XBlock state between the state blobs and the per-field rows.
+
+`NormalizedFieldKeyValueStore` reads the fields it selects from
+`XBlockFieldState` and the others from the blobs of `XBlockState`, so after
+the selection changes the stored values must be moved to match. This command
+moves the selected fields out of the blobs into rows of their own, and the
+values of the fields that aren't selected any more back into the blobs. The
+selection is ``settings.WORKBENCH['field_storage']`` unless ``--block-type``
+or ``--field`` is given::
+
+    python manage.py migrate_field_storage --field thumbs.upvotes --field thumbs.downvotes
+    python manage.py migrate_field_storage --block-type '*'
+
+With an empty selection every field goes back into the blobs. Rows are moved a
+batch at a time. Each blob and field row is written with a version check,
+like the key-value stores write them, so rows changed while the command runs
+are read again and moved rather than overwritten.
+"""
+
+
+from itertools import groupby
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from workbench.models import XBlockFieldState, XBlockState
+from workbench.runtime import WorkbenchDjangoKeyValueStore, field_is_selected
+from workbench.state_codec import decode_state, encode_state, get_codec
+
+
+class Command(BaseCommand):
+    """Move XBlock state between `XBlockState` blobs and `XBlockFieldState` rows."""
+    help = "Move the stored XBlock state of the selected fields to rows of their own, and the others to the blobs."
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The selection, codec and count of conflicting rows of a run, set by `handle`.
+        self.block_types = self.fields = frozenset()
+        self.codec = None
+        self.skipped = 0
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--block-type', action='append', dest='block_types', metavar='BLOCK_TYPE',
+            help="Keep every field of this block type ('*' for all) in rows of their own. Can be repeated.",
+        )
+        parser.add_argument(
+            '--field', action='append', dest='fields', metavar='FIELD',
+            help="Keep this field (a name or block_type.field_name) in rows of its own. Can be repeated.",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of rows to move per transaction.")
+
+    def handle(self, *args, **options):
+        if options['block_types'] is None and options['fields'] is None:
+            selection = settings.WORKBENCH.get('field_storage') or {}
+            block_types, fields = selection.get('block_types', ()), selection.get('fields', ())
+        else:
+            block_types, fields = options['block_types'] or (), options['fields'] or ()
+        self.block_types, self.fields = frozenset(block_types), frozenset(fields)
+        self.codec = get_codec()
+        self.skipped = 0
+
+        split = self.split_blobs(options['batch_size'])
+        merged = self.merge_fields(options['batch_size'])
+        self.stdout.write(f"Moved {split} fields out of the blobs and {merged} fields back into them.")
+        if self.skipped:
+            self.stdout.write(f"{self.skipped} rows kept being changed concurrently and were left as they were.")
+
+    def is_selected(self, block_type, field_name):
+        """Return whether the field `field_name` of `block_type` blocks belongs in a row of its own."""
+        return field_is_selected(block_type, field_name, self.block_types, self.fields)
+
+    def split_blobs(self, batch_size):
+        """Move the selected fields out of the blobs, and return how many were moved."""
+        moved = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                XBlockState.objects.filter(pk__gt=last_pk).order_by('pk')
+                .only('pk', 'scope', 'scope_id', 'user_id', 'scenario', 'tag', 'version', 'state')[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            for _attempt in range(WorkbenchDjangoKeyValueStore.MAX_WRITE_ATTEMPTS):
+                batch_moved, conflicting = self.split(batch)
+                moved += batch_moved
+                if not conflicting:
+                    break
+                batch = list(XBlockState.objects.filter(pk__in=conflicting))
+            else:
+                self.skipped += len(conflicting)
+        return moved
+
+    def split(self, records):
+        """
+        Move the selected fields of the blobs `records` to rows of their own,
+        in one transaction. Each blob is only updated, or deleted once empty,
+        if its version is still the one it was read with. Return the number
+        of fields moved and the ids of the blobs that changed since they
+        were read.
+        """
+        field_rows = []
+        conflicting = []
+        with transaction.atomic():
+            for record in records:
+                state = decode_state(record.state)
+                selected = [name for name in state if self.is_selected(record.tag, name)]
+                if not selected:
+                    continue
+                record_rows = [
+                    XBlockFieldState(
+                        scope=record.scope, scope_id=record.scope_id, user_id=record.user_id,
+                        scenario=record.scenario, tag=record.tag, field_name=name,
+                        state=encode_state({name: state.pop(name)}, self.codec),
+                    )
+                    for name in selected
+                ]
+                current = XBlockState.objects.filter(pk=record.pk, version=record.version)
+                if state:
+                    written = current.update(state=encode_state(state, self.codec), version=F('version') + 1)
+                else:
+                    written, _ = current.delete()
+                if written:
+                    field_rows.extend(record_rows)
+                else:
+                    conflicting.append(record.pk)
+            # A field that already has a row keeps it: that is the value being read.
+            XBlockFieldState.objects.bulk_create(field_rows, ignore_conflicts=True)
+        return len(field_rows), conflicting
+
+    def merge_fields(self, batch_size):
+        """Move the fields that aren't selected back into the blobs, and return how many were moved."""
+        moved = 0
+        last_pk = 0
+        while True:
+            batch = list(XBlockFieldState.objects.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            unselected = sorted(
+                (record for record in batch if not self.is_selected(record.tag, record.field_name)),
+                key=lambda record: tuple(value or "" for value in self._row_key(record)),
+            )
+            with transaction.atomic():
+                for row_key, records in groupby(unselected, key=self._row_key):
+                    records = list(records)
+                    for _attempt in range(WorkbenchDjangoKeyValueStore.MAX_WRITE_ATTEMPTS):
+                        if self.merge(row_key, records):
+                            moved += len(records)
+                            break
+                        # Field rows deleted meanwhile have nothing left to move.
+                        records = list(XBlockFieldState.objects.filter(pk__in=[record.pk for record in records]))
+                        if not records:
+                            break
+                    else:
+                        self.skipped += len(records)
+        return moved
+
+    def merge(self, row_key, records):
+        """
+        Move the field rows `records` into the blob of `row_key`, in one
+        transaction. The blob and the field rows are only written if their
+        versions are still the ones they were read with. Return whether they
+        were.
+        """
+        scope, scope_id, user_id = row_key
+        with transaction.atomic():
+            blob, _ = XBlockState.objects.get_or_create(
+                scope=scope, scope_id=scope_id, user_id=user_id,
+                defaults={'scenario': records[0].scenario, 'tag': records[0].tag},
+            )
+            state = decode_state(blob.state)
+            for record in records:
+                state.update(decode_state(record.state))
+            written = XBlockState.objects.filter(pk=blob.pk, version=blob.version).update(
+                state=encode_state(state, self.codec), version=F('version') + 1,
+            )
+            if not written or not all(
+                XBlockFieldState.objects.filter(pk=record.pk, version=record.version).delete()[0]
+                for record in records
+            ):
+                transaction.set_rollback(True)
+                return False
+        return True
+
+    @staticmethod
+    def _row_key(record):
+        """Return the (scope, scope_id, user_id) of the blob that `record` belongs in."""
+        return record.scope, record.scope_id, record.user_id
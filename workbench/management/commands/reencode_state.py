@@ -0,0 +1,91 @@
+"""
+Re-encode stored XBlock state with a different state codec.
+
+Blobs are also compressed or decompressed to match the configured state
+compression.
+
+The rows of `XBlockState` and of `XBlockFieldState` are both re-encoded. Rows
+are streamed in primary key order, a batch at a time, so memory use stays
+flat however large the table is. Each row is written with a version check, like
+the key-value store writes it, so rows changed while the command runs are read
+again and re-encoded rather than overwritten::
+
+    python manage.py reencode_state --codec compact-json --batch-size 1000
+"""
+
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from workbench.models import XBlockFieldState, XBlockState
+from workbench.runtime import WorkbenchDjangoKeyValueStore
+from workbench.state_codec import CODECS, decode_state, encode_state, get_codec
+
+
+class Command(BaseCommand):
+    """Re-encode every `XBlockState` and `XBlockFieldState` row with the given codec."""
+    help = "Re-encode the stored XBlock state with a state codec (the configured one by default)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--codec', choices=sorted(CODECS),
+            help="Codec to encode rows with. Defaults to settings.WORKBENCH['state_codec'].",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of rows to read and write per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        codec = get_codec(options['codec'])
+        batch_size = options['batch_size']
+
+        seen = changed = skipped = 0
+        for model in (XBlockState, XBlockFieldState):
+            last_pk = 0
+            while True:
+                batch = list(
+                    model.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'version', 'state')[:batch_size]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                seen += len(batch)
+
+                for _attempt in range(WorkbenchDjangoKeyValueStore.MAX_WRITE_ATTEMPTS):
+                    batch_changed, conflicting = self.reencode(model, batch, codec)
+                    changed += batch_changed
+                    if not conflicting:
+                        break
+                    batch = list(model.objects.filter(pk__in=conflicting).only('pk', 'version', 'state'))
+                else:
+                    skipped += len(conflicting)
+
+        self.stdout.write(f"Re-encoded {changed} of {seen} rows with the {codec.name!r} codec.")
+        if skipped:
+            self.stdout.write(f"{skipped} rows kept being changed concurrently and were left as they were.")
+
+    @staticmethod
+    def reencode(model, records, codec):
+        """
+        Re-encode `records`, rows of `model`, with `codec`, in one transaction. Each row is only
+        updated if its version is still the one it was read with, and gets a
+        new version, so that caches of its state notice the change. Return
+        the number of rows updated and the ids of the rows that changed since
+        they were read.
+        """
+        changed = 0
+        conflicting = []
+        with transaction.atomic():
+            for record in records:
+                encoded = encode_state(decode_state(record.state), codec)
+                if encoded == record.state:
+                    continue
+                if model.objects.filter(pk=record.pk, version=record.version).update(
+                    state=encoded, version=F('version') + 1,
+                ):
+                    changed += 1
+                else:
+                    conflicting.append(record.pk)
+        return changed, conflicting
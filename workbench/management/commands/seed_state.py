@@ -0,0 +1,161 @@
+"""
+Fill the database with the XBlock state of synthetic students, for load tests.
+
+Every block of every scenario gets a row of user_state for each student,
+with a plausible value for each of its user_state fields, based on the
+field's type and default: random numbers and booleans, and the defaults of
+the other fields. Rows are inserted with ``bulk_create``, a batch per
+transaction, and rows that already exist are kept::
+
+    python manage.py seed_state --students 10000 --batch-size 5000
+    python manage.py seed_state --students 100000 --processes 8
+
+``--processes`` splits the students between worker processes. They only
+write in parallel on databases with concurrent writers; with SQLite they
+still share the work of generating and encoding the rows. The rows are
+written as blobs: with ``WORKBENCH['field_storage']`` set, run
+``migrate_field_storage`` afterwards.
+"""
+
+
+import random
+import string
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from xblock.fields import Boolean, Float, Integer, Scope, String
+from xblock.runtime import KeyValueStore
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from workbench.models import XBlockState
+from workbench.scenarios import parse_scenarios
+from workbench.state_codec import encode_state, get_codec
+
+
+def _field_kind(field):
+    """Return the kind of value to generate for `field`."""
+    for kind, field_class in (('boolean', Boolean), ('integer', Integer), ('float', Float), ('string', String)):
+        if isinstance(field, field_class):
+            return kind
+    return 'other'
+
+
+def _plausible_value(rand, kind, default):
+    """Return a value of `kind` for a field whose JSON default is `default`, using the random `rand`."""
+    if kind == 'boolean':
+        return rand.random() < 0.5
+    if kind == 'integer':
+        return rand.randrange(2 * abs(default) + 10 if isinstance(default, int) else 10)
+    if kind == 'float':
+        return round(rand.uniform(0, 2 * abs(default) + 1 if isinstance(default, (int, float)) else 1), 3)
+    if kind == 'string' and not default:
+        return "".join(rand.choices(string.ascii_lowercase, k=rand.randrange(3, 12)))
+    return default
+
+
+def _seed_students(templates, students, batch_size, codec_name, seed):
+    """
+    Insert the rows of `students` for every block in `templates`, `batch_size`
+    rows per transaction, and return the number of rows written.
+
+    `templates` holds the (column values, [(field name, kind, JSON default)])
+    of each block, so that this can run in a worker process.
+    """
+    codec = get_codec(codec_name)
+    written = 0
+    batch = []
+
+    def insert():
+        with transaction.atomic():
+            XBlockState.objects.bulk_create(batch, ignore_conflicts=True)
+        return len(batch)
+
+    for student in students:
+        rand = random.Random(f"{seed}.{student}")
+        for columns, fields in templates:
+            state = {name: _plausible_value(rand, kind, default) for name, kind, default in fields}
+            batch.append(XBlockState(user_id=student, state=encode_state(state, codec), **columns))
+            if len(batch) >= batch_size:
+                written += insert()
+                batch = []
+    if batch:
+        written += insert()
+    return written
+
+
+def _setup_worker():
+    """Set Django up in a worker process, with connections of its own."""
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    """Insert plausible user_state rows for synthetic students in every scenario."""
+    help = "Seed the database with the XBlock user state of synthetic students, for load tests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000, help="Number of students to create state for.")
+        parser.add_argument('--prefix', default='seed-student-', help="Prefix of the synthetic student ids.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Number of rows to insert per transaction.")
+        parser.add_argument('--processes', type=int, default=1, help="Number of worker processes.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the generated values.")
+
+    def handle(self, *args, **options):
+        templates = self.block_templates()
+        if not templates:
+            raise CommandError("No scenario has a block with user_state fields.")
+        students = [f"{options['prefix']}{number}" for number in range(options['students'])]
+        codec_name = get_codec().name
+
+        start = time.perf_counter()
+        if options['processes'] > 1:
+            chunks = [students[number::options['processes']] for number in range(options['processes'])]
+            # Forked workers must not share the parent's connections.
+            connections.close_all()
+            with ProcessPoolExecutor(options['processes'], initializer=_setup_worker) as pool:
+                futures = [
+                    pool.submit(_seed_students, templates, chunk, options['batch_size'], codec_name, options['seed'])
+                    for chunk in chunks if chunk
+                ]
+                written = sum(future.result() for future in futures)
+        else:
+            written = _seed_students(templates, students, options['batch_size'], codec_name, options['seed'])
+        elapsed = time.perf_counter() - start
+
+        XBlockState.user_ids_changed()
+        self.stdout.write(
+            f"Seeded {written} rows for {len(students)} students in {elapsed:.2f}s, "
+            f"{written / elapsed if elapsed else 0:.0f} rows/s."
+        )
+
+    @staticmethod
+    def block_templates():
+        """
+        Return the (column values, [(field name, kind, JSON default)]) of
+        every block with user_state fields in the scenarios, parsed by
+        `parse_scenarios` without touching the stored state.
+        """
+        runtime, scenarios = parse_scenarios()
+        templates = []
+        for scenario in scenarios.values():
+            pending = [scenario.usage_id]
+            while pending:
+                usage_id = pending.pop(0)
+                block = runtime.get_block(usage_id)
+                pending.extend(getattr(block, 'children', []))
+                fields = [
+                    (name, _field_kind(field), field.to_json(field.default))
+                    for name, field in sorted(block.fields.items())
+                    if field.scope == Scope.user_state
+                ]
+                if not fields:
+                    continue
+                columns = XBlockState.key_fields(
+                    KeyValueStore.Key(scope=Scope.user_state, user_id=None, block_scope_id=usage_id, field_name=None)
+                )
+                del columns['user_id']
+                templates.append((columns, fields))
+        return templates
@@ -0,0 +1,62 @@
+"""
+Stream the XBlock state change log as JSON Lines.
+
+With ``settings.WORKBENCH['change_log']`` on, every change the key-value
+store makes is recorded as an `XBlockStateChange` with an increasing `seq`.
+This command writes the changes after ``--since`` one per line, so a consumer
+can remember the last `seq` it saw and carry on from there. ``--follow`` keeps
+polling for new changes, and ``--prune-through`` deletes the changes that every
+consumer has seen::
+
+    python manage.py state_changes --since 1041 --follow
+    python manage.py state_changes --prune-through 1041
+
+With several database connections writing at once, a change can commit after
+one with a higher `seq`, so a consumer following closely may miss it. SQLite
+only has one writer at a time, so this can't happen there.
+"""
+
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from workbench.models import XBlockStateChange
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+class Command(BaseCommand):
+    """Write the `XBlockStateChange` rows after a sequence number as JSON Lines."""
+    help = "Stream the XBlock state change log as JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=int, default=0, help="Only write the changes after this seq.")
+        parser.add_argument('--follow', action='store_true', help="Keep writing new changes as they are made.")
+        parser.add_argument(
+            '--interval', type=float, default=1.0, help="Seconds between polls for new changes, with --follow.",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of changes to read at a time.")
+        parser.add_argument(
+            '--prune-through', type=int, metavar='SEQ',
+            help="Delete the changes up to and including this seq, instead of writing any.",
+        )
+
+    def handle(self, *args, **options):
+        if options['prune_through'] is not None:
+            deleted, _ = XBlockStateChange.objects.filter(seq__lte=options['prune_through']).delete()
+            self.stderr.write(f"Pruned {deleted} changes.")
+            return
+
+        seq = options['since']
+        while True:
+            for change in XBlockStateChange.since(seq, options['batch_size']):
+                self.stdout.write(json.dumps(change.as_dict(), separators=(',', ':'), sort_keys=True))
+                seq = change.seq
+            if not options['follow']:
+                break
+            self.stdout.flush()
+            time.sleep(options['interval'])
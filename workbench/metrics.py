@@ -0,0 +1,194 @@
+"""
+A lightweight in-process registry of metrics about the workbench.
+
+Metrics are counters and histograms, each with any number of label values::
+
+    OPERATIONS = REGISTRY.counter('workbench_kvs_operations_total', "KVS operations.")
+    OPERATIONS.inc(store='WorkbenchDjangoKeyValueStore', op='get')
+
+The registry can be read as a dict (`MetricsRegistry.as_dict`) or in the
+Prometheus text format (`MetricsRegistry.as_prometheus_text`), which the
+``/metrics/`` view serves. Values are kept per process and reset on restart.
+"""
+
+
+import bisect
+import threading
+
+# Upper bounds in seconds of the histogram buckets, suited to storage calls.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _labels_key(labels):
+    """Return a hashable, ordered version of the `labels` dict."""
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels_key, extra=()):
+    """Format label pairs in the Prometheus text format."""
+    pairs = list(labels_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    """A count that only goes up, per combination of label values."""
+    kind = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        """Add `amount` to the count with the given `labels`."""
+        key = _labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Return the count with the given `labels`."""
+        return self._values.get(_labels_key(labels), 0)
+
+    def samples(self):
+        """Return the (labels dict, value) pairs of this counter."""
+        with self._lock:
+            return [(dict(key), value) for key, value in self._values.items()]
+
+    def prometheus_lines(self):
+        """Return the lines of this counter in the Prometheus text format."""
+        with self._lock:
+            return [f"{self.name}{_format_labels(key)} {value}" for key, value in sorted(self._values.items())]
+
+    def reset(self):
+        """Forget all the values."""
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """The distribution of observed values, in cumulative buckets, per combination of label values."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, value, **labels):
+        """Record one observation of `value` with the given `labels`."""
+        key = _labels_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = {'buckets': [0] * (len(self.buckets) + 1), 'count': 0, 'sum': 0.0}
+            counts['buckets'][index] += 1
+            counts['count'] += 1
+            counts['sum'] += value
+
+    def samples(self):
+        """Return the (labels dict, {'count', 'sum', 'buckets'}) pairs of this histogram."""
+        with self._lock:
+            return [
+                (dict(key), {
+                    'count': counts['count'],
+                    'sum': counts['sum'],
+                    'buckets': dict(zip([*map(str, self.buckets), '+Inf'], self._cumulative(counts))),
+                })
+                for key, counts in self._values.items()
+            ]
+
+    def prometheus_lines(self):
+        """Return the lines of this histogram in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            for key, counts in sorted(self._values.items()):
+                for bound, count in zip([*map(str, self.buckets), '+Inf'], self._cumulative(counts)):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {counts['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {counts['count']}")
+        return lines
+
+    @staticmethod
+    def _cumulative(counts):
+        """Return the cumulative bucket counts of `counts`."""
+        total = 0
+        cumulative = []
+        for count in counts['buckets']:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def reset(self):
+        """Forget all the observations."""
+        with self._lock:
+            self._values.clear()
+
+
+class MetricsRegistry:
+    """The metrics of this process, by name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, cls, name, *args):
+        """Return the metric called `name`, creating it with `cls(name, *args)` if needed."""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name!r} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation):
+        """Return the counter called `name`."""
+        return self._register(Counter, name, documentation)
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        """Return the histogram called `name`."""
+        return self._register(Histogram, name, documentation, buckets)
+
+    def as_dict(self):
+        """Return all the metrics as a dict that can be serialized as JSON."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return {
+            metric.name: {
+                'type': metric.kind,
+                'help': metric.documentation,
+                'samples': [{'labels': labels, 'value': value} for labels, value in metric.samples()],
+            }
+            for metric in metrics
+        }
+
+    def as_prometheus_text(self):
+        """Return all the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.prometheus_lines())
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Reset every metric to zero."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+
+REGISTRY = MetricsRegistry()
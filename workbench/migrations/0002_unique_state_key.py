@@ -0,0 +1,60 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:11
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_rows(apps, schema_editor):
+    """
+    Merge rows sharing a (scope, scope_id, user_id) into the oldest of them.
+
+    Fields are merged in id order, so the value from the most recently created
+    duplicate wins.
+    """
+    from workbench.state_codec import decode_state, encode_state  # pylint: disable=import-outside-toplevel
+
+    XBlockState = apps.get_model('workbench', 'XBlockState')
+    duplicates = (
+        XBlockState.objects.order_by()
+        .values('scope', 'scope_id', 'user_id')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in list(duplicates):
+        records = list(XBlockState.objects.filter(
+            scope=duplicate['scope'],
+            scope_id=duplicate['scope_id'],
+            user_id=duplicate['user_id'],
+        ).order_by('id'))
+
+        state = {}
+        for record in records:
+            state.update(decode_state(record.state))
+
+        keeper = records[0]
+        keeper.state = encode_state(state)
+        keeper.save(update_fields=['state'])
+        XBlockState.objects.filter(id__in=[record.id for record in records[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='xblockstate',
+            constraint=models.UniqueConstraint(fields=('scope_id', 'scope', 'user_id'), name='workbench_xblockstate_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='xblockstate',
+            constraint=models.UniqueConstraint(condition=models.Q(('user_id__isnull', True)), fields=('scope_id', 'scope'), name='workbench_xblockstate_shared_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='xblockstate',
+            constraint=models.UniqueConstraint(condition=models.Q(('scope_id__isnull', True)), fields=('scope', 'user_id'), name='workbench_xblockstate_user_key'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0002_unique_state_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='xblockstate',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:32
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0003_xblockstate_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='xblockstate',
+            name='touched',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
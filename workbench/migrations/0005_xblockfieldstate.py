@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:39
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0004_xblockstate_touched'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='XBlockFieldState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(blank=True, choices=[('usage', 'usage'), ('definition', 'definition'), ('type', 'type'), ('all', 'all'), ('parent', 'parent'), ('children', 'children')], db_index=True, max_length=50, null=True)),
+                ('scope_id', models.CharField(blank=True, db_index=True, max_length=255, null=True, verbose_name='Scope ID')),
+                ('user_id', models.CharField(blank=True, db_index=True, max_length=255, null=True, verbose_name='User ID')),
+                ('scenario', models.CharField(blank=True, db_index=True, max_length=255, null=True)),
+                ('tag', models.CharField(blank=True, db_index=True, max_length=50, null=True)),
+                ('field_name', models.CharField(max_length=255)),
+                ('state', models.TextField(default='{}')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('touched', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'XBlock Field State',
+                'verbose_name_plural': 'XBlock Field State',
+                'ordering': ['scope_id', 'scope', 'user_id', 'field_name'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='xblockfieldstate',
+            constraint=models.UniqueConstraint(fields=('scope_id', 'scope', 'user_id', 'field_name'), name='workbench_xblockfieldstate_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='xblockfieldstate',
+            constraint=models.UniqueConstraint(condition=models.Q(('user_id__isnull', True)), fields=('scope_id', 'scope', 'field_name'), name='workbench_xblockfieldstate_shared_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='xblockfieldstate',
+            constraint=models.UniqueConstraint(condition=models.Q(('scope_id__isnull', True)), fields=('scope', 'user_id', 'field_name'), name='workbench_xblockfieldstate_user_key'),
+        ),
+    ]
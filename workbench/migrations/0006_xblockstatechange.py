@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:47
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0005_xblockfieldstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='XBlockStateChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('operation', models.CharField(choices=[('set', 'set'), ('delete', 'delete'), ('clear', 'clear')], max_length=10)),
+                ('scope', models.CharField(blank=True, max_length=50, null=True)),
+                ('scope_id', models.CharField(blank=True, max_length=255, null=True, verbose_name='Scope ID')),
+                ('user_id', models.CharField(blank=True, max_length=255, null=True, verbose_name='User ID')),
+                ('scenario', models.CharField(blank=True, max_length=255, null=True)),
+                ('field_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('value', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'XBlock State Change',
+                'verbose_name_plural': 'XBlock State Changes',
+                'ordering': ['seq'],
+            },
+        ),
+    ]
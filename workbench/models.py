@@ -9,12 +9,44 @@ Admin gives us a lot of basic search/filtering for free.
 """
 
 
+import hashlib
+import json
+
 from xblock.fields import BlockScope, Scope
 
-from django.db import models
+from django.core.cache import cache
+from django.db import connection, models
 from django.utils.timezone import now
 
 
+def startswith_q(field_name, prefix):
+    """
+    Return a case-sensitive filter on `field_name` starting with `prefix`.
+
+    The range lets an index on the field narrow the rows down, which LIKE
+    can't do on SQLite.
+    """
+    return models.Q(**{
+        f"{field_name}__gte": prefix,
+        f"{field_name}__lt": prefix + chr(0x10FFFF),
+        f"{field_name}__startswith": prefix,
+    })
+
+
+def raw_delete(model, where=None, params=()):
+    """
+    Run ``DELETE FROM`` the table of `model`, with an optional SQL `where`
+    clause, and drop the cached user ids, which rows of either state model
+    provide.
+    """
+    sql = f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)}"
+    if where:
+        sql += f" WHERE {where}"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+    XBlockState.user_ids_changed()
+
+
 def shorten_scope_name(scope_name):
     """
     Strip the "blockscope_" or "scope_" prefixes from scope names.
@@ -34,6 +66,25 @@ class XBlockState(models.Model):
         verbose_name = "XBlock State"
         verbose_name_plural = "XBlock State"
         ordering = ['scope_id', 'scope', 'user_id']
+        # There is one row per (scope, scope_id, user_id). NULLs never compare
+        # equal in a unique index, so the rows where scope_id or user_id is
+        # NULL get partial constraints of their own.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['scope_id', 'scope', 'user_id'],
+                name='workbench_xblockstate_key',
+            ),
+            models.UniqueConstraint(
+                fields=['scope_id', 'scope'],
+                condition=models.Q(user_id__isnull=True),
+                name='workbench_xblockstate_shared_key',
+            ),
+            models.UniqueConstraint(
+                fields=['scope', 'user_id'],
+                condition=models.Q(scope_id__isnull=True),
+                name='workbench_xblockstate_user_key',
+            ),
+        ]
 
     BLOCK_SCOPE_NAMES = [
         (shorten_scope_name(sentinel.attr_name), shorten_scope_name(sentinel.attr_name))
@@ -76,6 +127,15 @@ class XBlockState(models.Model):
     )
     created = models.DateTimeField(default=now, db_index=True)
     state = models.TextField(default="{}")
+    # Incremented on every write, for optimistic concurrency control.
+    version = models.PositiveIntegerField(default=1)
+    # When the row was last written, to expire the state of inactive users.
+    touched = models.DateTimeField(default=now, db_index=True)
+
+    # The cached pages of `user_ids` have this version in their cache keys,
+    # so that bumping it drops all of them at once.
+    USER_IDS_VERSION_KEY = 'workbench.user_ids.version'
+    USER_IDS_CACHE_TIMEOUT = 300
 
     # pylint: disable=missing-format-attribute
     def __repr__(self):
@@ -87,9 +147,9 @@ class XBlockState(models.Model):
             "tag={xb_state.tag}>".format(xb_state=self)
 
     @classmethod
-    def get_for_key(cls, key):
+    def key_fields(cls, key):
         """
-        Get or create the model row for a given `KeyValueStore.Key` `key`.
+        Return the column values identifying the row for `KeyValueStore.Key` `key`.
         """
         if key.scope in [Scope.parent, Scope.children]:
             block_scope_full_name = key.scope.attr_name
@@ -114,14 +174,91 @@ class XBlockState(models.Model):
         else:
             scenario, tag, _ = scope_id.split(".", 2)
 
-        record, _ = cls.objects.get_or_create(
-            scope=block_scope_name,
-            scope_id=key.block_scope_id,
-            user_id=key.user_id,
-            scenario=scenario,
-            tag=tag,
-        )
-        return record
+        return {
+            'scope': block_scope_name,
+            'scope_id': scope_id,
+            'user_id': key.user_id,
+            'scenario': scenario,
+            'tag': tag,
+        }
+
+    @classmethod
+    def find_for_key(cls, key):
+        """
+        Get the model row for a given `KeyValueStore.Key` `key`, or None.
+
+        This never creates a row, so it is safe to use on read-only paths.
+        """
+        fields = cls.key_fields(key)
+        return cls.objects.filter(
+            scope=fields['scope'],
+            scope_id=fields['scope_id'],
+            user_id=fields['user_id'],
+        ).first()
+
+    @classmethod
+    def delete_all(cls):
+        """
+        Delete every row with a single ``DELETE`` statement.
+
+        This skips the deletion collector (and so any signals), which would
+        otherwise select all the rows before deleting them in batches.
+        """
+        cls._raw_delete()
+
+    @classmethod
+    def delete_scenario(cls, scenario):
+        """
+        Delete all the rows of the scenario with the slug `scenario`, with a
+        single ``DELETE`` statement that uses the index on the `scenario` column.
+        """
+        cls._raw_delete("scenario = %s", [scenario])
+
+    @classmethod
+    def _raw_delete(cls, where=None, params=()):
+        """Run ``DELETE FROM`` this model's table, with an optional SQL `where` clause."""
+        raw_delete(cls, where, params)
+
+    @classmethod
+    def user_ids(cls, after=None, prefix=None, limit=None):
+        """
+        Return the sorted ids of the users with state, after the id `after`
+        and starting with `prefix`, at most `limit` of them. State kept in
+        `XBlockFieldState` counts too.
+
+        This is a ``UNION`` of queries that walk the indexes on `user_id`.
+        Pages are cached until `user_ids_changed` is called.
+        """
+        version = cache.get_or_set(cls.USER_IDS_VERSION_KEY, 1, None)
+        params = hashlib.sha1(json.dumps([after, prefix, limit]).encode("utf-8")).hexdigest()
+        cache_key = f"workbench.user_ids.{version}.{params}"
+        user_ids = cache.get(cache_key)
+        if user_ids is None:
+            wanted = models.Q(user_id__isnull=False)
+            if after is not None:
+                wanted &= models.Q(user_id__gt=after)
+            if prefix:
+                wanted &= startswith_q('user_id', prefix)
+            query = cls.objects.filter(wanted).order_by().values_list('user_id', flat=True).union(
+                XBlockFieldState.objects.filter(wanted).order_by().values_list('user_id', flat=True)
+            ).order_by('user_id')
+            if limit is not None:
+                query = query[:limit]
+            user_ids = list(query)
+            cache.set(cache_key, user_ids, cls.USER_IDS_CACHE_TIMEOUT)
+        return user_ids
+
+    @classmethod
+    def user_ids_changed(cls):
+        """
+        Drop the cached pages of `user_ids`, after rows of new users were
+        inserted or rows were deleted.
+        """
+        try:
+            cache.incr(cls.USER_IDS_VERSION_KEY)
+        except ValueError:
+            # Nothing is cached.
+            pass
 
     @classmethod
     def prep_for_scenario_loading(cls):
@@ -139,3 +276,190 @@ class XBlockState(models.Model):
 
     def __str__(self):
         return self.__repr__()
+
+
+class XBlockFieldState(models.Model):
+    """State storage for single fields.
+
+    `workbench.runtime.NormalizedFieldKeyValueStore` keeps the fields it is
+    configured for here, a row per field, instead of in the `XBlockState` blob
+    of their (scope, scope_id, user_id). Each row's `state` is a state blob
+    holding just its field, so it is encoded like any other.
+    """
+    class Meta:
+        """Class metadata"""
+        verbose_name = "XBlock Field State"
+        verbose_name_plural = "XBlock Field State"
+        ordering = ['scope_id', 'scope', 'user_id', 'field_name']
+        # As for XBlockState, with the field name added.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['scope_id', 'scope', 'user_id', 'field_name'],
+                name='workbench_xblockfieldstate_key',
+            ),
+            models.UniqueConstraint(
+                fields=['scope_id', 'scope', 'field_name'],
+                condition=models.Q(user_id__isnull=True),
+                name='workbench_xblockfieldstate_shared_key',
+            ),
+            models.UniqueConstraint(
+                fields=['scope', 'user_id', 'field_name'],
+                condition=models.Q(scope_id__isnull=True),
+                name='workbench_xblockfieldstate_user_key',
+            ),
+        ]
+
+    scope = models.CharField(
+        max_length=50,
+        blank=True,
+        null=True,
+        db_index=True,
+        choices=XBlockState.BLOCK_SCOPE_NAMES
+    )
+    scope_id = models.CharField(
+        max_length=255,
+        blank=True,
+        null=True,
+        db_index=True,
+        verbose_name="Scope ID",
+    )
+    user_id = models.CharField(
+        max_length=255,
+        blank=True,
+        null=True,
+        db_index=True,
+        verbose_name="User ID",
+    )
+    scenario = models.CharField(
+        max_length=255,
+        blank=True,
+        null=True,
+        db_index=True,
+    )
+    tag = models.CharField(
+        max_length=50,
+        blank=True,
+        null=True,
+        db_index=True,
+    )
+    field_name = models.CharField(max_length=255)
+    state = models.TextField(default="{}")
+    # Incremented on every write, for optimistic concurrency control.
+    version = models.PositiveIntegerField(default=1)
+    # When the row was last written, to expire the state of inactive users.
+    touched = models.DateTimeField(default=now, db_index=True)
+
+    # pylint: disable=missing-format-attribute
+    def __repr__(self):
+        return "<XBlockFieldState id={xb_state.id} " \
+            "scope={xb_state.scope} " \
+            "scope_id={xb_state.scope_id} " \
+            "user_id={xb_state.user_id} " \
+            "field_name={xb_state.field_name}>".format(xb_state=self)
+
+    @classmethod
+    def key_fields(cls, key):
+        """
+        Return the column values identifying the row for `KeyValueStore.Key` `key`.
+        """
+        return dict(XBlockState.key_fields(key), field_name=key.field_name)
+
+    @classmethod
+    def delete_all(cls):
+        """Delete every row with a single ``DELETE`` statement, like `XBlockState.delete_all`."""
+        raw_delete(cls)
+
+    @classmethod
+    def delete_scenario(cls, scenario):
+        """Delete all the rows of the scenario with the slug `scenario` with a single ``DELETE`` statement."""
+        raw_delete(cls, "scenario = %s", [scenario])
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class XBlockStateChange(models.Model):
+    """A change to XBlock state, in the append-only change log.
+
+    With ``settings.WORKBENCH['change_log']`` on, the Django model backed
+    key-value stores add a row for every field they set or delete, in the
+    transaction that writes it, and one for every clear of all state or of a
+    scenario. `seq` only goes up, so consumers can read the changes after the
+    last one they saw with `since`.
+    """
+    class Meta:
+        """Class metadata"""
+        verbose_name = "XBlock State Change"
+        verbose_name_plural = "XBlock State Changes"
+        ordering = ['seq']
+
+    SET = 'set'
+    DELETE = 'delete'
+    CLEAR = 'clear'
+    OPERATIONS = [(SET, SET), (DELETE, DELETE), (CLEAR, CLEAR)]
+
+    seq = models.BigAutoField(primary_key=True)
+    created = models.DateTimeField(default=now)
+    operation = models.CharField(max_length=10, choices=OPERATIONS)
+    scope = models.CharField(max_length=50, blank=True, null=True)
+    scope_id = models.CharField(max_length=255, blank=True, null=True, verbose_name="Scope ID")
+    user_id = models.CharField(max_length=255, blank=True, null=True, verbose_name="User ID")
+    # The scenario cleared, or None for all of them.
+    scenario = models.CharField(max_length=255, blank=True, null=True)
+    field_name = models.CharField(max_length=255, blank=True, null=True)
+    # The JSON of the value set, None for the other operations.
+    value = models.TextField(blank=True, null=True)
+
+    def __repr__(self):
+        return "<XBlockStateChange seq={change.seq} " \
+            "operation={change.operation} " \
+            "scope={change.scope} " \
+            "scope_id={change.scope_id} " \
+            "user_id={change.user_id} " \
+            "field_name={change.field_name}>".format(change=self)
+
+    @classmethod
+    def for_field(cls, record, field_name, value, deleted=False):
+        """
+        Return an unsaved change setting `field_name` of the `XBlockState` or
+        `XBlockFieldState` `record` to `value`, or deleting it if `deleted`.
+        """
+        return cls(
+            operation=cls.DELETE if deleted else cls.SET,
+            scope=record.scope,
+            scope_id=record.scope_id,
+            user_id=record.user_id,
+            scenario=record.scenario,
+            field_name=field_name,
+            value=None if deleted else json.dumps(value, separators=(',', ':')),
+        )
+
+    @classmethod
+    def since(cls, seq=0, batch_size=1000):
+        """
+        Yield the changes after the one numbered `seq`, in order, reading
+        `batch_size` of them at a time.
+        """
+        while True:
+            batch = list(cls.objects.filter(seq__gt=seq).order_by('seq')[:batch_size])
+            if not batch:
+                return
+            yield from batch
+            seq = batch[-1].seq
+
+    def as_dict(self):
+        """Return this change as a dict that can be serialized as JSON."""
+        return {
+            'seq': self.seq,
+            'created': self.created.isoformat(),
+            'operation': self.operation,
+            'scope': self.scope,
+            'scope_id': self.scope_id,
+            'user_id': self.user_id,
+            'scenario': self.scenario,
+            'field_name': self.field_name,
+            'value': None if self.value is None else json.loads(self.value),
+        }
+
+    def __str__(self):
+        return self.__repr__()
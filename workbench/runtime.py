@@ -5,10 +5,19 @@ Code in this file is a mix of Runtime layer and Workbench layer.
 """
 
 
+import atexit
+import copy
+import functools
 import importlib
 import itertools
 import logging
-from collections import defaultdict
+import operator
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from unittest.mock import Mock
 
@@ -16,28 +25,335 @@ from web_fragments.fragment import Fragment
 from xblock.core import XBlockAside
 from xblock.exceptions import NoSuchDefinition, NoSuchUsage
 from xblock.reference.user_service import UserService, XBlockUser
-from xblock.runtime import IdGenerator, IdReader, KeyValueStore, KvsFieldData, NoSuchViewError, NullI18nService, Runtime
+from xblock.runtime import IdGenerator, IdReader, KvsFieldData, NoSuchViewError, NullI18nService, Runtime
 
 import django.utils.translation
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
 from django.template import loader as django_template_loader
 from django.templatetags.static import static
 from django.urls import reverse
+from django.utils.timezone import now
 
-from .models import XBlockState
+from .kvs import BYTES_READ, BYTES_WRITTEN, DEFAULT_BACKEND, WorkbenchKeyValueStore, load_kvs
+from .metrics import REGISTRY
+from .models import XBlockFieldState, XBlockState, XBlockStateChange
+from .state_codec import decode_state, encode_state
 from .util import make_safe_for_html
 
-try:
-    import simplejson as json
-except ImportError:
-    import json
-
 log = logging.getLogger(__name__)
 User = get_user_model()
 
 
-class WorkbenchDjangoKeyValueStore(KeyValueStore):
+CONFLICTS = REGISTRY.counter(
+    'workbench_kvs_conflicts_total', "Saves of XBlock state retried because of concurrent changes.",
+)
+SHARED_CACHE_HITS = REGISTRY.counter('workbench_kvs_shared_cache_hits_total', "Shared rows read from the cache.")
+SHARED_CACHE_MISSES = REGISTRY.counter('workbench_kvs_shared_cache_misses_total', "Shared rows not in the cache.")
+
+
+class StateConflictError(Exception):
+    """Raised when XBlock state keeps being changed by others while we try to save it."""
+
+
+def _back_off_after_conflict(row_key, attempt, backoff):
+    """
+    Count a failed optimistic write to the row `row_key`, and sleep for a
+    random time of up to `backoff` seconds, doubled for each of the `attempt`
+    earlier failures, before retrying.
+    """
+    CONFLICTS.inc()
+    log.info("Concurrent change to XBlock state %r, retrying", row_key)
+    time.sleep(random.uniform(0, backoff * 2 ** attempt))
+
+
+# Marks a field deleted in a unit of work's pending changes.
+_DELETED = object()
+
+
+class _UnitOfWork:
+    """The rows a `WorkbenchDjangoKeyValueStore` has loaded and changed.
+
+    Rows are keyed by their (scope, scope_id, user_id) triple. Each row is
+    read from the database at most once, and its decoded state dict is kept in
+    memory. The fields changed in each row are remembered so that all changed
+    rows can be saved together when the unit of work is flushed, and so that
+    the changes can be re-applied if a row turns out to have been changed by
+    someone else in the meantime. Rows that don't exist yet are represented by
+    unsaved records, and only inserted once written to. Once all the rows of a
+    scenario and user have been prefetched, rows of theirs that weren't found
+    are known not to exist without asking the database.
+    """
+    def __init__(self):
+        self.records = {}
+        self.states = {}
+        self.changes = defaultdict(dict)
+        # The (scenario, user_id) pairs whose rows have all been loaded, so
+        # that their other rows are known not to exist.
+        self.prefetched = set()
+
+    def set(self, row_key, field_name, value):
+        """Record that `field_name` of the row `row_key` was set to `value`."""
+        self.states[row_key][field_name] = value
+        self.changes[row_key][field_name] = value
+
+    def delete(self, row_key, field_name):
+        """Record that `field_name` of the row `row_key` was deleted."""
+        del self.states[row_key][field_name]
+        self.changes[row_key][field_name] = _DELETED
+
+    def apply(self, row_key, changes):
+        """Record all the field `changes` to the row `row_key`, as made by `set` and `delete`."""
+        _apply_changes(self.states[row_key], changes)
+        self.changes[row_key].update(changes)
+
+
+class _FieldUnitOfWork:
+    """The field rows a `NormalizedFieldKeyValueStore` has loaded and changed.
+
+    Field rows are keyed by their (scope, scope_id, user_id, field_name)
+    lookup. Each is read from the database at most once, and its value, or
+    `_DELETED` when it has none, is kept in memory. The keys of the fields set
+    or deleted are remembered so that they can be written together when the
+    unit of work is flushed. As in `_UnitOfWork`, field rows of prefetched
+    scenarios and users that weren't found are known not to exist.
+    """
+    def __init__(self):
+        self.values = {}
+        self.changed = {}
+        self.prefetched = set()
+
+    def set(self, field_key, key, value):
+        """Record that the field `field_key` of the `KeyValueStore.Key` `key` was set to `value`, or deleted."""
+        self.values[field_key] = value
+        self.changed[field_key] = key
+
+
+def _apply_changes(state_dict, changes):
+    """Apply the changed fields in `changes` to the decoded state `state_dict`."""
+    for field_name, value in changes.items():
+        if value is _DELETED:
+            state_dict.pop(field_name, None)
+        else:
+            state_dict[field_name] = value
+
+
+class _WriteBehindBuffer:
+    """The changes a write-behind `WorkbenchDjangoKeyValueStore` hasn't saved yet.
+
+    Changes are coalesced per row: each row keeps the key fields needed to
+    create it and the latest value of every changed field. A flush takes all
+    the pending rows at once; until they are saved they stay visible as
+    "flushing", so that readers never miss a change in between.
+
+    Each call to `saved` starts a new `generation`. Readers note the
+    generation before reading rows from the database, and `apply_many`
+    refuses to apply changes to rows read in an older generation: those rows
+    may have been read before the changes were saved, and must be read again.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flushing = {}
+        self.generation = 0
+
+    def add(self, row_key, key_fields, changes):
+        """Add the field `changes` to the row `row_key`, described by the column values `key_fields`."""
+        with self._lock:
+            _fields, pending_changes = self._pending.setdefault(row_key, (key_fields, {}))
+            pending_changes.update(changes)
+
+    def is_empty(self):
+        """Return whether there are no changes waiting to be saved."""
+        with self._lock:
+            return not self._pending
+
+    def has(self, row_key):
+        """Return whether the row `row_key` has changes that aren't saved yet."""
+        with self._lock:
+            return row_key in self._pending or row_key in self._flushing
+
+    def apply_many(self, states, generation):
+        """
+        Apply the unsaved changes of each row to its decoded state in
+        `states`, a dict keyed by row key, if those rows were read from the
+        database in the current `generation`. Return whether they were.
+        """
+        with self._lock:
+            if generation != self.generation:
+                return False
+            for row_key, state_dict in states.items():
+                for rows in (self._flushing, self._pending):
+                    if row_key in rows:
+                        _apply_changes(state_dict, rows[row_key][1])
+            return True
+
+    def take(self):
+        """Return all the pending rows, which are flushing until passed to `saved` or `failed`."""
+        with self._lock:
+            self._flushing, self._pending = self._pending, {}
+            return dict(self._flushing)
+
+    def saved(self, row_keys):
+        """Forget the flushing rows `row_keys`, which are now saved, starting a new generation."""
+        with self._lock:
+            for row_key in row_keys:
+                self._flushing.pop(row_key, None)
+            self.generation += 1
+
+    def failed(self):
+        """Make the rows that are still flushing pending again, under any newer changes."""
+        with self._lock:
+            for row_key, (key_fields, changes) in self._flushing.items():
+                _fields, newer_changes = self._pending.get(row_key, (key_fields, {}))
+                self._pending[row_key] = (key_fields, {**changes, **newer_changes})
+            self._flushing = {}
+
+    def discard(self, row_filter=None):
+        """Drop the unsaved changes of the rows whose key `row_filter` accepts, or of all rows."""
+        with self._lock:
+            for rows in (self._flushing, self._pending):
+                for row_key in [row_key for row_key in rows if row_filter is None or row_filter(row_key)]:
+                    del rows[row_key]
+
+
+class _RowLocks:
+    """A lock per row key, kept only while a thread holds or waits for it."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, row_key):
+        """Hold the lock of the row `row_key` for the duration of the block."""
+        with self._lock:
+            entry = self._locks.setdefault(row_key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[row_key]
+
+
+class _KnownUsers:
+    """A bounded, least recently used set of the users a store has inserted rows for.
+
+    A user's first insert drops the cached pages of `XBlockState.user_ids`.
+    Users that were forgotten just drop them again on their next insert.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    def add(self, user_id):
+        """Remember `user_id`, and return whether it wasn't known."""
+        with self._lock:
+            known = user_id in self._users
+            self._users[user_id] = None
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_entries:
+                self._users.popitem(last=False)
+        return not known
+
+    def clear(self):
+        """Forget every user."""
+        with self._lock:
+            self._users.clear()
+
+
+class _SharedStateCache:
+    """A bounded, least recently used cache of the decoded state of shared rows.
+
+    Entries are keyed by row key and hold the row's id, version, scenario and
+    tag along with a private copy of its decoded state, so that a cached row
+    can be used without reading it from the database. Callers get their own
+    copy of the state, which they are free to change.
+
+    Every invalidation bumps `generation`. Readers note it before reading rows
+    from the database, and a row is only cached if it wasn't invalidated since,
+    as it may have been read before the write that invalidated it. The last
+    `max_entries` invalidated rows are remembered; rows read before the
+    invalidations that were forgotten aren't cached at all. An entry never
+    replaces one of a newer version of the row either.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # The generation of the last invalidation of each recently invalidated row.
+        self._invalidated = OrderedDict()
+        # The generation of the last invalidation that isn't in `_invalidated`.
+        self._forgotten = 0
+
+    def get_many(self, row_keys):
+        """Return a dict mapping those of `row_keys` that are cached to their entries."""
+        found = {}
+        with self._lock:
+            for row_key in row_keys:
+                entry = self._entries.get(row_key)
+                if entry is not None:
+                    self._entries.move_to_end(row_key)
+                    found[row_key] = entry
+        return {
+            row_key: {**entry, 'state': copy.deepcopy(entry['state'])}
+            for row_key, entry in found.items()
+        }
+
+    def put(self, row_key, record, state_dict, generation):
+        """
+        Cache a copy of the decoded `state_dict` of the saved `record`, the row
+        `row_key`, read from the database when the cache was at `generation`.
+        """
+        entry = {
+            'id': record.pk, 'version': record.version, 'scenario': record.scenario, 'tag': record.tag,
+            'state': copy.deepcopy(state_dict),
+        }
+        with self._lock:
+            if generation < max(self._forgotten, self._invalidated.get(row_key, 0)):
+                return
+            cached = self._entries.get(row_key)
+            if cached is not None and cached['version'] > record.version:
+                return
+            self._entries[row_key] = entry
+            self._entries.move_to_end(row_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def count(self, hits, misses):
+        """Add to the hit and miss counters."""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        SHARED_CACHE_HITS.inc(hits)
+        SHARED_CACHE_MISSES.inc(misses)
+
+    def invalidate(self, row_key=None):
+        """Forget the row `row_key`, or every row."""
+        with self._lock:
+            self.generation += 1
+            if row_key is None:
+                self._entries.clear()
+                self._invalidated.clear()
+                self._forgotten = self.generation
+            else:
+                self._entries.pop(row_key, None)
+                self._invalidated[row_key] = self.generation
+                self._invalidated.move_to_end(row_key)
+                while len(self._invalidated) > self.max_entries:
+                    _row_key, self._forgotten = self._invalidated.popitem(last=False)
+
+
+class WorkbenchDjangoKeyValueStore(WorkbenchKeyValueStore):
     """A Django model backed `KeyValueStore` for the Workbench to use.
 
     If you use this key-value store, you *must* use `ScenarioIdManager` or
@@ -47,54 +363,1010 @@ class WorkbenchDjangoKeyValueStore(KeyValueStore):
 
     So an example: a-little-html.html.d0.u0
 
-    We store all fields for a given (scope, scope_id, user_id) in one JSON blob,
-    rather than having a single row for each field name. This is why there's
-    some JSON packing/unpacking code.
+    We store all fields for a given (scope, scope_id, user_id) in one blob,
+    rather than having a single row for each field name. The blob is encoded
+    with the codec selected in ``settings.WORKBENCH['state_codec']`` (see
+    `workbench.state_codec`).
+
+    All access happens inside a unit of work (see `unit_of_work`), which loads
+    each row once and writes every changed row in a single transaction when it
+    finishes. Calls made outside of an explicit unit of work get one of their
+    own, so they are written immediately.
+
+    Rows are saved with optimistic concurrency control: a save only applies if
+    the row's `version` is still the one we read. Otherwise the row is read
+    again and our changed fields are re-applied to it, up to
+    `MAX_WRITE_ATTEMPTS` times with a short randomized backoff in between. The
+    number of such conflicts is counted in `conflicts`.
+
+    The decoded state of shared rows (those without a user, like the content
+    and settings of blocks), which every student reads, is kept in a least
+    recently used cache of `shared_cache_size` rows (see `shared_cache`).
+    Rows saved by this store are dropped from the cache. With
+    `validate_shared_cache` on, the versions of the cached rows are checked
+    with a query that doesn't fetch their state, so changes made by other
+    processes are noticed; turn it off when only one process uses the
+    database.
+
+    With `write_behind` on, the changes to rows that belong to a user are not
+    saved when a unit of work finishes. They are kept in memory, where reads
+    see them, and saved by a background thread at least every
+    `max_staleness` seconds, `WRITE_BEHIND_BATCH` rows per transaction.
+    `flush` saves them straight away, and they are also saved when the
+    process exits or `close` stops the thread. Changes that are waiting to be saved are lost if the
+    process is killed.
+
+    With `change_log` on (by default ``settings.WORKBENCH['change_log']``),
+    every field set or deleted, and every clear, is also recorded as an
+    `XBlockStateChange`, in the transaction that writes it.
     """
+    MAX_WRITE_ATTEMPTS = 8
+    # Upper bound in seconds of the backoff after the first conflict; it doubles after each one.
+    CONFLICT_BACKOFF = 0.001
+    WRITE_BEHIND_BATCH = 250
+    # How many of the users this store inserted rows for it remembers.
+    MAX_KNOWN_USERS = 10000
+
+    def __init__(
+        self, *, write_behind=False, max_staleness=1.0, shared_cache_size=1000, validate_shared_cache=True,
+        change_log=None,
+    ):
+        super().__init__()
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.conflicts = 0
+        # The users this store has inserted rows for, to notice their first write.
+        self._known_users = _KnownUsers(self.MAX_KNOWN_USERS)
+        self._row_locks = _RowLocks()
+
+        self.shared_cache = _SharedStateCache(shared_cache_size) if shared_cache_size else None
+        self.validate_shared_cache = validate_shared_cache
+        self.change_log = settings.WORKBENCH.get('change_log', False) if change_log is None else change_log
+
+        self.max_staleness = max_staleness
+        self._write_behind = _WriteBehindBuffer() if write_behind else None
+        # Only one thread saves the write-behind buffer at a time, and clears
+        # wait for it. Units of work never take it.
+        self._flush_lock = threading.Lock()
+        # Guards starting and stopping the thread that saves the buffer.
+        self._flusher_lock = threading.Lock()
+        self._flusher = None
+        self._stop_flusher = threading.Event()
+
     # Workbench-special methods.
     def clear(self):
         """Clear all data from the store."""
-        XBlockState.objects.all().delete()
+        with self._flush_lock:
+            if self._write_behind is not None:
+                self._write_behind.discard()
+            with transaction.atomic():
+                XBlockState.delete_all()
+                if self.change_log:
+                    XBlockStateChange.objects.create(operation=XBlockStateChange.CLEAR)
+        self._known_users.clear()
+        self._invalidate_shared()
+
+    def clear_scenario(self, scenario):
+        """Clear all the data of the scenario with the slug `scenario`."""
+        with self._flush_lock:
+            if self._write_behind is not None:
+                self._write_behind.discard(lambda row_key: (row_key[1] or "").startswith(scenario + "."))
+            with transaction.atomic():
+                XBlockState.delete_scenario(scenario)
+                if self.change_log:
+                    XBlockStateChange.objects.create(operation=XBlockStateChange.CLEAR, scenario=scenario)
+        self._known_users.clear()
+        self._invalidate_shared()
 
     def prep_for_scenario_loading(self):
         """Reset any state that's necessary before we load scenarios."""
         XBlockState.prep_for_scenario_loading()
+        self._invalidate_shared()
+
+    def close(self):
+        """Stop the thread that saves the write-behind buffer, and save what is left in it."""
+        with self._flusher_lock:
+            flusher, self._flusher = self._flusher, None
+        if flusher is None:
+            return
+        self._stop_flusher.set()
+        flusher.join()
+        self._stop_flusher.clear()
+        atexit.unregister(self.flush)
+        self.flush()
+
+    @contextmanager
+    def unit_of_work(self):
+        """Batch all reads and writes made in this block into one unit of work.
+
+        Each row is loaded at most once, and all the rows that were changed are
+        saved in one transaction on exit, or handed to the write-behind buffer.
+        If the block raises, the pending changes are discarded. Nested calls
+        join the outermost unit of work.
+        """
+        if getattr(self._local, "unit_of_work", None) is not None:
+            yield
+            return
+
+        work = self._local.unit_of_work = _UnitOfWork()
+        try:
+            yield
+            if self._write_behind is not None:
+                self._defer_changes(work)
+            self._save_changes(work)
+        finally:
+            self._local.unit_of_work = None
+
+    def flush(self):
+        """
+        Save every row changed in the current unit of work, if there is one,
+        and every row waiting in the write-behind buffer.
+        """
+        work = getattr(self._local, "unit_of_work", None)
+        if work is not None:
+            self._save_changes(work)
+        if self._write_behind is not None:
+            self._flush_write_behind()
+
+    def _save_changes(self, work, row_keys=None):
+        """
+        Save every row changed in the unit of work `work`, or only those of
+        `row_keys`, in one transaction.
+        """
+        row_keys = sorted(work.changes if row_keys is None else set(row_keys) & set(work.changes), key=str)
+        if not row_keys:
+            return
+
+        with transaction.atomic():
+            for row_key in row_keys:
+                self._save(work, row_key)
+            if self.change_log:
+                XBlockStateChange.objects.bulk_create([
+                    XBlockStateChange.for_field(work.records[row_key], field_name, value, deleted=value is _DELETED)
+                    for row_key in row_keys
+                    # Rows that were never inserted didn't change.
+                    if work.records[row_key].pk is not None
+                    for field_name, value in work.changes[row_key].items()
+                ])
+        for row_key in row_keys:
+            del work.changes[row_key]
+
+    def _save(self, work, row_key):
+        """
+        Save the row `row_key` of the unit of work `work`, re-applying our
+        changes to a fresh copy of the row whenever it was changed under us.
+        """
+        self._invalidate_shared(row_key)
+        for attempt in range(self.MAX_WRITE_ATTEMPTS):
+            record = work.records[row_key]
+            new_state = encode_state(work.states[row_key])
+            if record.pk is None:
+                if not work.states[row_key]:
+                    return
+                try:
+                    with transaction.atomic():
+                        record.state = new_state
+                        record.save(force_insert=True)
+                    BYTES_WRITTEN.inc(len(new_state), scope=record.scope)
+                    self._inserted(record.user_id)
+                    return
+                except IntegrityError:
+                    pass
+            else:
+                updated = XBlockState.objects.filter(pk=record.pk, version=record.version).update(
+                    state=new_state, version=F("version") + 1, touched=now(),
+                )
+                if updated:
+                    record.state = new_state
+                    record.version += 1
+                    BYTES_WRITTEN.inc(len(new_state), scope=record.scope)
+                    return
+
+            self._record_conflict(row_key, attempt)
+            self._reload(work, row_key)
+
+        raise StateConflictError(f"Could not save XBlock state {row_key!r}: too many concurrent changes")
+
+    def _reload(self, work, row_key):
+        """
+        Read the row `row_key` of the unit of work `work` again, and apply the
+        changes made in that unit of work on top of it.
+        """
+        old_record = work.records[row_key]
+        scope, scope_id, user_id = row_key
+        record = XBlockState.objects.filter(scope=scope, scope_id=scope_id, user_id=user_id).first()
+        if record is None:
+            record = XBlockState(
+                scope=scope, scope_id=scope_id, user_id=user_id,
+                scenario=old_record.scenario, tag=old_record.tag,
+            )
+            state_dict = {}
+        else:
+            state_dict = decode_state(record.state)
+
+        _apply_changes(state_dict, work.changes[row_key])
+        work.records[row_key] = record
+        work.states[row_key] = state_dict
+
+    def _invalidate_shared(self, row_key=None):
+        """
+        Drop the row `row_key`, or all rows, from the shared state cache, now
+        and again once the current transaction commits, in case another thread
+        cached the old state in between.
+        """
+        if self.shared_cache is None or (row_key is not None and row_key[2] is not None):
+            return
+        self.shared_cache.invalidate(row_key)
+        transaction.on_commit(functools.partial(self.shared_cache.invalidate, row_key))
+
+    def _cached_rows(self, row_keys):
+        """
+        Return the shared state cache entries of the shared rows among
+        `row_keys`, leaving out those whose version changed if cached rows are
+        validated.
+        """
+        shared = [row_key for row_key in row_keys if row_key[2] is None]
+        if self.shared_cache is None or not shared:
+            return {}
+        cached = self.shared_cache.get_many(shared)
+        if cached and self.validate_shared_cache:
+            versions = {
+                (scope, scope_id, user_id): version
+                for scope, scope_id, user_id, version in XBlockState.objects.filter(
+                    self._rows_query(cached)
+                ).order_by().values_list("scope", "scope_id", "user_id", "version")
+            }
+            cached = {
+                row_key: entry for row_key, entry in cached.items()
+                if versions.get(row_key) == entry['version']
+            }
+        self.shared_cache.count(hits=len(cached), misses=len(shared) - len(cached))
+        return cached
+
+    def _inserted(self, user_id):
+        """Note that a row of `user_id` was inserted, which may be their first."""
+        if user_id is not None and self._known_users.add(user_id):
+            XBlockState.user_ids_changed()
+
+    def _record_conflict(self, row_key, attempt):
+        """Count a failed optimistic write to the row `row_key`, and back off before retrying."""
+        with self._stats_lock:
+            self.conflicts += 1
+        _back_off_after_conflict(row_key, attempt, self.CONFLICT_BACKOFF)
+
+    def _defer_changes(self, work):
+        """
+        Move the changes to the rows of users in the unit of work `work` to
+        the write-behind buffer, leaving the shared rows to be saved now.
+        """
+        for row_key in [row_key for row_key in work.changes if row_key[2] is not None]:
+            record = work.records[row_key]
+            self._write_behind.add(
+                row_key,
+                {field: getattr(record, field) for field in ("scope", "scope_id", "user_id", "scenario", "tag")},
+                work.changes.pop(row_key),
+            )
+        self._start_flusher()
+
+    def _start_flusher(self):
+        """Start the thread that saves the write-behind buffer, unless it is running."""
+        if self._flusher is not None:
+            return
+        with self._flusher_lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_forever, name="workbench-write-behind", daemon=True)
+            self._flusher.start()
+        atexit.register(self.flush)
+
+    def _flush_forever(self):
+        """Save the write-behind buffer every `max_staleness` seconds, until `close` is called."""
+        while not self._stop_flusher.wait(self.max_staleness):
+            if self._write_behind.is_empty():
+                continue
+            try:
+                self._flush_write_behind()
+            except Exception:  # pylint: disable=broad-exception-caught
+                log.exception("Could not save the XBlock state in the write-behind buffer, will retry")
+            finally:
+                close_old_connections()
+
+    def _flush_write_behind(self):
+        """
+        Save every row in the write-behind buffer, `WRITE_BEHIND_BATCH` rows
+        per transaction. Rows that couldn't be saved stay in the buffer.
+
+        The buffer is only locked while rows are taken from it or handed back,
+        so units of work can add changes to it during the save.
+        """
+        with self._flush_lock:
+            rows = list(self._write_behind.take().items())
+            try:
+                for start in range(0, len(rows), self.WRITE_BEHIND_BATCH):
+                    batch = dict(rows[start:start + self.WRITE_BEHIND_BATCH])
+                    work = _UnitOfWork()
+                    self._load_rows(work, {row_key: key_fields for row_key, (key_fields, _changes) in batch.items()})
+                    for row_key, (_key_fields, changes) in batch.items():
+                        work.apply(row_key, changes)
+                    self._save_changes(work)
+                    self._write_behind.saved(batch)
+            finally:
+                self._write_behind.failed()
+
+    @staticmethod
+    def _rows_query(row_keys):
+        """Return a `Q` matching the rows with the keys in `row_keys`."""
+        return functools.reduce(operator.or_, (
+            Q(scope=scope, scope_id=scope_id, user_id=user_id)
+            for scope, scope_id, user_id in row_keys
+        ))
+
+    @staticmethod
+    def _row_key(key):
+        """Return the (scope, scope_id, user_id) triple of the row backing `key`."""
+        fields = XBlockState.key_fields(key)
+        return fields["scope"], fields["scope_id"], fields["user_id"]
+
+    def _load_states(self, keys):
+        """
+        Load the rows backing `keys` into the current unit of work, fetching
+        all of the rows that aren't loaded yet with a single query.
+        """
+        work = self._local.unit_of_work
+        missing = {}
+        for key in keys:
+            row_key = self._row_key(key)
+            if row_key not in work.states and row_key not in missing:
+                missing[row_key] = XBlockState.key_fields(key)
+        self._load_rows(work, missing)
+
+    def _load_rows(self, work, missing):
+        """
+        Load the rows in `missing`, a dict mapping row keys to the column values
+        of the row, into the unit of work `work` with a single query. Changes
+        waiting in the write-behind buffer are applied to them, and the rows
+        are read again if the buffer saved changes while they were read.
+        """
+        if not missing:
+            return
+        while True:
+            generation = self._write_behind.generation if self._write_behind is not None else None
+            self._read_rows(work, dict(missing))
+            if self._write_behind is None or self._write_behind.apply_many(
+                {row_key: work.states[row_key] for row_key in missing}, generation,
+            ):
+                return
+
+    def _read_rows(self, work, missing):
+        """
+        Read the rows in `missing`, a dict mapping row keys to the column
+        values of the row, into the unit of work `work` with a single query.
+        """
+        absent = {
+            row_key: key_fields for row_key, key_fields in missing.items()
+            if (key_fields['scenario'], key_fields['user_id']) in work.prefetched
+        }
+        missing = {row_key: key_fields for row_key, key_fields in missing.items() if row_key not in absent}
+        generation = self.shared_cache.generation if self.shared_cache is not None else None
+        for row_key, entry in self._cached_rows(missing).items():
+            del missing[row_key]
+            self._add_cached(work, row_key, entry)
+
+        records = XBlockState.objects.filter(self._rows_query(missing)).order_by() if missing else []
+        for record in records:
+            if missing.pop((record.scope, record.scope_id, record.user_id), None) is not None:
+                self._add_record(work, record, generation)
+
+        # Rows that don't exist are only created when they are written to.
+        for row_key, key_fields in {**missing, **absent}.items():
+            work.records[row_key] = XBlockState(**key_fields)
+            work.states[row_key] = {}
 
     @staticmethod
-    def _to_json_str(data):
+    def _add_cached(work, row_key, entry):
+        """Add the row `row_key`, from its shared state cache `entry`, to the unit of work `work`."""
+        scope, scope_id, user_id = row_key
+        work.records[row_key] = XBlockState(
+            id=entry['id'], version=entry['version'], scenario=entry['scenario'], tag=entry['tag'],
+            scope=scope, scope_id=scope_id, user_id=user_id,
+        )
+        work.states[row_key] = entry['state']
+
+    def _add_record(self, work, record, generation):
+        """
+        Add the `record` read from the database, and its decoded state, to the
+        unit of work `work`; `generation` is the shared state cache's
+        generation from before it was read.
+        """
+        row_key = (record.scope, record.scope_id, record.user_id)
+        work.records[row_key] = record
+        work.states[row_key] = decode_state(record.state)
+        BYTES_READ.inc(len(record.state), scope=record.scope)
+        if self.shared_cache is not None and row_key[2] is None:
+            self.shared_cache.put(row_key, record, work.states[row_key], generation)
+
+    def prefetch_scenario(self, scenario, user_id):
         """
-        Serialize data as a JSON string
+        Load the state of the scenario with the slug `scenario` that is shared
+        or belongs to `user_id`, and the state of `user_id` that doesn't
+        belong to any scenario, into the current unit of work with one query.
+
+        Rendering the scenario then reads no more rows: rows that weren't
+        found are known not to exist. Shared rows in the shared state cache
+        are only checked for changes; their state is read when they aren't
+        cached or changed since.
         """
-        return json.dumps(data, indent=2, sort_keys=True)
+        work = getattr(self._local, "unit_of_work", None)
+        if work is None:
+            return
+
+        query = (
+            Q(scenario=scenario) & (Q(user_id__isnull=True) | Q(user_id=user_id))
+            | Q(scenario__isnull=True, user_id=user_id)
+        )
+        while True:
+            generation = self._write_behind.generation if self._write_behind is not None else None
+            loaded = self._read_new_rows(work, query)
+            if self._write_behind is None or self._write_behind.apply_many(
+                {row_key: work.states[row_key] for row_key in loaded}, generation,
+            ):
+                break
+            # The write-behind buffer saved changes meanwhile: read the rows again.
+            for row_key in loaded:
+                del work.records[row_key]
+                del work.states[row_key]
+        work.prefetched.update({(scenario, None), (scenario, user_id), (None, user_id)})
+
+    def _read_new_rows(self, work, query):
+        """
+        Read the rows matching the `Q` `query` that aren't in the unit of work
+        `work` yet into it, and return their keys.
+
+        With a shared state cache, the keys and versions of the rows are read
+        first, and then the state of the rows that belong to a user or whose
+        cache entry is missing or out of date.
+        """
+        rows = XBlockState.objects.filter(query).order_by()
+        generation = self.shared_cache.generation if self.shared_cache is not None else None
+        cached = {}
+        if self.shared_cache is None:
+            records = [record for record in rows if (record.scope, record.scope_id, record.user_id) not in work.states]
+        else:
+            versions = {
+                (scope, scope_id, user_id): (pk, version)
+                for pk, scope, scope_id, user_id, version in rows.values_list(
+                    'pk', 'scope', 'scope_id', 'user_id', 'version',
+                )
+                if (scope, scope_id, user_id) not in work.states
+            }
+            shared = [row_key for row_key in versions if row_key[2] is None]
+            cached = {
+                row_key: entry for row_key, entry in self.shared_cache.get_many(shared).items()
+                if entry['version'] == versions[row_key][1]
+            }
+            self.shared_cache.count(hits=len(cached), misses=len(shared) - len(cached))
+            for row_key, entry in cached.items():
+                self._add_cached(work, row_key, entry)
+            wanted = [pk for row_key, (pk, _version) in versions.items() if row_key not in cached]
+            records = list(XBlockState.objects.filter(pk__in=wanted).order_by()) if wanted else []
+
+        for record in records:
+            self._add_record(work, record, generation)
+        return [*cached, *((record.scope, record.scope_id, record.user_id) for record in records)]
+
+    def _get_state(self, key):
+        """
+        Return the row key and the decoded state dict for `key`, loading the
+        row into the current unit of work if it isn't there yet.
+        """
+        row_key = self._row_key(key)
+        work = self._local.unit_of_work
+        if row_key not in work.states:
+            self._load_states([key])
+        return row_key, work.states[row_key]
 
     # KeyValueStore methods.
     def get(self, key):
         """Get state for a given `KeyValueStore.Key`."""
-        record = XBlockState.get_for_key(key)
-        return json.loads(record.state)[key.field_name]
+        with self.unit_of_work():
+            _row_key, state_dict = self._get_state(key)
+            return state_dict[key.field_name]
 
     def set(self, key, value):
         """Set state for a given `KeyValueStore.Key` to `value`."""
-        record = XBlockState.get_for_key(key)
-        state_dict = json.loads(record.state)
-        state_dict[key.field_name] = value
-
-        record.state = self._to_json_str(state_dict)
-        record.save()
+        with self.unit_of_work():
+            row_key, _state_dict = self._get_state(key)
+            self._local.unit_of_work.set(row_key, key.field_name, value)
 
     def delete(self, key):
         """Delete state for a given `KeyValueStore.Key`."""
-        record = XBlockState.get_for_key(key)
-        state_dict = json.loads(record.state)
-        del state_dict[key.field_name]
-        record.state = self._to_json_str(state_dict)
-        record.save()
+        with self.unit_of_work():
+            row_key, _state_dict = self._get_state(key)
+            self._local.unit_of_work.delete(row_key, key.field_name)
+
+    def has(self, key):
+        """Check if an entry exists for `KeyValueStore.Key`."""
+        with self.unit_of_work():
+            _row_key, state_dict = self._get_state(key)
+            return key.field_name in state_dict
+
+    def increment(self, key, delta=1, default=0):
+        """
+        Atomically add `delta` to the number stored for `key` and return the
+        result. A missing value counts as `default`.
+
+        The increment is written straight away, even inside a unit of work, as
+        a conditional UPDATE that only applies if the row's version hasn't
+        changed since it was read. If it has, the increment is retried against
+        the new state, so concurrent increments are never lost. Changes to the
+        row that are still pending in the current unit of work are saved
+        first, so that the increment applies on top of them.
+        """
+        row_key = self._row_key(key)
+        if self._write_behind is not None and self._write_behind.has(row_key):
+            self._flush_write_behind()
+        work = getattr(self._local, "unit_of_work", None)
+        if work is not None:
+            self._save_changes(work, [row_key])
+        # Increments of a row from threads of this process take turns, so they
+        # only conflict with other processes.
+        with self._row_locks.hold(row_key):
+            for attempt in range(self.MAX_WRITE_ATTEMPTS):
+                record = XBlockState.find_for_key(key)
+                if record is None:
+                    state_dict = {key.field_name: default + delta}
+                    new_state = encode_state(state_dict)
+                    try:
+                        with transaction.atomic():
+                            record = XBlockState.objects.create(state=new_state, **XBlockState.key_fields(key))
+                            if self.change_log:
+                                XBlockStateChange.for_field(record, key.field_name, state_dict[key.field_name]).save()
+                        self._inserted(key.user_id)
+                        break
+                    except IntegrityError:
+                        self._record_conflict(row_key, attempt)
+                        continue
+
+                state_dict = decode_state(record.state)
+                state_dict[key.field_name] = state_dict.get(key.field_name, default) + delta
+                new_state = encode_state(state_dict)
+                with transaction.atomic():
+                    updated = XBlockState.objects.filter(pk=record.pk, version=record.version).update(
+                        state=new_state, version=F("version") + 1, touched=now(),
+                    )
+                    if updated and self.change_log:
+                        XBlockStateChange.for_field(record, key.field_name, state_dict[key.field_name]).save()
+                if updated:
+                    record.state = new_state
+                    record.version += 1
+                    break
+                self._record_conflict(row_key, attempt)
+            else:
+                raise StateConflictError(f"Could not increment {key!r}: too many concurrent changes")
+        BYTES_WRITTEN.inc(len(new_state), scope=row_key[0])
+        self._invalidate_shared(row_key)
+
+        # Keep the current unit of work, if any, in step with the database,
+        # down to the version that its next save of the row is checked against.
+        # Its changes to the row were saved first, so the row is as saved here,
+        # whether or not the unit of work had loaded it (or noted it missing).
+        if work is not None:
+            work.records[row_key] = record
+            work.states[row_key] = dict(state_dict)
+        return state_dict[key.field_name]
+
+    def set_many(self, update_dict):
+        """
+        Set every `KeyValueStore.Key` in `update_dict` to its value, reading
+        and writing each backing row only once.
+        """
+        with self.unit_of_work():
+            self._load_states(update_dict)
+            for key, value in update_dict.items():
+                row_key, _state_dict = self._get_state(key)
+                self._local.unit_of_work.set(row_key, key.field_name, value)
+
+    def get_many(self, keys):
+        """
+        Return a dict mapping each of `keys` that has a stored value to that
+        value, reading each backing row only once.
+        """
+        keys = list(keys)
+        with self.unit_of_work():
+            self._load_states(keys)
+            values = {}
+            for key in keys:
+                _row_key, state_dict = self._get_state(key)
+                if key.field_name in state_dict:
+                    values[key] = state_dict[key.field_name]
+            return values
+
+    def has_many(self, keys):
+        """
+        Return a dict mapping each of `keys` to whether it has a stored value,
+        reading each backing row only once.
+        """
+        keys = list(keys)
+        with self.unit_of_work():
+            self._load_states(keys)
+            return {key: key.field_name in self._get_state(key)[1] for key in keys}
+
+
+def field_is_selected(block_type, field_name, block_types, fields):
+    """
+    Return whether the field `field_name` of blocks of type `block_type` is
+    selected by `block_types` or `fields`, as `NormalizedFieldKeyValueStore`
+    selects the fields it keeps in rows of their own.
+    """
+    return (
+        '*' in block_types or block_type in block_types or
+        field_name in fields or f"{block_type}.{field_name}" in fields
+    )
+
+
+class NormalizedFieldKeyValueStore(WorkbenchKeyValueStore):
+    """
+    A store that keeps selected fields in a row each, and the other fields in
+    another store.
+
+    Blobs hold every field of their (scope, scope_id, user_id), so writing a
+    small counter rewrites all the other fields of its scope. The fields
+    selected here are kept in `XBlockFieldState` instead, one row per field.
+    Fields are selected by block type with `block_types` (``'*'`` selects
+    every type) and by name with `fields`, whose items are field names or
+    ``block_type.field_name``. The other fields go to `store`, the
+    configuration of the wrapped store as accepted by `load_kvs`.
+
+    In a unit of work, field rows are read at most once, and the changed ones
+    are written together in one transaction before the wrapped store saves its
+    own changes; if the unit of work fails, neither are written. Outside one,
+    each write is a transaction of its own. The ``migrate_field_storage``
+    command moves stored values between the two storage modes.
+
+    With `change_log` on (by default ``settings.WORKBENCH['change_log']``),
+    writes to field rows are recorded as `XBlockStateChange` rows, like
+    `WorkbenchDjangoKeyValueStore` records its own.
+    """
+    MAX_WRITE_ATTEMPTS = WorkbenchDjangoKeyValueStore.MAX_WRITE_ATTEMPTS
+    CONFLICT_BACKOFF = WorkbenchDjangoKeyValueStore.CONFLICT_BACKOFF
+    MAX_KNOWN_USERS = WorkbenchDjangoKeyValueStore.MAX_KNOWN_USERS
+
+    def __init__(self, store=DEFAULT_BACKEND, block_types=(), fields=(), change_log=None):
+        super().__init__()
+        self.store = load_kvs(store)
+        self.block_types = frozenset(block_types)
+        self.fields = frozenset(fields)
+        self.change_log = settings.WORKBENCH.get('change_log', False) if change_log is None else change_log
+        # The users this store has inserted field rows for, to notice their first write.
+        self._known_users = _KnownUsers(self.MAX_KNOWN_USERS)
+        self._local = threading.local()
+
+    def is_normalized(self, key):
+        """Return whether the `KeyValueStore.Key` `key` is kept in a row of its own."""
+        return field_is_selected(XBlockState.key_fields(key)['tag'], key.field_name, self.block_types, self.fields)
+
+    def _split(self, keys):
+        """Split `keys` into those kept in a row of their own and the others."""
+        normalized, others = [], []
+        for key in keys:
+            (normalized if self.is_normalized(key) else others).append(key)
+        return normalized, others
+
+    @staticmethod
+    def _lookup(key):
+        """Return the column values to look up the field row of `key` with."""
+        fields = XBlockFieldState.key_fields(key)
+        return {name: fields[name] for name in ('scope', 'scope_id', 'user_id', 'field_name')}
+
+    def _field_key(self, key):
+        """Return the (scope, scope_id, user_id, field_name) of the field row of `key`."""
+        return tuple(self._lookup(key).values())
+
+    # Workbench-special methods.
+    def clear(self):
+        """Clear all data from both storage modes."""
+        self.store.clear()
+        XBlockFieldState.delete_all()
+        self._known_users.clear()
+
+    def clear_scenario(self, scenario):
+        """Clear all the data of the scenario with the slug `scenario`."""
+        self.store.clear_scenario(scenario)
+        XBlockFieldState.delete_scenario(scenario)
+        self._known_users.clear()
+
+    def prep_for_scenario_loading(self):
+        """Forget the children known to either storage mode."""
+        self.store.prep_for_scenario_loading()
+        XBlockFieldState.objects.filter(scope="children").delete()
+
+    @contextmanager
+    def unit_of_work(self):
+        """Group the reads and writes made in this block in one unit of work.
+
+        Each field row is read at most once, and the changed ones are written
+        in one transaction on exit, inside a unit of work of the wrapped store,
+        so that it only saves its changes once they are written. If the block
+        raises, the pending changes of both are discarded. Nested calls join
+        the outermost unit of work.
+        """
+        if getattr(self._local, "field_unit_of_work", None) is not None:
+            yield
+            return
+
+        work = self._local.field_unit_of_work = _FieldUnitOfWork()
+        try:
+            with self.store.unit_of_work():
+                yield
+                self._save_fields(work)
+        finally:
+            self._local.field_unit_of_work = None
+
+    def flush(self):
+        """
+        Write the field rows changed in the current unit of work, if there is
+        one, and any changes the wrapped store is holding on to.
+        """
+        work = getattr(self._local, "field_unit_of_work", None)
+        if work is not None:
+            self._save_fields(work)
+        self.store.flush()
+
+    def _save_fields(self, work, field_keys=None):
+        """
+        Write every field row changed in the unit of work `work`, or only those
+        of `field_keys`, in one transaction.
+        """
+        field_keys = [
+            field_key for field_key in (work.changed if field_keys is None else field_keys)
+            if field_key in work.changed
+        ]
+        if not field_keys:
+            return
+        with transaction.atomic():
+            for field_key in field_keys:
+                key, value = work.changed[field_key], work.values[field_key]
+                if value is not _DELETED:
+                    self._write(key, value)
+                elif XBlockFieldState.objects.filter(**self._lookup(key)).delete()[0]:
+                    self._log(key, deleted=True)
+        for field_key in field_keys:
+            del work.changed[field_key]
+
+    def prefetch_scenario(self, scenario, user_id):
+        """
+        Let the wrapped store load the state of the scenario for `user_id` in
+        advance, and load the field rows of the same state into the current
+        unit of work with one more query.
+        """
+        self.store.prefetch_scenario(scenario, user_id)
+        work = getattr(self._local, "field_unit_of_work", None)
+        if work is None:
+            return
+
+        records = XBlockFieldState.objects.filter(
+            Q(scenario=scenario) & (Q(user_id__isnull=True) | Q(user_id=user_id))
+            | Q(scenario__isnull=True, user_id=user_id)
+        ).order_by().only('scope', 'scope_id', 'user_id', 'field_name', 'state')
+        for record in records:
+            field_key = (record.scope, record.scope_id, record.user_id, record.field_name)
+            if field_key not in work.values:
+                BYTES_READ.inc(len(record.state), scope=record.scope)
+                work.values[field_key] = decode_state(record.state)[record.field_name]
+        work.prefetched.update({(scenario, None), (scenario, user_id), (None, user_id)})
+
+    def close(self):
+        """Close the wrapped store, if it can be closed."""
+        close = getattr(self.store, 'close', None)
+        if close is not None:
+            close()
+
+    # KeyValueStore methods.
+    def get(self, key):
+        """Get state for a given `KeyValueStore.Key`."""
+        if not self.is_normalized(key):
+            return self.store.get(key)
+        values = self.get_many([key])
+        if key not in values:
+            raise KeyError(key)
+        return values[key]
 
     def has(self, key):
         """Check if an entry exists for `KeyValueStore.Key`."""
-        record = XBlockState.get_for_key(key)
-        state_dict = json.loads(record.state)
-        return key.field_name in state_dict
+        if not self.is_normalized(key):
+            return self.store.has(key)
+        return key in self.get_many([key])
+
+    def get_many(self, keys):
+        """
+        Return a dict mapping each of `keys` that has a stored value to that
+        value, reading all the field rows with a single query.
+        """
+        normalized, others = self._split(keys)
+        values = self.store.get_many(others) if others else {}
+        work = getattr(self._local, "field_unit_of_work", None)
+        if work is None:
+            values.update(self._read_fields(normalized))
+            return values
+
+        missing = [key for key in normalized if not self._is_loaded(work, key)]
+        loaded = self._read_fields(missing)
+        for key in missing:
+            work.values[self._field_key(key)] = loaded.get(key, _DELETED)
+        for key in normalized:
+            value = work.values.get(self._field_key(key), _DELETED)
+            if value is not _DELETED:
+                values[key] = value
+        return values
+
+    def _is_loaded(self, work, key):
+        """
+        Return whether the value of the field row of `key`, or its absence, is
+        known in the unit of work `work`.
+        """
+        if self._field_key(key) in work.values:
+            return True
+        fields = XBlockFieldState.key_fields(key)
+        return (fields['scenario'], fields['user_id']) in work.prefetched
+
+    def _read_fields(self, keys):
+        """Return a dict mapping each of `keys` that has a field row to its value, with a single query."""
+        values = {}
+        if not keys:
+            return values
+        by_field_key = {self._field_key(key): key for key in keys}
+        records = XBlockFieldState.objects.filter(
+            functools.reduce(operator.or_, (Q(**self._lookup(key)) for key in keys))
+        ).order_by().only('scope', 'scope_id', 'user_id', 'field_name', 'state')
+        for record in records:
+            key = by_field_key[(record.scope, record.scope_id, record.user_id, record.field_name)]
+            BYTES_READ.inc(len(record.state), scope=record.scope)
+            values[key] = decode_state(record.state)[key.field_name]
+        return values
+
+    def has_many(self, keys):
+        """Return a dict mapping each of `keys` to whether it has a stored value."""
+        keys = list(keys)
+        values = self.get_many(keys)
+        return {key: key in values for key in keys}
+
+    def set(self, key, value):
+        """Set state for a given `KeyValueStore.Key` to `value`."""
+        if not self.is_normalized(key):
+            self.store.set(key, value)
+            return
+        work = getattr(self._local, "field_unit_of_work", None)
+        if work is not None:
+            work.set(self._field_key(key), key, value)
+        else:
+            self._write(key, value)
+
+    def set_many(self, update_dict):
+        """Set every `KeyValueStore.Key` in `update_dict` to its value."""
+        normalized, others = self._split(update_dict)
+        if others:
+            self.store.set_many({key: update_dict[key] for key in others})
+        work = getattr(self._local, "field_unit_of_work", None)
+        if work is not None:
+            for key in normalized:
+                work.set(self._field_key(key), key, update_dict[key])
+        elif normalized:
+            with transaction.atomic():
+                for key in normalized:
+                    self._write(key, update_dict[key])
+
+    def delete(self, key):
+        """Delete state for a given `KeyValueStore.Key`."""
+        if not self.is_normalized(key):
+            self.store.delete(key)
+            return
+        work = getattr(self._local, "field_unit_of_work", None)
+        if work is not None:
+            if key not in self.get_many([key]):
+                raise KeyError(key)
+            work.set(self._field_key(key), key, _DELETED)
+            return
+        with transaction.atomic():
+            deleted, _ = XBlockFieldState.objects.filter(**self._lookup(key)).delete()
+            if not deleted:
+                raise KeyError(key)
+            self._log(key, deleted=True)
+
+    def increment(self, key, delta=1, default=0):
+        """
+        Atomically add `delta` to the number stored for `key` and return the
+        result. A missing value counts as `default`.
+
+        Field rows are updated with a conditional UPDATE on their version,
+        retried when the row changed in between, like the blobs of
+        `WorkbenchDjangoKeyValueStore`. A pending change to the field in the
+        current unit of work is written first.
+        """
+        if not self.is_normalized(key):
+            return self.store.increment(key, delta, default)
+        work = getattr(self._local, "field_unit_of_work", None)
+        if work is None:
+            return self._increment(key, delta, default)
+        field_key = self._field_key(key)
+        self._save_fields(work, [field_key])
+        work.values[field_key] = self._increment(key, delta, default)
+        return work.values[field_key]
+
+    def _increment(self, key, delta, default):
+        """Add `delta` to the field row of `key` in the database and return the result."""
+        lookup = self._lookup(key)
+        for attempt in range(self.MAX_WRITE_ATTEMPTS):
+            record = XBlockFieldState.objects.filter(**lookup).only('pk', 'version', 'state').first()
+            if record is None:
+                value = default + delta
+                try:
+                    with transaction.atomic():
+                        self._create(key, value)
+                        self._log(key, value)
+                    return value
+                except IntegrityError:
+                    _back_off_after_conflict(tuple(lookup.values()), attempt, self.CONFLICT_BACKOFF)
+                    continue
+            value = decode_state(record.state)[key.field_name] + delta
+            new_state = encode_state({key.field_name: value})
+            with transaction.atomic():
+                updated = XBlockFieldState.objects.filter(pk=record.pk, version=record.version).update(
+                    state=new_state, version=F("version") + 1, touched=now(),
+                )
+                if updated:
+                    self._log(key, value)
+            if updated:
+                BYTES_WRITTEN.inc(len(new_state), scope=lookup['scope'])
+                return value
+            _back_off_after_conflict(tuple(lookup.values()), attempt, self.CONFLICT_BACKOFF)
+        raise StateConflictError(f"Could not increment {key!r}: too many concurrent changes")
+
+    def _write(self, key, value):
+        """Write the field row of `key`, whatever it held before."""
+        lookup = self._lookup(key)
+        new_state = encode_state({key.field_name: value})
+        with transaction.atomic():
+            self._log(key, value)
+            updated = XBlockFieldState.objects.filter(**lookup).update(
+                state=new_state, version=F("version") + 1, touched=now(),
+            )
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        self._create(key, value)
+                    return
+                except IntegrityError:
+                    # Created concurrently: this write is the later one.
+                    XBlockFieldState.objects.filter(**lookup).update(
+                        state=new_state, version=F("version") + 1, touched=now(),
+                    )
+        BYTES_WRITTEN.inc(len(new_state), scope=lookup['scope'])
+
+    def _log(self, key, value=None, deleted=False):
+        """Record that the field of `key` was set to `value`, or deleted, if the change log is on."""
+        if self.change_log:
+            record = XBlockFieldState(**XBlockFieldState.key_fields(key))
+            XBlockStateChange.for_field(record, key.field_name, value, deleted=deleted).save()
+
+    def _create(self, key, value):
+        """Insert the field row of `key`."""
+        fields = XBlockFieldState.key_fields(key)
+        new_state = encode_state({key.field_name: value})
+        XBlockFieldState.objects.create(state=new_state, **fields)
+        BYTES_WRITTEN.inc(len(new_state), scope=fields['scope'])
+        if key.user_id is not None and self._known_users.add(key.user_id):
+            XBlockState.user_ids_changed()
+
+
+class WorkbenchFieldData(KvsFieldData):
+    """`KvsFieldData` with support for the atomic increments of `WorkbenchCounterService`."""
+
+    def increment(self, block, name, delta=1):
+        """
+        Atomically add `delta` to the field named `name` and return the new value.
+        """
+        default = self._getfield(block, name).default
+        return self._kvs.increment(self._key(block, name), delta, default or 0)
 
 
 class ScenarioIdManager(IdReader, IdGenerator):
@@ -165,6 +1437,21 @@ class ScenarioIdManager(IdReader, IdGenerator):
         except KeyError as ex:
             raise NoSuchDefinition(repr(def_id)) from ex
 
+    def is_known_id(self, block_scope_id):
+        """
+        Return whether `block_scope_id` is a definition or usage id created by
+        this manager, or the id of an aside of one. Asides are only created
+        when their block is loaded, so their ids are recognized by their form.
+        """
+        if block_scope_id in self._usages or block_scope_id in self._definitions:
+            return True
+        if block_scope_id in self._aside_usages or block_scope_id in self._aside_defs:
+            return True
+        owner_id, _, aside_type = block_scope_id.rpartition(".")
+        if re.fullmatch(r"[du]\d+", aside_type):
+            return False
+        return owner_id in self._usages or owner_id in self._definitions
+
     def create_aside(self, definition_id, usage_id, aside_type):
         """Create asides"""
         aside_def_id = f"{definition_id}.{aside_type}"
@@ -222,6 +1509,19 @@ class ScenarioIdManager(IdReader, IdGenerator):
             raise NoSuchDefinition(aside_id) from ex
 
     # Workbench specific functionality
+    def clear_scenario(self, scenario):
+        """
+        Remove all the entries of the scenario with the slug `scenario`, so
+        that loading it again creates the same IDs as before.
+        """
+        prefix = scenario + "."
+        for registry in (
+            self._block_types_to_id_seq, self._def_ids_to_id_seq,
+            self._usages, self._definitions, self._aside_defs, self._aside_usages,
+        ):
+            for entry_id in [entry_id for entry_id in registry if entry_id.startswith(prefix)]:
+                del registry[entry_id]
+
     def set_scenario(self, scenario):
         """Call this before loading a scenario so that this `ScenarioIdManager`
         knows what to prefix the IDs with. This helps isolate scenarios from
@@ -246,11 +1546,17 @@ class WorkbenchRuntime(Runtime):
     anonymous_student_id = 'dummydummy000-fake-fake-dummydummy00'  # Needed for the LTI XBlock
     hostname = '127.0.0.1:8000'  # Arbitrary value, needed for the LTI XBlock
 
-    def __init__(self, user_id=None):
+    def __init__(self, user_id=None, id_manager=None, kvs=None):
+        """
+        `id_manager` and `kvs` default to the workbench's `ID_MANAGER` and
+        `WORKBENCH_KVS`.
+        """
         #  TODO: Add params for user, runtime, etc. to service initialization
         #  Move to stevedor
+        field_data = WorkbenchFieldData(WORKBENCH_KVS if kvs is None else kvs)
         services = {
-            'field-data': KvsFieldData(WORKBENCH_KVS),
+            'field-data': field_data,
+            'counter': WorkbenchCounterService(field_data),
             'user': WorkBenchUserService(user_id),
             'i18n': WorkbenchI18NService(),
         }
@@ -264,7 +1570,9 @@ class WorkbenchRuntime(Runtime):
             if service is not None:
                 services[service_name] = service
 
-        super().__init__(ID_MANAGER, ID_MANAGER, services=services)
+        if id_manager is None:
+            id_manager = ID_MANAGER
+        super().__init__(id_manager, id_manager, services=services)
         self.user_id = user_id
 
     def get_user_role(self):
@@ -499,8 +1807,8 @@ class _BlockSet:
                 yield getattr(block, attr_name)
 
 
-# Our global state (the "database").
-WORKBENCH_KVS = WorkbenchDjangoKeyValueStore()
+# Our global state (the "database"), stored in the backend chosen in settings.
+WORKBENCH_KVS = load_kvs(settings.WORKBENCH.get('kvs', DEFAULT_BACKEND))
 
 # Our global id manager
 ID_MANAGER = ScenarioIdManager()
@@ -530,6 +1838,29 @@ class WorkBenchUserService(UserService):
         return self._user
 
 
+class WorkbenchCounterService:
+    """
+    Atomic counters for integer fields that many users update at once.
+
+    Reading a field, adding to it and saving the block loses updates when two
+    students do it at the same time, because the second save overwrites the
+    first. Blocks that `want` the "counter" service can use `increment` instead
+    of assigning to such fields. The new value is written immediately.
+    """
+
+    def __init__(self, field_data):
+        self._field_data = field_data
+
+    def increment(self, block, field_name, delta=1):
+        """
+        Atomically add `delta` to the field `field_name` of `block` and return the new value.
+        """
+        value = self._field_data.increment(block, field_name, delta)
+        # Refresh the block's cached copy of the field, without marking it dirty.
+        block.fields[field_name]._set_cached_value(block, value)  # pylint: disable=protected-access
+        return value
+
+
 class WorkbenchI18NService(NullI18nService):
     """Version of the I18N service for the workbench.
 
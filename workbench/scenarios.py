@@ -9,11 +9,12 @@ import logging
 from collections import namedtuple
 
 from xblock.core import XBlock
+from xblock.runtime import DictKeyValueStore
 
 from django.conf import settings
 from django.template.defaultfilters import slugify
 
-from .runtime import WORKBENCH_KVS, WorkbenchRuntime
+from .runtime import ID_MANAGER, WORKBENCH_KVS, ScenarioIdManager, WorkbenchRuntime
 
 log = logging.getLogger(__name__)
 
@@ -35,7 +36,8 @@ def add_xml_scenario(scname, description, xml):
     # (because the generator will be contextual), so we
     # pass it explicitly to parse_xml_string.
     runtime.id_generator.set_scenario(slugify(description))
-    usage_id = runtime.parse_xml_string(xml)
+    with WORKBENCH_KVS.unit_of_work():
+        usage_id = runtime.parse_xml_string(xml)
     SCENARIOS[scname] = Scenario(description, usage_id, xml)
 
 
@@ -46,6 +48,25 @@ def remove_scenario(scname):
     del SCENARIOS[scname]
 
 
+def reload_scenario(scname):
+    """
+    Delete all the state of a named scenario and load it again.
+
+    Scenarios are identified in the state by the slug of their description, so
+    every scenario sharing the slug is reloaded, in the order they were loaded.
+    """
+    slug = slugify(SCENARIOS[scname].description)
+    reloading = [
+        (name, scenario) for name, scenario in SCENARIOS.items()
+        if slugify(scenario.description) == slug
+    ]
+    WORKBENCH_KVS.clear_scenario(slug)
+    ID_MANAGER.clear_scenario(slug)
+    for name, scenario in reloading:
+        remove_scenario(name)
+        add_xml_scenario(name, scenario.description, scenario.xml)
+
+
 def add_class_scenarios(class_name, cls, fail_silently=True):
     """
     Add scenarios from a class to the global collection of scenarios.
@@ -80,6 +101,26 @@ def init_scenarios():
         add_class_scenarios(class_name, cls, fail_silently=False)
 
 
+def parse_scenarios():
+    """
+    Parse all the scenarios declared in all the XBlock classes, like
+    `init_scenarios`, without reading or writing the workbench state.
+
+    The blocks are created by a runtime with a `ScenarioIdManager` and an
+    in-memory key-value store of its own, in the same order as
+    `init_scenarios`, so they get the ids that a freshly started workbench
+    gives them. Return that runtime and the scenarios, by name.
+    """
+    runtime = WorkbenchRuntime(id_manager=ScenarioIdManager(), kvs=DictKeyValueStore())
+    scenarios = {}
+    for class_name, cls in sorted(XBlock.load_classes(fail_silently=False)):
+        if hasattr(cls, "workbench_scenarios"):
+            for i, (desc, xml) in enumerate(cls.workbench_scenarios()):
+                runtime.id_generator.set_scenario(slugify(desc))
+                scenarios["%s.%d" % (class_name, i)] = Scenario(desc, runtime.parse_xml_string(xml), xml)
+    return runtime, scenarios
+
+
 def get_scenarios():
     """
     Return SCENARIOS, initializing it if required.
@@ -62,6 +62,12 @@ ADMINS = (
 
 MANAGERS = ADMINS
 
+# Opt-in SQLite tuning for concurrent handler traffic: write-ahead logging
+# instead of a rollback journal, fewer fsyncs, memory-mapped reads, a bigger
+# page cache and persistent connections. Note that WAL mode is stored in the
+# database file, so it stays on after the profile is turned off.
+SQLITE_PERFORMANCE_PROFILE = os.environ.get('WORKBENCH_SQLITE_PERFORMANCE', "false").lower() == "true"
+
 if 'WORKBENCH_DATABASES' in os.environ:
     DATABASES = json.loads(os.environ['WORKBENCH_DATABASES'])
 else:
@@ -72,6 +78,11 @@ else:
         }
     }
 
+if SQLITE_PERFORMANCE_PROFILE:
+    for database in DATABASES.values():
+        if database['ENGINE'] == 'django.db.backends.sqlite3':
+            database.setdefault('CONN_MAX_AGE', 600)
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
@@ -216,6 +227,36 @@ LOGGING = {
     }
 }
 
+# The store XBlock state is kept in, and whether the default cache is put in
+# front of it (see WORKBENCH['kvs'] below).
+KVS_BACKEND = {
+    'backend': os.environ.get('WORKBENCH_KVS_BACKEND', 'workbench.runtime.WorkbenchDjangoKeyValueStore'),
+    'options': {},
+}
+KVS_CACHE = os.environ.get('WORKBENCH_KVS_CACHE', "false").lower() == "true"
+
+# Block types ('*' for all) and fields (names or "block_type.field_name") whose
+# values are kept in a row per field rather than in the state blobs, as
+# comma-separated lists (see workbench.runtime.NormalizedFieldKeyValueStore).
+FIELD_STORAGE = {
+    'block_types': [name for name in os.environ.get('WORKBENCH_FIELD_STORAGE_BLOCK_TYPES', '').split(',') if name],
+    'fields': [name for name in os.environ.get('WORKBENCH_FIELD_STORAGE_FIELDS', '').split(',') if name],
+}
+if FIELD_STORAGE['block_types'] or FIELD_STORAGE['fields']:
+    KVS_BACKEND = {
+        'backend': 'workbench.runtime.NormalizedFieldKeyValueStore',
+        'options': dict(FIELD_STORAGE, store=KVS_BACKEND),
+    }
+
+# Whether the content, settings, children and parent scopes written by
+# scenario loading are kept in this process only, so that only user state is
+# stored in the database (see workbench.kvs.FrozenContentKeyValueStore).
+if os.environ.get('WORKBENCH_KVS_FROZEN_CONTENT', "false").lower() == "true":
+    KVS_BACKEND = {
+        'backend': 'workbench.kvs.FrozenContentKeyValueStore',
+        'options': {'store': KVS_BACKEND},
+    }
+
 WORKBENCH = {
     'reset_state_on_restart': (
         os.environ.get('WORKBENCH_RESET_STATE_ON_RESTART', "false").lower() == "true"
@@ -224,7 +265,56 @@ WORKBENCH = {
     'services': {
         'fs': 'xblock.reference.plugins.FSService',
         'settings': 'workbench.services.SettingsService',
-    }
+    },
+
+    # The key-value store XBlock state is kept in: a dotted class path and
+    # its constructor options. See workbench/kvs.py for the alternatives.
+    'kvs': {
+        'backend': 'workbench.kvs.CachedKeyValueStore',
+        'options': {
+            'store': KVS_BACKEND,
+            'cache_alias': 'default',
+            'scopes': ['content', 'settings', 'children', 'parent'],
+        },
+    } if KVS_CACHE else KVS_BACKEND,
+
+    # PRAGMAs run on every new SQLite connection (see workbench/apps.py).
+    'sqlite_pragmas': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # in KiB when negative
+        'busy_timeout': 5000,  # milliseconds
+    } if SQLITE_PERFORMANCE_PROFILE else {},
+
+    # How XBlockState.state blobs are written: 'json' (pretty-printed),
+    # 'compact-json', 'fast-json' (orjson when installed) or 'msgpack'.
+    # Rows written with any codec can always be read.
+    'state_codec': os.environ.get('WORKBENCH_STATE_CODEC', 'compact-json'),
+
+    # Compression of encoded state blobs of at least the threshold number of
+    # characters: None (off), 'zlib' or 'zstd' (needs zstandard). Compressed
+    # and plain rows can be mixed.
+    'state_compression': os.environ.get('WORKBENCH_STATE_COMPRESSION') or None,
+    'state_compression_threshold': int(os.environ.get('WORKBENCH_STATE_COMPRESSION_THRESHOLD', 4096)),
+
+    # Seconds after a user's last write when all their rows are deleted by
+    # the expire_state command, or None to keep them forever.
+    'user_state_ttl': (
+        int(os.environ['WORKBENCH_USER_STATE_TTL']) if os.environ.get('WORKBENCH_USER_STATE_TTL') else None
+    ),
+
+    # The fields kept in a row each, which the migrate_field_storage command
+    # moves state to or from by default.
+    'field_storage': FIELD_STORAGE,
+
+    # Whether the Django key-value stores record every change to XBlock state
+    # in the XBlockStateChange change log (see the state_changes command).
+    'change_log': os.environ.get('WORKBENCH_CHANGE_LOG', "false").lower() == "true",
+
+    # Whether the admin search also looks for the terms in the state blobs,
+    # which reads the whole table.
+    'admin_state_search': os.environ.get('WORKBENCH_ADMIN_STATE_SEARCH', "false").lower() == "true",
 }
 
 try:
@@ -0,0 +1,267 @@
+"""
+Encoding and decoding of the state blobs stored in `XBlockState.state`.
+
+The codec used for writing is selected with ``settings.WORKBENCH['state_codec']``.
+Rows written by any codec can always be read back: JSON is stored as is, and
+every other format prefixes the encoded data with a ``{marker}:`` format marker.
+
+Encoded blobs of at least ``settings.WORKBENCH['state_compression_threshold']``
+characters are compressed with ``settings.WORKBENCH['state_compression']``,
+when set. Compressed blobs are marked the same way, so compressed and plain
+rows can be mixed too.
+"""
+
+
+import base64
+import inspect
+import math
+import re
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+DEFAULT_CODEC = 'json'
+DEFAULT_COMPRESSION_THRESHOLD = 4096
+
+# orjson reads integers that don't fit in 64 bits as floats, so payloads
+# with a number that long are read with `json`.
+_LONG_NUMBER = re.compile(r'\d{19}')
+
+# Every JSON codec writes and reads NaN and infinities as ``NaN`` and
+# ``Infinity``, which recent simplejson versions only read when asked to.
+_LOADS_NAN_OPTIONS = {'allow_nan': True} if 'allow_nan' in inspect.signature(json.loads).parameters else {}
+
+
+def _has_non_finite(value):
+    """Return whether `value` holds a NaN or infinite float anywhere."""
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_non_finite(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite(item) for item in value)
+    return False
+
+
+class JsonCodec:
+    """The original pretty-printed JSON format. Easy to read in the admin."""
+    name = 'json'
+    marker = None
+
+    def encode(self, data):
+        """Encode the `data` dict as a string."""
+        return json.dumps(data, indent=2, sort_keys=True, allow_nan=True)
+
+    def decode(self, text):
+        """
+        Decode a string produced by `encode`, with `orjson` when it is
+        installed and reads the payload correctly: it can't hold integers over
+        64 bits, NaN or infinities, which `json` reads.
+        """
+        if orjson is not None and not _LONG_NUMBER.search(text):
+            try:
+                return orjson.loads(text)
+            except orjson.JSONDecodeError:
+                pass
+        return json.loads(text, **_LOADS_NAN_OPTIONS)
+
+
+class CompactJsonCodec(JsonCodec):
+    """JSON without any insignificant whitespace."""
+    name = 'compact-json'
+
+    def encode(self, data):
+        """Encode the `data` dict as a string."""
+        return json.dumps(data, separators=(',', ':'), allow_nan=True)
+
+
+class FastJsonCodec(CompactJsonCodec):
+    """Compact JSON, encoded with `orjson` when it is installed."""
+    name = 'fast-json'
+
+    def encode(self, data):
+        """Encode the `data` dict as a string."""
+        if orjson is not None:
+            try:
+                encoded = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+            except TypeError:
+                # Values orjson can't represent (e.g. integers over 64 bits).
+                pass
+            else:
+                # orjson writes NaN and infinities as null, so those are left to json.
+                if b'null' not in encoded or not _has_non_finite(data):
+                    return encoded.decode('utf-8')
+        return super().encode(data)
+
+
+class MsgpackCodec:
+    """
+    MessagePack, base64-encoded so it fits in a text column. Needs `msgpack`.
+
+    State holding integers that MessagePack can't represent is written as
+    compact JSON instead, which `decode_state` reads as well.
+    """
+    name = 'msgpack'
+    marker = 'msgpack'
+
+    def encode(self, data):
+        """Encode the `data` dict as a string."""
+        self._check_installed()
+        try:
+            packed = msgpack.packb(data, use_bin_type=True)
+        except OverflowError:
+            # Integers over 64 bits don't fit in MessagePack: store this state as JSON.
+            return CompactJsonCodec().encode(data)
+        return f"{self.marker}:{base64.b64encode(packed).decode('ascii')}"
+
+    def decode(self, text):
+        """Decode a string produced by `encode`."""
+        self._check_installed()
+        _marker, _, payload = text.partition(':')
+        return msgpack.unpackb(base64.b64decode(payload), raw=False, strict_map_key=False)
+
+    def _check_installed(self):
+        """Fail loudly if msgpack is needed but missing."""
+        if msgpack is None:
+            raise ImproperlyConfigured("The 'msgpack' state codec requires the msgpack package.")
+
+
+class ZlibCompressor:
+    """zlib (deflate) compression, from the standard library."""
+    name = 'zlib'
+    marker = 'zlib'
+    # Fast compression: state is written far more often than it is worth squeezing.
+    level = 1
+
+    def compress(self, data):
+        """Compress the `data` bytes."""
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        """Decompress bytes produced by `compress`."""
+        return zlib.decompress(data)
+
+
+class ZstdCompressor:
+    """Zstandard compression: faster than zlib at similar ratios. Needs `zstandard`."""
+    name = 'zstd'
+    marker = 'zstd'
+
+    def compress(self, data):
+        """Compress the `data` bytes."""
+        self._check_installed()
+        return zstandard.ZstdCompressor().compress(data)
+
+    def decompress(self, data):
+        """Decompress bytes produced by `compress`."""
+        self._check_installed()
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    def _check_installed(self):
+        """Fail loudly if zstandard is needed but missing."""
+        if zstandard is None:
+            raise ImproperlyConfigured("The 'zstd' state compression requires the zstandard package.")
+
+
+CODECS = {
+    codec.name: codec
+    for codec in (JsonCodec(), CompactJsonCodec(), FastJsonCodec(), MsgpackCodec())
+}
+
+CODECS_BY_MARKER = {codec.marker: codec for codec in CODECS.values() if codec.marker}
+
+COMPRESSORS = {
+    compressor.name: compressor
+    for compressor in (ZlibCompressor(), ZstdCompressor())
+}
+
+COMPRESSORS_BY_MARKER = {compressor.marker: compressor for compressor in COMPRESSORS.values()}
+
+
+def get_codec(name=None):
+    """
+    Return the codec called `name`, or the one configured in the settings.
+    """
+    if name is None:
+        name = settings.WORKBENCH.get('state_codec', DEFAULT_CODEC)
+    try:
+        return CODECS[name]
+    except KeyError as ex:
+        raise ImproperlyConfigured(f"Unknown XBlock state codec {name!r}") from ex
+
+
+def get_compressor(name=None):
+    """
+    Return the compressor called `name`, or the one configured in the
+    settings, which is None when state isn't compressed.
+    """
+    if name is None:
+        name = settings.WORKBENCH.get('state_compression')
+        if not name:
+            return None
+    try:
+        return COMPRESSORS[name]
+    except KeyError as ex:
+        raise ImproperlyConfigured(f"Unknown XBlock state compression {name!r}") from ex
+
+
+def compress_state(text, compressor, threshold=None):
+    """
+    Compress the encoded state `text` with `compressor` if it has at least
+    `threshold` characters (by default the configured threshold) and gets
+    smaller. Otherwise return `text` unchanged.
+    """
+    if threshold is None:
+        threshold = settings.WORKBENCH.get('state_compression_threshold', DEFAULT_COMPRESSION_THRESHOLD)
+    if compressor is None or len(text) < threshold:
+        return text
+    compressed = compressor.compress(text.encode('utf-8'))
+    compressed_text = f"{compressor.marker}:{base64.b64encode(compressed).decode('ascii')}"
+    return compressed_text if len(compressed_text) < len(text) else text
+
+
+def encode_state(data, codec=None):
+    """
+    Encode the `data` dict with `codec`, or the configured codec, and compress
+    it as configured.
+    """
+    return compress_state((codec or get_codec()).encode(data), get_compressor())
+
+
+def decode_state(text):
+    """Decode a state string written by any of the codecs, compressed or not."""
+    stripped = text.lstrip()
+    if not stripped or stripped[0] == '{':
+        return CODECS[DEFAULT_CODEC].decode(text)
+
+    marker, _, payload = stripped.partition(':')
+    if marker in COMPRESSORS_BY_MARKER:
+        compressor = COMPRESSORS_BY_MARKER[marker]
+        return decode_state(compressor.decompress(base64.b64decode(payload)).decode('utf-8'))
+    try:
+        codec = CODECS_BY_MARKER[marker]
+    except KeyError as ex:
+        raise ValueError(f"Unknown XBlock state format {marker!r}") from ex
+    return codec.decode(stripped)
@@ -0,0 +1,119 @@
+"""Test the XBlockState admin."""
+
+
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.client import Client
+from django.urls import reverse
+from django.utils.timezone import now
+
+from workbench.admin import EstimatedCountPaginator
+from workbench.models import XBlockFieldState, XBlockState
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(name="client")
+def admin_client():
+    """A client logged in as a superuser."""
+    client = Client()
+    client.force_login(get_user_model().objects.create_superuser("admin", "admin@example.com", "password"))
+    return client
+
+
+@pytest.fixture(name="rows")
+def state_rows():
+    """A few rows of user state."""
+    for user_id in ("alice", "bob", "carol"):
+        XBlockState.objects.create(
+            scope="usage", scope_id="demo.problem.d0.u0", user_id=user_id, scenario="demo", tag="problem",
+            state='{"answer": "needle"}' if user_id == "bob" else "{}",
+        )
+
+
+def search(client, term):
+    """Return the user ids of the rows the admin finds for `term`."""
+    response = client.get(reverse("admin:workbench_xblockstate_changelist"), {"q": term})
+    assert response.status_code == 200
+    return sorted(record.user_id for record in response.context["cl"].result_list)
+
+
+@pytest.mark.usefixtures("rows")
+def test_search_uses_indexed_columns(client):
+    assert search(client, "bob") == ["bob"]
+    assert search(client, "demo") == ["alice", "bob", "carol"]
+    assert search(client, "demo.prob") == ["alice", "bob", "carol"]
+    assert search(client, "Demo.prob") == []
+    assert search(client, "needle") == []
+
+
+@pytest.mark.usefixtures("rows")
+def test_state_search_is_opt_in(client):
+    with mock.patch.dict("django.conf.settings.WORKBENCH", {"admin_state_search": True}):
+        assert search(client, "needle") == ["bob"]
+
+
+@pytest.mark.usefixtures("rows")
+def test_estimated_count():
+    with mock.patch.object(EstimatedCountPaginator, "MAX_EXACT_COUNT", 1):
+        # Without statistics, the whole table is counted.
+        assert EstimatedCountPaginator(XBlockState.objects.all(), 100).count == 3
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        XBlockState.objects.create(scope="usage", scope_id="demo.problem.d0.u0", user_id="dave", scenario="demo")
+        # With them, it is estimated.
+        assert EstimatedCountPaginator(XBlockState.objects.all(), 100).count == 3
+        # Filtered lists are always counted.
+        assert EstimatedCountPaginator(XBlockState.objects.filter(scenario="demo"), 100).count == 4
+
+
+@pytest.mark.usefixtures("rows")
+def test_page_numbers_are_clamped():
+    paginator = EstimatedCountPaginator(XBlockState.objects.filter(scenario="demo").order_by("pk"), 1)
+    assert paginator.page(0).number == 1
+    assert paginator.page(99).number == 3
+    assert paginator.page(99).object_list[0].user_id == "carol"
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    XBlockState.objects.filter(user_id="carol").delete()
+    with mock.patch.object(EstimatedCountPaginator, "MAX_EXACT_COUNT", 1):
+        paginator = EstimatedCountPaginator(XBlockState.objects.order_by("pk"), 1)
+        assert paginator.count == 3
+        # The estimate is too high, so the last page is found by counting.
+        page = paginator.page(99)
+        assert (page.number, paginator.count) == (2, 2)
+        assert page.object_list[0].user_id == "bob"
+
+
+def test_edits_bump_the_version_and_touch_rows(client):
+    record = XBlockState.objects.create(
+        scope="usage", scope_id="demo.problem.d0.u0", user_id="bob", scenario="demo", tag="problem",
+        state="{}", touched=now() - timedelta(days=2),
+    )
+    response = client.post(
+        reverse("admin:workbench_xblockstate_change", args=[record.pk]), {"state": '{"answer": 42}'},
+    )
+    assert response.status_code == 302
+    record.refresh_from_db()
+    assert record.state == '{"answer": 42}'
+    assert record.version == 2
+    assert record.touched > now() - timedelta(minutes=1)
+
+
+def test_field_state_admin(client):
+    record = XBlockFieldState.objects.create(
+        scope="usage", scope_id="demo.problem.d0.u0", user_id="bob", scenario="demo", tag="problem",
+        field_name="answer", state='{"answer": "needle"}',
+    )
+    response = client.get(reverse("admin:workbench_xblockfieldstate_changelist"), {"q": "bob"})
+    assert response.status_code == 200
+    assert [record.field_name for record in response.context["cl"].result_list] == ["answer"]
+
+    response = client.get(reverse("admin:workbench_xblockfieldstate_change", args=[record.pk]))
+    assert response.status_code == 200
@@ -0,0 +1,26 @@
+"""Test the workbench application configuration."""
+
+
+from unittest import mock
+
+from workbench.apps import apply_sqlite_pragmas
+
+
+def test_sqlite_pragmas_are_applied():
+    connection = mock.MagicMock(vendor="sqlite")
+    cursor = connection.cursor.return_value.__enter__.return_value
+    with mock.patch.dict("django.conf.settings.WORKBENCH", {"sqlite_pragmas": {"journal_mode": "WAL"}}):
+        apply_sqlite_pragmas(None, connection)
+    cursor.execute.assert_called_once_with("PRAGMA journal_mode = WAL")
+
+
+def test_sqlite_pragmas_are_optional():
+    connection = mock.MagicMock(vendor="sqlite")
+    with mock.patch.dict("django.conf.settings.WORKBENCH", {"sqlite_pragmas": {}}):
+        apply_sqlite_pragmas(None, connection)
+    connection.cursor.assert_not_called()
+
+    connection = mock.MagicMock(vendor="postgresql")
+    with mock.patch.dict("django.conf.settings.WORKBENCH", {"sqlite_pragmas": {"journal_mode": "WAL"}}):
+        apply_sqlite_pragmas(None, connection)
+    connection.cursor.assert_not_called()
@@ -0,0 +1,318 @@
+"""Test the workbench management commands."""
+
+
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+import pytest
+from xblock.fields import Scope
+from xblock.runtime import KeyValueStore
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils.timezone import now
+
+from workbench import scenarios
+from workbench.models import XBlockFieldState, XBlockState, XBlockStateChange
+from workbench.runtime import WorkbenchDjangoKeyValueStore
+from workbench.state_codec import decode_state
+
+pytestmark = pytest.mark.django_db
+
+
+def make_rows():
+    """Create the state of two users in two scenarios, and a shared row."""
+    rows = [
+        XBlockState(
+            scope="usage", scope_id=f"{scenario}.html.d0.u0", user_id=user, scenario=scenario, tag="html",
+            state=json.dumps({"user": user, "scenario": scenario}),
+        )
+        for scenario in ("one", "two")
+        for user in ("alice", "bob")
+    ]
+    rows.append(XBlockState(scope="definition", scope_id="one.html.d0", scenario="one", tag="html", state='{"a":1}'))
+    XBlockState.objects.bulk_create(rows)
+
+
+def export_lines(*args):
+    """Run export_state with `args`, and return the lines it wrote."""
+    out = StringIO()
+    call_command("export_state", *args, stdout=out, stderr=StringIO())
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_export_import_round_trip(tmp_path):
+    make_rows()
+    snapshot = tmp_path / "snapshot.jsonl"
+    call_command("export_state", "--output", str(snapshot), "--chunk-size", "2", stderr=StringIO())
+    expected = list(XBlockState.objects.values_list("scope", "scope_id", "user_id", "scenario", "tag", "state"))
+
+    XBlockState.objects.all().delete()
+    out = StringIO()
+    call_command("import_state", str(snapshot), "--batch-size", "2", stdout=out)
+
+    assert "Imported 5 rows" in out.getvalue()
+    imported = XBlockState.objects.values_list("scope", "scope_id", "user_id", "scenario", "tag", "state")
+    assert [row[:5] + (decode_state(row[5]),) for row in imported] == [
+        row[:5] + (decode_state(row[5]),) for row in expected
+    ]
+
+
+def test_export_import_field_rows(tmp_path):
+    make_rows()
+    XBlockFieldState.objects.create(
+        scope="usage", scope_id="one.thumbs.d0.u0", user_id="alice", scenario="one", tag="thumbs",
+        field_name="upvotes", state=json.dumps({"upvotes": 3}),
+    )
+    assert export_lines("--user", "alice", "--scenario", "one")[-1] == {
+        "scope": "usage", "scope_id": "one.thumbs.d0.u0", "user_id": "alice", "scenario": "one", "tag": "thumbs",
+        "field_name": "upvotes", "state": {"upvotes": 3},
+    }
+
+    snapshot = tmp_path / "snapshot.jsonl"
+    call_command("export_state", "--output", str(snapshot), stderr=StringIO())
+    XBlockState.objects.all().delete()
+    XBlockFieldState.objects.all().delete()
+    out = StringIO()
+    call_command("import_state", str(snapshot), "--batch-size", "4", stdout=out)
+
+    assert "Imported 6 rows" in out.getvalue()
+    assert XBlockState.objects.count() == 5
+    record = XBlockFieldState.objects.get()
+    assert (record.scope_id, record.user_id, record.field_name) == ("one.thumbs.d0.u0", "alice", "upvotes")
+    assert decode_state(record.state) == {"upvotes": 3}
+
+
+def test_export_filters():
+    make_rows()
+    assert len(export_lines("--scenario", "one")) == 3
+    assert [line["state"] for line in export_lines("--scenario", "one", "--user", "bob")] == [
+        {"user": "bob", "scenario": "one"}
+    ]
+    assert [line["scope_id"] for line in export_lines("--scope", "definition")] == ["one.html.d0"]
+
+
+def test_import_filters(tmp_path):
+    make_rows()
+    snapshot = tmp_path / "snapshot.jsonl"
+    call_command("export_state", "--output", str(snapshot), stderr=StringIO())
+    XBlockState.objects.all().delete()
+
+    call_command("import_state", str(snapshot), "--user", "alice", stdout=StringIO())
+    assert sorted(XBlockState.objects.values_list("scenario", "user_id")) == [("one", "alice"), ("two", "alice")]
+
+
+def test_import_conflicts(tmp_path):
+    make_rows()
+    snapshot = tmp_path / "snapshot.jsonl"
+    call_command("export_state", "--output", str(snapshot), stderr=StringIO())
+    XBlockState.objects.filter(user_id="bob").delete()
+
+    with pytest.raises(CommandError):
+        call_command("import_state", str(snapshot), stdout=StringIO())
+    call_command("import_state", str(snapshot), "--ignore-conflicts", stdout=StringIO())
+    assert XBlockState.objects.count() == 5
+
+
+def test_gc_state():
+    live_id = scenarios.parse_scenarios()[1]["html_demo.0"].usage_id
+    rows = {
+        live_id: True,
+        f"{live_id}.thumbs_aside": True,
+        f"{live_id.rpartition('.')[0]}.u77": False,
+        "removed-scenario.html.d0.u0": False,
+        "removed-scenario.html.d0": False,
+    }
+    XBlockState.objects.bulk_create([
+        XBlockState(scope="usage", scope_id=scope_id, user_id="alice", state='{"a":1}') for scope_id in rows
+    ] + [XBlockState(scope="type", scope_id="html", user_id="alice", state='{}')])
+    count = XBlockState.objects.count()
+
+    out = StringIO()
+    call_command("gc_state", "--dry-run", stdout=out)
+    assert "Would delete 3 of" in out.getvalue()
+    assert "21 bytes" in out.getvalue()
+    assert XBlockState.objects.count() == count
+
+    call_command("gc_state", "--batch-size", "2", stdout=StringIO())
+    assert XBlockState.objects.count() == count - 3
+    assert set(XBlockState.objects.filter(user_id="alice").values_list("scope_id", flat=True)) == {
+        scope_id for scope_id, live in rows.items() if live
+    } | {"html"}
+
+
+@pytest.mark.parametrize("reset_state_on_restart", [False, True])
+def test_gc_state_dry_run_writes_nothing(reset_state_on_restart):
+    runtime, declared = scenarios.parse_scenarios()
+    definition_id = runtime.id_reader.get_definition_id(declared["html_demo.0"].usage_id)
+    WorkbenchDjangoKeyValueStore().set(
+        KeyValueStore.Key(Scope.content, None, definition_id, "content"), "<p>Edited</p>",
+    )
+    XBlockState.objects.create(scope="usage", scope_id="removed-scenario.html.d0.u0", user_id="alice", state="{}")
+    rows = list(XBlockState.objects.order_by("pk").values_list("pk", "scope_id", "state", "version", "touched"))
+
+    # Loading the scenarios, as when the workbench starts, would rewrite or clear the content rows.
+    with mock.patch.dict(scenarios.SCENARIOS, clear=True), \
+            mock.patch.object(scenarios.get_scenarios, "initialized", False), \
+            mock.patch.dict("django.conf.settings.WORKBENCH", {"reset_state_on_restart": reset_state_on_restart}):
+        out = StringIO()
+        call_command("gc_state", "--dry-run", stdout=out)
+
+    assert "Would delete 1 of" in out.getvalue()
+    assert list(
+        XBlockState.objects.order_by("pk").values_list("pk", "scope_id", "state", "version", "touched")
+    ) == rows
+
+
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_handler_uses_a_copy_of_the_scenario():
+    scenarios.get_scenarios()
+    rows = list(XBlockState.objects.order_by("pk").values_list("pk", "scope_id", "user_id", "state", "version"))
+
+    out = StringIO()
+    # One client thread: the in-memory test database locks tables against concurrent writers.
+    call_command("benchmark_storage", "--threads", "1", "--requests", "3", stdout=out)
+
+    assert "Handler requests: 3 in" in out.getvalue()
+    assert list(
+        XBlockState.objects.order_by("pk").values_list("pk", "scope_id", "user_id", "state", "version")
+    ) == rows
+    assert "benchmark-handler" not in scenarios.SCENARIOS
+
+
+def test_expire_state():
+    old = now() - timedelta(days=2)
+    XBlockState.objects.bulk_create([
+        XBlockState(scope="usage", scope_id="one.html.d0.u0", user_id="old", touched=old),
+        XBlockState(scope="type", scope_id="html", user_id="old", touched=old),
+        XBlockState(scope="usage", scope_id="one.html.d0.u0", user_id="new"),
+        # An active user keeps the rows they haven't written to lately.
+        XBlockState(scope="usage", scope_id="one.problem.d0.u0", user_id="new", state='{"answer": 42}', touched=old),
+        XBlockState(scope="usage", scope_id="one.html.d0.u0", user_id="fields", touched=old),
+        XBlockState(scope="usage", scope_id="one.html.d0.u0", touched=old),
+    ])
+    XBlockFieldState.objects.create(scope="usage", scope_id="one.html.d0.u0", user_id="fields", field_name="count")
+
+    with pytest.raises(CommandError):
+        call_command("expire_state", stdout=StringIO())
+
+    out = StringIO()
+    call_command("expire_state", "--ttl", str(24 * 3600), "--batch-size", "1", stdout=out)
+    assert "Expired 2 rows of 1 users" in out.getvalue()
+    assert set(XBlockState.objects.values_list("user_id", "scope_id")) == {
+        (None, "one.html.d0.u0"),
+        ("fields", "one.html.d0.u0"),
+        ("new", "one.html.d0.u0"),
+        ("new", "one.problem.d0.u0"),
+    }
+
+
+def test_migrate_field_storage():
+    XBlockState.objects.create(
+        scope="usage", scope_id="one.thumbs.d0.u0", user_id="alice", scenario="one", tag="thumbs",
+        state=json.dumps({"voted": True, "upvotes": 3}),
+    )
+    XBlockState.objects.create(
+        scope="usage", scope_id="one.html.d0.u0", user_id="alice", scenario="one", tag="html",
+        state=json.dumps({"upvotes": 1}),
+    )
+
+    out = StringIO()
+    call_command("migrate_field_storage", "--field", "thumbs.upvotes", "--field", "voted", stdout=out)
+    assert out.getvalue().strip() == "Moved 2 fields out of the blobs and 0 fields back into them."
+    assert sorted(
+        (record.tag, record.field_name, decode_state(record.state))
+        for record in XBlockFieldState.objects.all()
+    ) == [("thumbs", "upvotes", {"upvotes": 3}), ("thumbs", "voted", {"voted": True})]
+    # The emptied thumbs blob is gone, the html one is untouched.
+    assert [decode_state(record.state) for record in XBlockState.objects.all()] == [{"upvotes": 1}]
+
+    out = StringIO()
+    call_command("migrate_field_storage", "--field", "voted", stdout=out)
+    assert out.getvalue().strip() == "Moved 0 fields out of the blobs and 1 fields back into them."
+    assert decode_state(XBlockState.objects.get(tag="thumbs").state) == {"upvotes": 3}
+
+    # With nothing selected, everything goes back into the blobs.
+    call_command("migrate_field_storage", stdout=StringIO())
+    assert not XBlockFieldState.objects.exists()
+    assert decode_state(XBlockState.objects.get(tag="thumbs").state) == {"upvotes": 3, "voted": True}
+
+
+def test_migrate_field_storage_keeps_concurrent_changes():
+    blob = XBlockState.objects.create(
+        scope="usage", scope_id="one.thumbs.d0.u0", user_id="alice", scenario="one", tag="thumbs",
+        state=json.dumps({"voted": True, "upvotes": 3}),
+    )
+    real_decode = decode_state
+
+    def decode_during_a_write(state):
+        if json.loads(state) == {"voted": True, "upvotes": 3}:
+            # Another writer changes the blob after the command read it.
+            XBlockState.objects.filter(pk=blob.pk).update(state='{"voted": true, "upvotes": 4}', version=2)
+        return real_decode(state)
+
+    with mock.patch(
+        "workbench.management.commands.migrate_field_storage.decode_state", side_effect=decode_during_a_write,
+    ):
+        call_command("migrate_field_storage", "--field", "upvotes", stdout=StringIO())
+
+    assert decode_state(XBlockFieldState.objects.get(field_name="upvotes").state) == {"upvotes": 4}
+    blob.refresh_from_db()
+    assert (decode_state(blob.state), blob.version) == ({"voted": True}, 3)
+
+
+def test_state_changes():
+    kvs = WorkbenchDjangoKeyValueStore(change_log=True)
+    key = KeyValueStore.Key(Scope.user_state, "alice", "one.html.d0.u0", "count")
+    with kvs.unit_of_work():
+        kvs.set(key, 1)
+        kvs.set(key._replace(field_name="name"), "Alice")
+    kvs.increment(key)
+    kvs.delete(key._replace(field_name="name"))
+    kvs.clear_scenario("one")
+
+    changes = [change.as_dict() for change in XBlockStateChange.since()]
+    assert [(change["operation"], change["field_name"], change["value"]) for change in changes] == [
+        ("set", "count", 1),
+        ("set", "name", "Alice"),
+        ("set", "count", 2),
+        ("delete", "name", None),
+        ("clear", None, None),
+    ]
+    assert changes[0]["user_id"] == "alice" and changes[0]["scenario"] == "one"
+    assert changes[-1]["scenario"] == "one"
+
+    out = StringIO()
+    call_command("state_changes", "--since", str(changes[2]["seq"]), stdout=out)
+    assert [json.loads(line)["seq"] for line in out.getvalue().splitlines()] == [
+        change["seq"] for change in changes[3:]
+    ]
+
+    call_command("state_changes", "--prune-through", str(changes[2]["seq"]), stderr=StringIO())
+    assert [change.seq for change in XBlockStateChange.since()] == [change["seq"] for change in changes[3:]]
+
+
+def test_change_log_is_off_by_default():
+    WorkbenchDjangoKeyValueStore().set(KeyValueStore.Key(Scope.user_state, "alice", "one.html.d0.u0", "count"), 1)
+    assert not XBlockStateChange.objects.exists()
+
+
+def test_seed_state():
+    out = StringIO()
+    # The scenarios aren't loaded into the store, which would write their content rows.
+    with mock.patch.dict(scenarios.SCENARIOS, clear=True), \
+            mock.patch.object(scenarios.get_scenarios, "initialized", False):
+        call_command("seed_state", "--students", "3", "--batch-size", "7", "--seed", "1", stdout=out)
+    assert not XBlockState.objects.exclude(user_id__startswith="seed-student-").exists()
+    rows = XBlockState.objects.filter(user_id__startswith="seed-student-")
+    assert sorted(set(rows.values_list("user_id", flat=True))) == ["seed-student-0", "seed-student-1", "seed-student-2"]
+    assert out.getvalue().startswith(f"Seeded {rows.count()} rows for 3 students in ")
+
+    assert all(decode_state(state) for state in rows.values_list("state", flat=True))
+
+    # Seeding again keeps the rows, and the same seed generates the same values.
+    states = dict(rows.values_list("pk", "state"))
+    call_command("seed_state", "--students", "3", "--seed", "1", stdout=StringIO())
+    assert dict(rows.values_list("pk", "state")) == states
@@ -0,0 +1,362 @@
+"""
+Tests every workbench key-value store against the same `KeyValueStore` contract.
+"""
+
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+import pytest
+from xblock.fields import Scope
+from xblock.runtime import KeyValueStore
+
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from workbench.kvs import (CachedKeyValueStore, DbmKeyValueStore, FrozenContentKeyValueStore, MemoryKeyValueStore,
+                           load_kvs)
+from workbench.models import XBlockFieldState, XBlockState, XBlockStateChange
+from workbench.runtime import NormalizedFieldKeyValueStore, WorkbenchDjangoKeyValueStore
+
+
+def make_key(field_name="age", scope=Scope.user_state, block_scope_id="my_scenario.my_block.d0.u0", user_id="rusty"):
+    """Make a `KeyValueStore.Key`, with some sensible defaults."""
+    return KeyValueStore.Key(scope=scope, user_id=user_id, block_scope_id=block_scope_id, field_name=field_name)
+
+
+class KeyValueStoreContractMixin:
+    """
+    The behaviour every workbench key-value store must have.
+
+    Subclasses set up `self.kvs`.
+    """
+    kvs = None
+
+    def test_storage(self):
+        key = make_key()
+        self.assertFalse(self.kvs.has(key))
+        with self.assertRaises(KeyError):
+            self.kvs.get(key)
+        self.kvs.set(key, {"nested": [1, 2]})
+        self.assertTrue(self.kvs.has(key))
+        self.assertEqual(self.kvs.get(key), {"nested": [1, 2]})
+        self.kvs.delete(key)
+        self.assertFalse(self.kvs.has(key))
+        with self.assertRaises(KeyError):
+            self.kvs.delete(key)
+
+    def test_values_are_copies(self):
+        key = make_key()
+        value = {"items": [1]}
+        self.kvs.set(key, value)
+        value["items"].append(2)
+        self.kvs.get(key)["items"].append(3)
+        self.assertEqual(self.kvs.get(key), {"items": [1]})
+
+    def test_keys_are_independent(self):
+        keys = [
+            make_key(),
+            make_key(field_name="height"),
+            make_key(user_id="other"),
+            make_key(scope=Scope.content, block_scope_id="my_scenario.my_block.d0", user_id=None),
+            make_key(scope=Scope.preferences, block_scope_id="my_block"),
+            make_key(scope=Scope.user_info, block_scope_id=None),
+        ]
+        for i, key in enumerate(keys):
+            self.kvs.set(key, i)
+        for i, key in enumerate(keys):
+            self.assertEqual(self.kvs.get(key), i)
+
+    def test_many(self):
+        keys = [make_key(), make_key(field_name="height"), make_key(user_id="other")]
+        self.kvs.set_many({keys[0]: 1, keys[1]: 2})
+        self.assertEqual(self.kvs.get_many(keys), {keys[0]: 1, keys[1]: 2})
+        self.assertEqual(self.kvs.has_many(keys), {keys[0]: True, keys[1]: True, keys[2]: False})
+
+    def test_increment(self):
+        key = make_key(scope=Scope.user_state_summary, user_id=None)
+        self.assertEqual(self.kvs.increment(key), 1)
+        self.assertEqual(self.kvs.increment(key, 2), 3)
+        self.assertEqual(self.kvs.increment(make_key(field_name="other"), default=10), 11)
+        self.assertEqual(self.kvs.get(key), 3)
+
+    def test_unit_of_work(self):
+        key = make_key()
+        with self.kvs.unit_of_work():
+            self.kvs.set(key, 1)
+            self.assertEqual(self.kvs.get(key), 1)
+        self.kvs.flush()
+        self.assertEqual(self.kvs.get(key), 1)
+
+    def test_clear(self):
+        self.kvs.set(make_key(), 1)
+        self.kvs.clear()
+        self.assertFalse(self.kvs.has(make_key()))
+
+    def test_clear_scenario(self):
+        keys = [
+            make_key(),
+            make_key(scope=Scope.content, block_scope_id="my_scenario.my_block.d0", user_id=None),
+            make_key(block_scope_id="my_scenario_2.my_block.d0.u0"),
+            make_key(scope=Scope.preferences, block_scope_id="my_block"),
+            make_key(scope=Scope.user_info, block_scope_id=None),
+        ]
+        for key in keys:
+            self.kvs.set(key, 1)
+        self.kvs.clear_scenario("my_scenario")
+        self.assertEqual([self.kvs.has(key) for key in keys], [False, False, True, True, True])
+
+    def test_prep_for_scenario_loading(self):
+        children = make_key(scope=Scope.children, field_name="children", user_id=None)
+        content = make_key(scope=Scope.content, block_scope_id="my_scenario.my_block.d0", user_id=None)
+        self.kvs.set(children, ["a"])
+        self.kvs.set(content, "text")
+        self.kvs.prep_for_scenario_loading()
+        self.assertFalse(self.kvs.has(children))
+        self.assertEqual(self.kvs.get(content), "text")
+
+
+@pytest.mark.django_db
+class TestDjangoKeyValueStore(KeyValueStoreContractMixin, TestCase):
+    """The Django model backed store."""
+
+    def setUp(self):
+        super().setUp()
+        self.kvs = WorkbenchDjangoKeyValueStore()
+
+
+class TestMemoryKeyValueStore(KeyValueStoreContractMixin, TestCase):
+    """The in-memory store."""
+
+    def setUp(self):
+        super().setUp()
+        self.kvs = MemoryKeyValueStore()
+
+
+class TestDbmKeyValueStore(KeyValueStoreContractMixin, TestCase):
+    """The dbm file backed store."""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.kvs = DbmKeyValueStore(os.path.join(directory, "state"))
+        self.addCleanup(self.kvs.close)
+
+    def test_persistence(self):
+        self.kvs.set(make_key(), 7)
+        self.kvs.close()
+        self.kvs = DbmKeyValueStore(self.kvs.path)
+        self.assertEqual(self.kvs.get(make_key()), 7)
+
+
+class TestCachedKeyValueStore(KeyValueStoreContractMixin, TestCase):
+    """The Django cache in front of the in-memory store, caching every scope."""
+
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        self.kvs = CachedKeyValueStore(
+            "workbench.kvs.MemoryKeyValueStore",
+            scopes=[scope.name for scope in Scope.scopes()] + ["children", "parent"],
+        )
+
+    def test_reads_are_cached(self):
+        key = make_key()
+        self.kvs.set(key, 7)
+        self.assertEqual(self.kvs.get(key), 7)
+        self.assertFalse(self.kvs.has(make_key(field_name="height")))
+
+        with mock.patch.object(self.kvs.store, "get_many") as get_many:
+            self.assertEqual(self.kvs.get(key), 7)
+            self.assertFalse(self.kvs.has(make_key(field_name="height")))
+        get_many.assert_not_called()
+
+    def test_writes_invalidate_after_unit_of_work(self):
+        key = make_key()
+        self.kvs.set(key, 7)
+        self.assertEqual(self.kvs.get(key), 7)
+        with self.kvs.unit_of_work():
+            self.kvs.set(key, 8)
+            self.assertEqual(self.kvs.get(key), 8)
+            # The cache still has the old value until the unit of work ends.
+            self.assertEqual(caches["default"].get(self.kvs._cache_key(key)), 7)  # pylint: disable=protected-access
+        self.assertEqual(self.kvs.get(key), 8)
+        self.kvs.increment(key)
+        self.assertEqual(self.kvs.get(key), 9)
+
+    def test_only_configured_scopes_are_cached(self):
+        kvs = CachedKeyValueStore("workbench.kvs.MemoryKeyValueStore", scopes=["content"])
+        content = make_key(scope=Scope.content, block_scope_id="my_scenario.my_block.d0", user_id=None)
+        kvs.set_many({content: "text", make_key(): 7})
+        kvs.get_many([content, make_key()])
+
+        with mock.patch.object(kvs.store, "get_many", return_value={}) as get_many:
+            self.assertEqual(kvs.get_many([content, make_key()]), {content: "text"})
+        get_many.assert_called_once_with([make_key()])
+
+    def test_children_and_parent_are_cached(self):
+        kvs = CachedKeyValueStore("workbench.kvs.MemoryKeyValueStore", scopes=["children", "parent"])
+        keys = [
+            make_key(scope=Scope.children, field_name="children", user_id=None),
+            make_key(scope=Scope.parent, field_name="parent", user_id=None),
+        ]
+        kvs.set_many({keys[0]: ["a"], keys[1]: "b"})
+        kvs.get_many(keys)
+
+        with mock.patch.object(kvs.store, "get_many") as get_many:
+            self.assertEqual(kvs.get_many(keys), {keys[0]: ["a"], keys[1]: "b"})
+        get_many.assert_not_called()
+
+
+@pytest.mark.django_db
+class TestCachedDjangoKeyValueStore(KeyValueStoreContractMixin, TestCase):
+    """The Django cache in front of the Django model backed store, with the default scopes."""
+
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        self.kvs = CachedKeyValueStore()
+
+
+@pytest.mark.django_db
+class TestNormalizedFieldKeyValueStore(KeyValueStoreContractMixin, TestCase):
+    """Every field in a row of its own."""
+
+    def setUp(self):
+        super().setUp()
+        self.kvs = NormalizedFieldKeyValueStore(block_types=["*"])
+
+    def test_fields_have_rows(self):
+        self.kvs.set_many({make_key(): 1, make_key(field_name="height"): 2})
+        self.assertEqual(XBlockFieldState.objects.count(), 2)
+        self.assertEqual(XBlockState.objects.count(), 0)
+
+    def test_failed_unit_of_work_writes_nothing(self):
+        self.kvs.set(make_key(), 1)
+        with self.assertRaises(ValueError):
+            with self.kvs.unit_of_work():
+                self.kvs.set_many({make_key(): 2, make_key(field_name="height"): 3})
+                self.kvs.delete(make_key())
+                self.assertFalse(self.kvs.has(make_key()))
+                self.assertEqual(self.kvs.get(make_key(field_name="height")), 3)
+                raise ValueError
+        self.assertEqual(list(XBlockFieldState.objects.values_list("field_name", flat=True)), ["age"])
+        self.assertEqual(self.kvs.get(make_key()), 1)
+
+    def test_prefetched_fields_are_read_with_one_query(self):
+        keys = [
+            make_key(),
+            make_key(field_name="height"),
+            make_key(scope=Scope.content, block_scope_id="my_scenario.my_block.d0", user_id=None),
+            make_key(scope=Scope.preferences, block_scope_id="my_block"),
+        ]
+        self.kvs.set_many({key: i for i, key in enumerate(keys)})
+        with self.kvs.unit_of_work():
+            with CaptureQueriesContext(connection) as queries:
+                self.kvs.prefetch_scenario("my_scenario", "rusty")
+            prefetch_queries = len(queries.captured_queries)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual([self.kvs.get(key) for key in keys], [0, 1, 2, 3])
+                self.assertFalse(self.kvs.has(make_key(field_name="weight")))
+            self.assertEqual(queries.captured_queries, [])
+        # One query for the blobs of the wrapped store, and one for the field rows.
+        self.assertEqual(prefetch_queries, 2)
+
+
+@pytest.mark.django_db
+class TestSelectedFieldKeyValueStore(KeyValueStoreContractMixin, TestCase):
+    """Some fields in rows of their own, the others in blobs."""
+
+    def setUp(self):
+        super().setUp()
+        self.kvs = NormalizedFieldKeyValueStore(fields=["age", "my_block.other"], block_types=["type_block"])
+
+    def test_selection(self):
+        selected = [
+            make_key(),
+            make_key(field_name="other"),
+            make_key(scope=Scope.preferences, block_scope_id="type_block", field_name="height"),
+        ]
+        unselected = [
+            make_key(field_name="height"),
+            make_key(field_name="other", block_scope_id="my_scenario.their_block.d0.u0"),
+        ]
+        self.kvs.set_many({key: 1 for key in selected + unselected})
+        self.assertEqual(
+            sorted(XBlockFieldState.objects.values_list("field_name", flat=True)), ["age", "height", "other"],
+        )
+        self.assertEqual(self.kvs.get_many(selected + unselected), {key: 1 for key in selected + unselected})
+        self.assertEqual([self.kvs.is_normalized(key) for key in unselected], [False, False])
+
+    def test_change_log(self):
+        kvs = NormalizedFieldKeyValueStore(store={
+            'backend': 'workbench.runtime.WorkbenchDjangoKeyValueStore', 'options': {'change_log': True},
+        }, fields=["age"], change_log=True)
+        kvs.set_many({make_key(): 1, make_key(field_name="height"): 2})
+        kvs.increment(make_key())
+        kvs.delete(make_key())
+        self.assertEqual(
+            [(change.operation, change.field_name, change.value) for change in XBlockStateChange.since()],
+            [("set", "height", "2"), ("set", "age", "1"), ("set", "age", "2"), ("delete", "age", None)],
+        )
+
+
+class TestFrozenContentKeyValueStore(KeyValueStoreContractMixin, TestCase):
+    """Content kept in this process, in front of the in-memory store."""
+
+    def setUp(self):
+        super().setUp()
+        self.kvs = FrozenContentKeyValueStore("workbench.kvs.MemoryKeyValueStore")
+
+    def test_content_values_are_copies(self):
+        key = make_key(scope=Scope.settings, block_scope_id="my_scenario.my_block.d0", user_id=None)
+        self.kvs.set(key, {"items": [1]})
+        self.kvs.get(key)["items"].append(2)
+        self.assertEqual(self.kvs.get(key), {"items": [1]})
+
+    def test_only_user_data_reaches_the_store(self):
+        content = [
+            make_key(scope=Scope.content, block_scope_id="my_scenario.my_block.d0", user_id=None),
+            make_key(scope=Scope.children, field_name="children", user_id=None),
+            make_key(scope=Scope.parent, field_name="parent", user_id=None),
+        ]
+        self.kvs.set_many({**{key: "value" for key in content}, make_key(): 7})
+        self.assertEqual(self.kvs.store.has_many(content), {key: False for key in content})
+        self.assertEqual(self.kvs.store.get(make_key()), 7)
+
+
+@pytest.mark.django_db
+class TestFrozenContentDjangoKeyValueStore(KeyValueStoreContractMixin, TestCase):
+    """Content kept in this process, in front of the Django model backed store."""
+
+    def setUp(self):
+        super().setUp()
+        self.kvs = FrozenContentKeyValueStore()
+
+    def test_content_reads_skip_the_database(self):
+        content = make_key(scope=Scope.content, block_scope_id="my_scenario.my_block.d0", user_id=None)
+        self.kvs.set(content, "text")
+        self.assertFalse(XBlockState.objects.exists())
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.kvs.get(content), "text")
+        self.assertEqual(queries.captured_queries, [])
+
+
+class TestLoadKvs(TestCase):
+    """Loading the store configured in settings."""
+
+    def test_load_by_path(self):
+        self.assertIsInstance(load_kvs("workbench.kvs.MemoryKeyValueStore"), MemoryKeyValueStore)
+
+    def test_load_with_options(self):
+        with mock.patch("workbench.kvs.dbm.open") as dbm_open:
+            kvs = load_kvs({"backend": "workbench.kvs.DbmKeyValueStore", "options": {"path": "some/file"}})
+        self.assertIsInstance(kvs, DbmKeyValueStore)
+        dbm_open.assert_called_once_with("some/file", "c")
+
+    def test_default_backend(self):
+        self.assertIsInstance(load_kvs({}), WorkbenchDjangoKeyValueStore)
@@ -0,0 +1,126 @@
+"""Test the metrics registry and the metrics of the key-value stores."""
+
+
+from unittest import TestCase
+
+import pytest
+from xblock.fields import Scope
+from xblock.runtime import KeyValueStore
+
+from workbench.kvs import BYTES_READ, BYTES_WRITTEN, OPERATION_SECONDS, OPERATIONS, MemoryKeyValueStore
+from workbench.metrics import MetricsRegistry
+from workbench.runtime import WorkbenchDjangoKeyValueStore
+
+
+def make_key(field_name="age", scope=Scope.user_state, block_scope_id="my_scenario.my_block.d0.u0", user_id="rusty"):
+    """Make a `KeyValueStore.Key`."""
+    return KeyValueStore.Key(scope=scope, user_id=user_id, block_scope_id=block_scope_id, field_name=field_name)
+
+
+class TestMetricsRegistry(TestCase):
+    """
+    Test counters and histograms, and reading them from a registry.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.registry = MetricsRegistry()
+
+    def test_counter(self):
+        counter = self.registry.counter("things_total", "Things.")
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+        counter.inc(kind="b")
+        self.assertEqual(counter.value(kind="a"), 3)
+        self.assertEqual(counter.value(kind="b"), 1)
+        self.assertEqual(counter.value(kind="c"), 0)
+        self.assertIs(self.registry.counter("things_total", "Things."), counter)
+
+    def test_kind_mismatch(self):
+        self.registry.counter("things_total", "Things.")
+        with self.assertRaises(ValueError):
+            self.registry.histogram("things_total", "Things.")
+
+    def test_histogram(self):
+        histogram = self.registry.histogram("duration_seconds", "Durations.", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, op="get")
+        [(labels, sample)] = histogram.samples()
+        self.assertEqual(labels, {"op": "get"})
+        self.assertEqual(sample["count"], 3)
+        self.assertAlmostEqual(sample["sum"], 5.55)
+        self.assertEqual(sample["buckets"], {"0.1": 1, "1": 2, "+Inf": 3})
+
+    def test_as_dict(self):
+        self.registry.counter("things_total", "Things.").inc(kind="a")
+        self.assertEqual(self.registry.as_dict(), {
+            "things_total": {
+                "type": "counter",
+                "help": "Things.",
+                "samples": [{"labels": {"kind": "a"}, "value": 1}],
+            },
+        })
+
+    def test_as_prometheus_text(self):
+        self.registry.counter("things_total", "Things.").inc(kind='say "hi"')
+        self.registry.histogram("duration_seconds", "Durations.", buckets=(1,)).observe(0.5)
+        self.assertEqual(self.registry.as_prometheus_text().splitlines(), [
+            "# HELP duration_seconds Durations.",
+            "# TYPE duration_seconds histogram",
+            'duration_seconds_bucket{le="1"} 1',
+            'duration_seconds_bucket{le="+Inf"} 1',
+            "duration_seconds_sum 0.5",
+            "duration_seconds_count 1",
+            "# HELP things_total Things.",
+            "# TYPE things_total counter",
+            'things_total{kind="say \\"hi\\""} 1',
+        ])
+
+    def test_reset(self):
+        counter = self.registry.counter("things_total", "Things.")
+        counter.inc()
+        self.registry.reset()
+        self.assertEqual(counter.value(), 0)
+
+
+class TestKvsMetrics(TestCase):
+    """
+    Test that the key-value stores count their operations.
+    """
+
+    def test_operations_are_counted(self):
+        kvs = MemoryKeyValueStore()
+        before = OPERATIONS.value(store="MemoryKeyValueStore", op="set")
+        kvs.set(make_key(), 7)
+        kvs.get(make_key())
+        self.assertEqual(OPERATIONS.value(store="MemoryKeyValueStore", op="set"), before + 1)
+        self.assertTrue(any(
+            labels == {"store": "MemoryKeyValueStore", "op": "get"} and sample["count"]
+            for labels, sample in OPERATION_SECONDS.samples()
+        ))
+
+    def test_failed_operations_are_counted(self):
+        kvs = MemoryKeyValueStore()
+        before = OPERATIONS.value(store="MemoryKeyValueStore", op="get")
+        with self.assertRaises(KeyError):
+            kvs.get(make_key())
+        self.assertEqual(OPERATIONS.value(store="MemoryKeyValueStore", op="get"), before + 1)
+
+
+@pytest.mark.django_db
+class TestDjangoKvsMetrics(TestCase):
+    """
+    Test the bytes counted by the Django model backed store.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.kvs = WorkbenchDjangoKeyValueStore(shared_cache_size=0)
+
+    def test_bytes_per_scope(self):
+        written = BYTES_WRITTEN.value(scope="usage")
+        read = BYTES_READ.value(scope="usage")
+        self.kvs.set(make_key(), 7)
+        self.assertGreater(BYTES_WRITTEN.value(scope="usage"), written)
+        self.assertEqual(self.kvs.get(make_key()), 7)
+        self.assertGreater(BYTES_READ.value(scope="usage"), read)
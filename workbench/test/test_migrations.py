@@ -0,0 +1,37 @@
+"""Test the workbench data migrations."""
+
+
+import pytest
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+
+from workbench.models import XBlockState
+from workbench.state_codec import decode_state
+
+
+def migrate(target):
+    """Migrate the workbench app to `target` and return the resulting app registry."""
+    executor = MigrationExecutor(connection)
+    executor.migrate([("workbench", target)])
+    executor.loader.build_graph()
+    return executor.loader.project_state([("workbench", target)]).apps
+
+
+@pytest.mark.django_db(transaction=True)
+def test_duplicate_rows_are_merged():
+    latest = MigrationExecutor(connection).loader.graph.leaf_nodes("workbench")[0][1]
+    old_apps = migrate("0001_initial")
+    try:
+        OldXBlockState = old_apps.get_model("workbench", "XBlockState")
+        key = {"scope": "usage", "scope_id": "s.thumbs.d0.u0", "user_id": "student_1"}
+        OldXBlockState.objects.create(state='{"upvotes": 1, "voted": true}', **key)
+        OldXBlockState.objects.create(state='{"upvotes": 2}', **key)
+        OldXBlockState.objects.create(state='{"upvotes": 5}', **dict(key, user_id=None))
+    finally:
+        migrate(latest)
+
+    merged = XBlockState.objects.get(**key)
+    assert XBlockState.objects.count() == 2
+    assert XBlockState.objects.filter(**key).count() == 1
+    assert decode_state(merged.state) == {"upvotes": 2, "voted": True}
@@ -1,6 +1,9 @@
 """Test Workbench Runtime"""
 
 
+import threading
+import time
+from datetime import timedelta
 from unittest import TestCase, mock
 
 import pytest
@@ -9,8 +12,14 @@ from xblock.reference.user_service import UserService
 from xblock.runtime import KeyValueStore, KvsFieldData
 
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
 
-from ..runtime import ScenarioIdManager, WorkbenchDjangoKeyValueStore, WorkbenchRuntime
+from ..kvs import BYTES_READ
+from ..models import XBlockState
+from ..runtime import (ScenarioIdManager, StateConflictError, WorkbenchCounterService, WorkbenchDjangoKeyValueStore,
+                       WorkbenchRuntime)
 
 
 class TestScenarioIds(TestCase):
@@ -87,6 +96,34 @@ class TestScenarioIds(TestCase):
         self.assertEqual(self.id_mgr.get_aside_type_from_usage(aside_usage), "my_aside")
         self.assertEqual(self.id_mgr.get_usage_id_from_aside(aside_usage), usage_id)
 
+    def test_is_known_id(self):
+        self.id_mgr.set_scenario("my_scenario")
+        definition_id = self.id_mgr.create_definition("my_block")
+        usage_id = self.id_mgr.create_usage(definition_id)
+
+        self.assertTrue(self.id_mgr.is_known_id(definition_id))
+        self.assertTrue(self.id_mgr.is_known_id(usage_id))
+        self.assertTrue(self.id_mgr.is_known_id(f"{usage_id}.my_aside"))
+        self.assertFalse(self.id_mgr.is_known_id("my_scenario.my_block.d0.u1"))
+        self.assertFalse(self.id_mgr.is_known_id("my_scenario.my_block.d1"))
+        self.assertFalse(self.id_mgr.is_known_id("other_scenario.my_block.d0.u0.my_aside"))
+
+    def test_clear_scenario(self):
+        self.id_mgr.set_scenario("my_scenario")
+        definition_id = self.id_mgr.create_definition("my_block")
+        self.id_mgr.create_usage(definition_id)
+        self.id_mgr.set_scenario("another_scenario")
+        another_definition_id = self.id_mgr.create_definition("my_block")
+
+        self.id_mgr.clear_scenario("my_scenario")
+        self.id_mgr.set_scenario("my_scenario")
+        self.assertEqual(self.id_mgr.create_definition("my_block"), definition_id)
+        self.assertEqual(self.id_mgr.create_usage(definition_id), "my_scenario.my_block.d0.u0")
+        self.assertEqual(self.id_mgr.get_definition_id("my_scenario.my_block.d0.u0"), definition_id)
+        self.id_mgr.set_scenario("another_scenario")
+        self.assertEqual(another_definition_id, "another_scenario.my_block.d0")
+        self.assertEqual(self.id_mgr.create_definition("my_block"), "another_scenario.my_block.d1")
+
 
 class WorkbenchRuntimeTests(TestCase):
     """
@@ -132,6 +169,474 @@ class TestKVStore(TestCase):
         self.kvs.delete(self.key)
         self.assertFalse(self.kvs.has(self.key))
 
+    @pytest.mark.django_db
+    def test_unit_of_work_writes_rows_once(self):
+        other_key = self.key._replace(field_name="height")
+        with CaptureQueriesContext(connection) as queries:
+            with self.kvs.unit_of_work():
+                self.kvs.set(self.key, 7)
+                self.kvs.set(other_key, 120)
+                self.assertEqual(self.kvs.get(self.key), 7)
+                # Nothing has been written yet.
+                self.assertIsNone(XBlockState.find_for_key(self.key))
+
+        writes = [query for query in queries.captured_queries if query["sql"].startswith(("INSERT", "UPDATE"))]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(self.kvs.get(self.key), 7)
+        self.assertEqual(self.kvs.get(other_key), 120)
+
+    @pytest.mark.django_db
+    def test_many_reads_and_writes_each_row_once(self):
+        user_key = self.key._replace(scope=Scope.user_state, block_scope_id="my_scenario.my_block.d0.u0")
+        self.kvs.set_many({self.key: 7, user_key: "x"})
+
+        keys = [self.key, self.key._replace(field_name="height"), user_key]
+        with CaptureQueriesContext(connection) as queries:
+            self.kvs.set_many({key: 1 for key in keys})
+        statements = [query["sql"].split()[0] for query in queries.captured_queries]
+        self.assertEqual(statements.count("SELECT"), 1)
+        self.assertEqual(statements.count("UPDATE"), 2)
+
+        self.kvs.delete(keys[1])
+        self.assertEqual(self.kvs.get_many(keys), {self.key: 1, user_key: 1})
+        self.assertEqual(self.kvs.has_many(keys), {self.key: True, keys[1]: False, user_key: True})
+
+    @pytest.mark.django_db
+    def test_reads_do_not_create_rows(self):
+        self.assertFalse(self.kvs.has(self.key))
+        with self.assertRaises(KeyError):
+            self.kvs.get(self.key)
+        self.assertEqual(self.kvs.get_many([self.key]), {})
+        self.assertFalse(XBlockState.objects.exists())
+
+        # Writing and then removing a field in the same unit of work leaves no row either.
+        with self.kvs.unit_of_work():
+            self.kvs.set(self.key, 7)
+            self.kvs.delete(self.key)
+        self.assertFalse(XBlockState.objects.exists())
+
+        self.kvs.set(self.key, 7)
+        self.assertEqual(XBlockState.objects.count(), 1)
+
+    @pytest.mark.django_db
+    def test_concurrent_first_writes_are_merged(self):
+        other_kvs = WorkbenchDjangoKeyValueStore()
+        with self.kvs.unit_of_work():
+            self.assertFalse(self.kvs.has(self.key))
+            self.kvs.set(self.key, 7)
+            # Another request creates the row before we flush.
+            other_kvs.set(self.key._replace(field_name="height"), 120)
+
+        self.assertEqual(XBlockState.objects.count(), 1)
+        self.assertEqual(self.kvs.get(self.key), 7)
+        self.assertEqual(self.kvs.get(self.key._replace(field_name="height")), 120)
+
+    @pytest.mark.django_db
+    def test_concurrent_writes_to_other_fields_are_kept(self):
+        height_key = self.key._replace(field_name="height")
+        self.kvs.set_many({self.key: 7, height_key: 120})
+        conflicts = self.kvs.conflicts
+
+        with self.kvs.unit_of_work():
+            self.kvs.set(self.key, 8)
+            # Another request changes the row before we flush.
+            WorkbenchDjangoKeyValueStore().set(height_key, 121)
+
+        self.assertEqual(self.kvs.get(self.key), 8)
+        self.assertEqual(self.kvs.get(height_key), 121)
+        self.assertEqual(self.kvs.conflicts, conflicts + 1)
+        self.assertEqual(XBlockState.find_for_key(self.key).version, 3)
+
+    @pytest.mark.django_db
+    def test_retries_are_bounded(self):
+        self.kvs.set(self.key, 7)
+        with mock.patch("django.db.models.query.QuerySet.update", return_value=0):
+            with self.assertRaises(StateConflictError):
+                self.kvs.set(self.key, 8)
+        self.assertEqual(self.kvs.get(self.key), 7)
+
+    @pytest.mark.django_db
+    def test_increment(self):
+        self.assertEqual(self.kvs.increment(self.key), 1)
+        self.assertEqual(self.kvs.increment(self.key, 5), 6)
+        self.assertEqual(self.kvs.increment(self.key._replace(field_name="height"), 1, default=100), 101)
+        self.assertEqual(self.kvs.get(self.key), 6)
+
+    @pytest.mark.django_db
+    def test_increment_retries_after_concurrent_update(self):
+        self.kvs.set(self.key, 1)
+        stale_record = XBlockState.find_for_key(self.key)
+        # Another request increments the counter between our read and our write.
+        WorkbenchDjangoKeyValueStore().increment(self.key)
+
+        with mock.patch.object(
+            XBlockState, "find_for_key", side_effect=[stale_record, XBlockState.find_for_key(self.key)]
+        ):
+            self.assertEqual(self.kvs.increment(self.key), 3)
+        self.assertEqual(self.kvs.get(self.key), 3)
+
+    @pytest.mark.django_db
+    def test_increment_updates_unit_of_work(self):
+        with self.kvs.unit_of_work():
+            self.kvs.set(self.key._replace(field_name="height"), 120)
+            self.assertEqual(self.kvs.increment(self.key, 2), 2)
+            self.assertEqual(self.kvs.get(self.key), 2)
+        self.assertEqual(self.kvs.get(self.key), 2)
+        self.assertEqual(self.kvs.get(self.key._replace(field_name="height")), 120)
+
+    @pytest.mark.django_db
+    def test_increment_applies_to_pending_changes(self):
+        self.kvs.set(self.key, 5)
+        with self.kvs.unit_of_work():
+            self.kvs.set(self.key, 10)
+            self.assertEqual(self.kvs.increment(self.key), 11)
+            self.assertEqual(self.kvs.get(self.key), 11)
+        self.assertEqual(self.kvs.get(self.key), 11)
+
+    @pytest.mark.django_db
+    def test_increment_keeps_the_version_of_the_unit_of_work(self):
+        self.kvs.set(self.key, 1)
+        conflicts = self.kvs.conflicts
+        with self.kvs.unit_of_work():
+            self.kvs.get(self.key)
+            self.kvs.increment(self.key)
+            self.kvs.set(self.key._replace(field_name="height"), 120)
+        self.assertEqual(self.kvs.conflicts, conflicts)
+        self.assertEqual(self.kvs.get(self.key), 2)
+        self.assertEqual(self.kvs.get(self.key._replace(field_name="height")), 120)
+
+    @pytest.mark.django_db
+    def test_increment_after_prefetch(self):
+        with self.kvs.unit_of_work():
+            self.kvs.prefetch_scenario("my_scenario", "rusty")
+            self.assertEqual(self.kvs.increment(self.key), 1)
+            self.assertTrue(self.kvs.has(self.key))
+            self.assertEqual(self.kvs.get(self.key), 1)
+            self.kvs.set(self.key._replace(field_name="height"), 120)
+        self.assertEqual(self.kvs.get(self.key), 1)
+        self.assertEqual(self.kvs.get(self.key._replace(field_name="height")), 120)
+
+    @pytest.mark.django_db
+    def test_writes_touch_rows(self):
+        self.kvs.set(self.key, 1)
+        XBlockState.objects.update(touched=now() - timedelta(days=2))
+        self.kvs.set(self.key, 2)
+        self.assertGreater(XBlockState.find_for_key(self.key).touched, now() - timedelta(minutes=1))
+
+        XBlockState.objects.update(touched=now() - timedelta(days=2))
+        self.kvs.increment(self.key._replace(field_name="count"))
+        self.assertGreater(XBlockState.find_for_key(self.key).touched, now() - timedelta(minutes=1))
+
+    @pytest.mark.django_db
+    def test_known_users_are_bounded(self):
+        with mock.patch.object(WorkbenchDjangoKeyValueStore, "MAX_KNOWN_USERS", 2):
+            kvs = WorkbenchDjangoKeyValueStore()
+        user_key = self.key._replace(scope=Scope.user_state, block_scope_id="my_scenario.my_block.d0.u0")
+        with mock.patch.object(XBlockState, "user_ids_changed") as user_ids_changed:
+            for user_id in ("alice", "bob", "carol"):
+                kvs.set(user_key._replace(user_id=user_id), 1)
+            self.assertEqual(user_ids_changed.call_count, 3)
+            # Alice was forgotten, so her next row counts as her first again; Carol is still known.
+            for user_id in ("alice", "carol"):
+                kvs.set(user_key._replace(user_id=user_id, block_scope_id="my_scenario.my_block.d1.u0"), 1)
+            self.assertEqual(user_ids_changed.call_count, 4)
+
+    @pytest.mark.django_db
+    def test_unit_of_work_discards_changes_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.kvs.unit_of_work():
+                self.kvs.set(self.key, 7)
+                raise ValueError()
+        self.assertFalse(self.kvs.has(self.key))
+
+
+class TestSharedStateCache(TestCase):
+    """
+    Test the cache of shared rows of the Workbench KVP Store
+    """
+    def setUp(self):
+        super().setUp()
+        self.kvs = WorkbenchDjangoKeyValueStore(validate_shared_cache=False)
+        self.key = KeyValueStore.Key(
+            scope=Scope.content, user_id=None, block_scope_id="my_scenario.my_block.d0", field_name="data",
+        )
+
+    @pytest.mark.django_db
+    def test_shared_rows_are_cached(self):
+        user_key = self.key._replace(
+            scope=Scope.user_state, user_id="rusty", block_scope_id="my_scenario.my_block.d0.u0",
+        )
+        WorkbenchDjangoKeyValueStore().set_many({self.key: {"items": [1]}, user_key: 1})
+
+        self.assertEqual(self.kvs.get(self.key), {"items": [1]})
+        with CaptureQueriesContext(connection) as queries:
+            value = self.kvs.get(self.key)
+            self.assertEqual(self.kvs.get(user_key), 1)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual((self.kvs.shared_cache.hits, self.kvs.shared_cache.misses), (1, 1))
+
+        # Changing the value we got doesn't change the cache.
+        value["items"].append(2)
+        self.assertEqual(self.kvs.get(self.key), {"items": [1]})
+
+    @pytest.mark.django_db
+    def test_writes_invalidate(self):
+        self.kvs.set(self.key, "old")
+        self.assertEqual(self.kvs.get(self.key), "old")
+        self.kvs.set(self.key, "new")
+        self.assertEqual(self.kvs.get(self.key), "new")
+        self.kvs.increment(self.key._replace(field_name="count"))
+        self.assertEqual(self.kvs.get(self.key._replace(field_name="count")), 1)
+        self.kvs.clear()
+        self.assertFalse(self.kvs.has(self.key))
+
+    @pytest.mark.django_db
+    def test_rows_read_before_a_write_are_not_cached(self):
+        self.kvs.set(self.key, "old")
+        put = self.kvs.shared_cache.put
+
+        def put_after_a_write(row_key, *args):
+            # Another thread saves the row after we read it, but before we cache it.
+            WorkbenchDjangoKeyValueStore(shared_cache_size=0).set(self.key, "new")
+            self.kvs.shared_cache.invalidate(row_key)
+            put(row_key, *args)
+
+        with mock.patch.object(self.kvs.shared_cache, "put", side_effect=put_after_a_write):
+            self.assertEqual(self.kvs.get(self.key), "old")
+        self.assertEqual(self.kvs.get(self.key), "new")
+
+    @pytest.mark.django_db
+    def test_prefetch_reads_cached_rows_by_version(self):
+        user_key = self.key._replace(
+            scope=Scope.user_state, user_id="rusty", block_scope_id="my_scenario.my_block.d0.u0",
+        )
+        WorkbenchDjangoKeyValueStore().set_many({self.key: {"items": [1]}, user_key: 1})
+        with self.kvs.unit_of_work():
+            self.kvs.prefetch_scenario("my_scenario", "rusty")
+
+        shared_bytes = BYTES_READ.value(scope=XBlockState.key_fields(self.key)["scope"])
+        with CaptureQueriesContext(connection) as queries:
+            with self.kvs.unit_of_work():
+                self.kvs.prefetch_scenario("my_scenario", "rusty")
+                self.assertEqual(self.kvs.get(self.key), {"items": [1]})
+                self.assertEqual(self.kvs.get(user_key), 1)
+        self.assertEqual(len(queries.captured_queries), 2)
+        self.assertEqual(self.kvs.shared_cache.hits, 1)
+        self.assertEqual(BYTES_READ.value(scope=XBlockState.key_fields(self.key)["scope"]), shared_bytes)
+
+        # A changed row is read again.
+        WorkbenchDjangoKeyValueStore(shared_cache_size=0).set(self.key, {"items": [2]})
+        with self.kvs.unit_of_work():
+            self.kvs.prefetch_scenario("my_scenario", "rusty")
+            self.assertEqual(self.kvs.get(self.key), {"items": [2]})
+
+    @pytest.mark.django_db
+    def test_validation_notices_other_writers(self):
+        kvs = WorkbenchDjangoKeyValueStore()
+        kvs.set(self.key, "old")
+        self.assertEqual(kvs.get(self.key), "old")
+        # Another process changes the row.
+        WorkbenchDjangoKeyValueStore(shared_cache_size=0).set(self.key, "new")
+
+        self.assertEqual(kvs.get(self.key), "new")
+        self.assertEqual(self.kvs.get(self.key), "new")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(kvs.get(self.key), "new")
+        self.assertNotIn('."state"', queries.captured_queries[0]["sql"])
+        self.assertEqual(kvs.shared_cache.hits, 1)
+
+    @pytest.mark.django_db
+    def test_least_recently_used_rows_are_evicted(self):
+        kvs = WorkbenchDjangoKeyValueStore(shared_cache_size=2, validate_shared_cache=False)
+        keys = [self.key._replace(block_scope_id=f"my_scenario.my_block.d{i}") for i in range(3)]
+        kvs.set_many({key: i for i, key in enumerate(keys)})
+        for key in keys[:2] + keys[:1] + keys[2:]:
+            kvs.get(key)
+
+        with CaptureQueriesContext(connection) as queries:
+            kvs.get(keys[0])
+            kvs.get(keys[2])
+        self.assertEqual(len(queries), 0)
+        with CaptureQueriesContext(connection) as queries:
+            kvs.get(keys[1])
+        self.assertEqual(len(queries), 1)
+
+
+class TestWriteBehind(TestCase):
+    """
+    Test the write-behind mode of the Workbench KVP Store
+    """
+    def setUp(self):
+        super().setUp()
+        self.kvs = WorkbenchDjangoKeyValueStore(write_behind=True, max_staleness=3600)
+        self.user_key = KeyValueStore.Key(
+            scope=Scope.user_state,
+            user_id="rusty",
+            block_scope_id="my_scenario.my_block.d0.u0",
+            field_name="age",
+        )
+        self.shared_key = self.user_key._replace(
+            scope=Scope.content, user_id=None, block_scope_id="my_scenario.my_block.d0",
+        )
+
+    def tearDown(self):
+        self.kvs.close()
+        super().tearDown()
+
+    @pytest.mark.django_db
+    def test_user_rows_are_written_behind(self):
+        with self.kvs.unit_of_work():
+            self.kvs.set(self.user_key, 7)
+            self.kvs.set(self.shared_key, "text")
+        self.assertIsNotNone(XBlockState.find_for_key(self.shared_key))
+        self.assertIsNone(XBlockState.find_for_key(self.user_key))
+
+        # Reads see the pending writes.
+        self.assertEqual(self.kvs.get(self.user_key), 7)
+        self.kvs.delete(self.user_key)
+        self.assertFalse(self.kvs.has(self.user_key))
+        self.kvs.set(self.user_key, 8)
+        self.kvs.set(self.user_key._replace(field_name="height"), 120)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.kvs.flush()
+        writes = [query for query in queries.captured_queries if query["sql"].startswith(("INSERT", "UPDATE"))]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(WorkbenchDjangoKeyValueStore().get(self.user_key), 8)
+        self.assertEqual(WorkbenchDjangoKeyValueStore().get(self.user_key._replace(field_name="height")), 120)
+
+    @pytest.mark.django_db
+    def test_failed_flush_keeps_changes(self):
+        self.kvs.set(self.user_key, 7)
+        with mock.patch.object(self.kvs, "_save_changes", side_effect=StateConflictError()):
+            with self.assertRaises(StateConflictError):
+                self.kvs.flush()
+        self.kvs.set(self.user_key._replace(field_name="height"), 120)
+        self.assertEqual(self.kvs.get(self.user_key), 7)
+
+        self.kvs.flush()
+        self.assertEqual(WorkbenchDjangoKeyValueStore().get(self.user_key), 7)
+        self.assertEqual(WorkbenchDjangoKeyValueStore().get(self.user_key._replace(field_name="height")), 120)
+
+    @pytest.mark.django_db
+    def test_clear_discards_pending_writes(self):
+        self.kvs.set(self.user_key, 7)
+        self.kvs.clear()
+        self.kvs.flush()
+        self.assertFalse(self.kvs.has(self.user_key))
+        self.assertFalse(XBlockState.objects.exists())
+
+    @pytest.mark.django_db
+    def test_rows_read_before_a_flush_are_read_again(self):
+        self.kvs.set(self.user_key, 7)
+        read_rows = self.kvs._read_rows  # pylint: disable=protected-access
+
+        def read_then_flush(work, missing):
+            read_rows(work, missing)
+            if read.call_count == 1:
+                # The buffer is saved after our read, but before we apply its changes.
+                self.kvs.flush()
+
+        with mock.patch.object(self.kvs, "_read_rows", side_effect=read_then_flush) as read:
+            self.assertEqual(self.kvs.get(self.user_key), 7)
+        # Our read, the flush's, and ours again.
+        self.assertEqual(read.call_count, 3)
+
+    @pytest.mark.django_db
+    def test_increment_saves_pending_writes_first(self):
+        self.kvs.set(self.user_key, 7)
+        self.assertEqual(self.kvs.increment(self.user_key), 8)
+        self.assertEqual(self.kvs.get(self.user_key), 8)
+        self.assertEqual(WorkbenchDjangoKeyValueStore().get(self.user_key), 8)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_write_behind_thread_saves_changes():
+    kvs = WorkbenchDjangoKeyValueStore(write_behind=True, max_staleness=0.01)
+    key = KeyValueStore.Key(
+        scope=Scope.user_state, user_id="rusty", block_scope_id="my_scenario.my_block.d0.u0", field_name="age",
+    )
+    try:
+        kvs.set(key, 7)
+        flusher = kvs._flusher  # pylint: disable=protected-access
+        # Wait for a save without reading the table the flusher writes to, which SQLite may have locked.
+        for _ in range(500):
+            if kvs._write_behind.generation:  # pylint: disable=protected-access
+                break
+            time.sleep(0.01)
+        assert WorkbenchDjangoKeyValueStore().get(key) == 7
+    finally:
+        kvs.close()
+    assert not flusher.is_alive()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_units_of_work_do_not_wait_for_a_flush():
+    kvs = WorkbenchDjangoKeyValueStore(write_behind=True, max_staleness=3600)
+    key = KeyValueStore.Key(
+        scope=Scope.user_state, user_id="rusty", block_scope_id="my_scenario.my_block.d0.u0", field_name="age",
+    )
+    saving, release = threading.Event(), threading.Event()
+    real_save_changes = kvs._save_changes  # pylint: disable=protected-access
+
+    def slow_save_changes(work, row_keys=None):
+        if threading.current_thread() is flushing:
+            saving.set()
+            release.wait(10)
+        real_save_changes(work, row_keys)
+
+    def unit_of_work():
+        with kvs.unit_of_work():
+            kvs.set(key._replace(user_id="bob"), 8)
+
+    try:
+        kvs.set(key, 7)
+        with mock.patch.object(kvs, "_save_changes", side_effect=slow_save_changes):
+            flushing = threading.Thread(target=kvs.flush)
+            flushing.start()
+            assert saving.wait(10)
+            request = threading.Thread(target=unit_of_work)
+            request.start()
+            request.join(5)
+            assert not request.is_alive()
+            release.set()
+            flushing.join()
+        assert WorkbenchDjangoKeyValueStore().get(key) == 7
+    finally:
+        release.set()
+        kvs.close()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_increments_are_all_counted():
+    # The threads share one store, like the requests of a process share
+    # WORKBENCH_KVS: the test database can't take writes from several at once.
+    kvs = WorkbenchDjangoKeyValueStore()
+    key = KeyValueStore.Key(
+        scope=Scope.user_state_summary, user_id=None, block_scope_id="my_scenario.my_block.d0.u0", field_name="votes",
+    )
+    threads, increments = 4, 25
+    start = threading.Barrier(threads)
+    errors = []
+
+    def vote():
+        start.wait()
+        try:
+            for _ in range(increments):
+                kvs.increment(key)
+        except Exception as error:  # pylint: disable=broad-except
+            errors.append(error)
+        finally:
+            connection.close()
+
+    voters = [threading.Thread(target=vote) for _ in range(threads)]
+    for voter in voters:
+        voter.start()
+    for voter in voters:
+        voter.join()
+    assert not errors
+    assert WorkbenchDjangoKeyValueStore().get(key) == threads * increments
+
 
 class StubService:
     """Empty service to test loading additional services."""
@@ -204,6 +709,7 @@ class TestServices(TestCase):
         """Check that the default services are available."""
         self._assert_service(runtime, "field-data", KvsFieldData)
         self._assert_service(runtime, "user", UserService)
+        self._assert_service(runtime, "counter", WorkbenchCounterService)
 
     def _assert_service(self, runtime, service_name, service_class):
         """Check that a service is loaded."""
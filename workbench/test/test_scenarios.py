@@ -9,10 +9,12 @@ import unittest
 import lxml.html
 import pytest
 
+from django.template.defaultfilters import slugify
 from django.test.client import Client
 from django.urls import reverse
 
 from workbench import scenarios
+from workbench.models import XBlockState
 from workbench.runtime_util import reset_global_state
 
 pytestmark = pytest.mark.django_db
@@ -84,3 +86,28 @@ class ScenarioTest(unittest.TestCase):
             views_seen |= set(el.text.strip() for el in html.xpath('//a[@class="block-view-link"]'))
         # At least one of our test blocks should have the studio view available, or else we need to add one which does.
         assert "studio_view" in views_seen
+
+    def test_reset_scenario_state(self):
+        """
+        Resetting one scenario deletes its state only, and reloads it with the same ids.
+        """
+        reset_id, other_id = sorted(scenarios.get_scenarios())[:2]
+        reset_slug = slugify(scenarios.get_scenarios()[reset_id].description)
+        other_slug = slugify(scenarios.get_scenarios()[other_id].description)
+        usage_id = scenarios.get_scenarios()[reset_id].usage_id
+        for slug in (reset_slug, other_slug):
+            XBlockState.objects.create(
+                scope="usage", scope_id=f"{slug}.html.d0.u0", user_id="student_1", scenario=slug, tag="html",
+            )
+
+        response = Client().post(reverse('reset_state'), {'scenario': reset_id}, HTTP_REFERER="/")
+        assert response.status_code == 302
+
+        assert scenarios.get_scenarios()[reset_id].usage_id == usage_id
+        assert not XBlockState.objects.filter(scenario=reset_slug, user_id="student_1").exists()
+        assert XBlockState.objects.filter(scenario=reset_slug, user_id=None).exists()
+        assert XBlockState.objects.filter(scenario=other_slug, user_id="student_1").exists()
+
+    def test_reset_unknown_scenario_state(self):
+        response = Client().post(reverse('reset_state'), {'scenario': 'nope'}, HTTP_REFERER="/")
+        assert response.status_code == 404
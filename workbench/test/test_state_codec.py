@@ -0,0 +1,150 @@
+"""Test the XBlock state codecs."""
+
+
+import math
+from io import StringIO
+from unittest import TestCase, mock
+
+import pytest
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+
+from workbench import state_codec
+from workbench.models import XBlockFieldState, XBlockState
+from workbench.state_codec import compress_state, decode_state, encode_state, get_codec, get_compressor
+
+STATE = {"count": 3, "name": "café", "nested": {"a": [1, 2.5, None, True]}}
+
+
+class TestStateCodecs(TestCase):
+    """
+    Test encoding and decoding with each codec.
+    """
+
+    def test_json_codecs_round_trip(self):
+        for name in ("json", "compact-json", "fast-json"):
+            encoded = encode_state(STATE, get_codec(name))
+            self.assertEqual(decode_state(encoded), STATE, name)
+
+    def test_big_and_non_finite_numbers_round_trip(self):
+        state = {"big": 2 ** 70, "small": -2 ** 70, "max": 2 ** 64 - 1, "inf": float("inf"), "-inf": float("-inf")}
+        for name in ("json", "compact-json", "fast-json", "msgpack"):
+            decoded = decode_state(encode_state({**state, "nan": float("nan")}, get_codec(name)))
+            self.assertTrue(math.isnan(decoded.pop("nan")), name)
+            self.assertEqual(decoded, state, name)
+            self.assertIsInstance(decoded["big"], int, name)
+
+    def test_compact_json_is_smaller(self):
+        self.assertLess(
+            len(encode_state(STATE, get_codec("compact-json"))),
+            len(encode_state(STATE, get_codec("json"))),
+        )
+
+    def test_fast_json_without_orjson(self):
+        with mock.patch.object(state_codec, "orjson", None):
+            encoded = encode_state(STATE, get_codec("fast-json"))
+            self.assertEqual(encoded, encode_state(STATE, get_codec("compact-json")))
+            self.assertEqual(decode_state(encoded), STATE)
+
+    def test_msgpack_round_trip(self):
+        pytest.importorskip("msgpack")
+        encoded = encode_state(STATE, get_codec("msgpack"))
+        self.assertTrue(encoded.startswith("msgpack:"))
+        self.assertEqual(decode_state(encoded), STATE)
+
+    def test_msgpack_not_installed(self):
+        with mock.patch.object(state_codec, "msgpack", None):
+            with self.assertRaises(ImproperlyConfigured):
+                encode_state(STATE, get_codec("msgpack"))
+
+    def test_configured_codec(self):
+        with mock.patch.dict("django.conf.settings.WORKBENCH", {"state_codec": "json"}):
+            self.assertEqual(get_codec().name, "json")
+        with mock.patch.dict("django.conf.settings.WORKBENCH", {"state_codec": "nope"}):
+            with self.assertRaises(ImproperlyConfigured):
+                get_codec()
+
+    def test_compression_round_trip(self):
+        big_state = {"content": "<p>Some repetitive HTML content.</p>" * 200}
+        with mock.patch.dict("django.conf.settings.WORKBENCH", {"state_compression": "zlib"}):
+            encoded = encode_state(big_state, get_codec("compact-json"))
+            self.assertTrue(encoded.startswith("zlib:"))
+            self.assertLess(len(encoded), len(get_codec("compact-json").encode(big_state)))
+            self.assertEqual(decode_state(encoded), big_state)
+
+            # Small blobs are left alone, and both kinds can be read.
+            self.assertEqual(encode_state(STATE, get_codec("compact-json")), get_codec("compact-json").encode(STATE))
+            self.assertEqual(decode_state(encode_state(STATE)), STATE)
+
+    def test_compression_threshold(self):
+        text = get_codec("compact-json").encode({"content": "x" * 100})
+        self.assertEqual(compress_state(text, get_compressor("zlib"), threshold=1000), text)
+        self.assertTrue(compress_state(text, get_compressor("zlib"), threshold=10).startswith("zlib:"))
+        # Compressing something that doesn't get smaller isn't worth it.
+        self.assertEqual(compress_state('{"a":1}', get_compressor("zlib"), threshold=0), '{"a":1}')
+
+    def test_compressed_msgpack(self):
+        pytest.importorskip("msgpack")
+        big_state = {"content": "abc" * 2000}
+        encoded = compress_state(encode_state(big_state, get_codec("msgpack")), get_compressor("zlib"), threshold=0)
+        self.assertTrue(encoded.startswith("zlib:"))
+        self.assertEqual(decode_state(encoded), big_state)
+
+    def test_zstd_not_installed(self):
+        with mock.patch.object(state_codec, "zstandard", None):
+            with self.assertRaises(ImproperlyConfigured):
+                compress_state("x" * 100, get_compressor("zstd"), threshold=0)
+
+    def test_configured_compression(self):
+        self.assertIsNone(get_compressor())
+        with mock.patch.dict("django.conf.settings.WORKBENCH", {"state_compression": "nope"}):
+            with self.assertRaises(ImproperlyConfigured):
+                get_compressor()
+
+    def test_unknown_marker(self):
+        with self.assertRaises(ValueError):
+            decode_state("nope:1234")
+
+
+@pytest.mark.django_db
+def test_reencode_state_command():
+    rows = [
+        XBlockState.objects.create(scope="usage", scope_id=f"s.html.d{i}.u0", state=encode_state(
+            {"i": i}, get_codec("json")
+        ))
+        for i in range(5)
+    ]
+    field_row = XBlockFieldState.objects.create(
+        scope="usage", scope_id="s.html.d0.u0", field_name="i", state=encode_state({"i": 0}, get_codec("json")),
+    )
+    out = StringIO()
+    call_command("reencode_state", "--codec", "compact-json", "--batch-size", "2", stdout=out)
+
+    assert "Re-encoded 6 of 6 rows" in out.getvalue()
+    for i, row in enumerate(rows):
+        row.refresh_from_db()
+        assert row.state == '{"i":%d}' % i
+    field_row.refresh_from_db()
+    assert (field_row.state, field_row.version) == ('{"i":0}', 2)
+
+
+@pytest.mark.django_db
+def test_reencode_state_keeps_concurrent_changes():
+    row = XBlockState.objects.create(
+        scope="usage", scope_id="s.html.d0.u0", state=encode_state({"i": 0}, get_codec("json")),
+    )
+    real_encode = state_codec.encode_state
+
+    def encode_during_a_write(data, codec=None):
+        if data == {"i": 0}:
+            # Another writer changes the row after the command read it.
+            XBlockState.objects.filter(pk=row.pk).update(state='{"i": 1}', version=2)
+        return real_encode(data, codec)
+
+    with mock.patch("workbench.management.commands.reencode_state.encode_state", side_effect=encode_during_a_write):
+        call_command("reencode_state", "--codec", "compact-json", stdout=StringIO())
+
+    row.refresh_from_db()
+    assert row.state == '{"i":1}'
+    assert row.version == 3
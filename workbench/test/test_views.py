@@ -9,13 +9,16 @@ from web_fragments.fragment import Fragment
 from webob import Response
 from xblock.core import Scope, String, XBlock
 from xblock.exceptions import DisallowedFileError
-from xblock.runtime import NoSuchHandlerError
+from xblock.runtime import KeyValueStore, NoSuchHandlerError
 
+from django.db import connection
 from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from workbench import scenarios
-from workbench.runtime import ID_MANAGER
+from workbench.models import XBlockState
+from workbench.runtime import ID_MANAGER, WORKBENCH_KVS
 
 pytestmark = pytest.mark.django_db
 
@@ -351,3 +354,78 @@ def test_user_list():
     result = client.get("/userlist/")
     assert result.status_code == 200
     assert result.content.decode('utf-8') == "[]"
+
+
+def test_user_list_pages():
+    for user_id in ("alice", "bob", "bobby", "carol"):
+        XBlockState.objects.create(scope="usage", scope_id="s.t.d0.u0", user_id=user_id, scenario="s", tag="t")
+    XBlockState.objects.create(scope="usage", scope_id="s.t.d0.u1", user_id="bob", scenario="s", tag="t")
+    XBlockState.objects.create(scope="content", scope_id="s.t.d0", scenario="s", tag="t")
+    XBlockState.user_ids_changed()
+    client = Client()
+
+    result = client.get("/userlist/")
+    assert json.loads(result.content.decode('utf-8')) == ["alice", "bob", "bobby", "carol"]
+    assert "Link" not in result
+
+    result = client.get("/userlist/", {"limit": 2})
+    assert json.loads(result.content.decode('utf-8')) == ["alice", "bob"]
+    assert result["Link"] == '</userlist/?after=bob&limit=2>; rel="next"'
+    result = client.get("/userlist/", {"after": "bob", "limit": 2})
+    assert json.loads(result.content.decode('utf-8')) == ["bobby", "carol"]
+
+    result = client.get("/userlist/", {"prefix": "bob"})
+    assert json.loads(result.content.decode('utf-8')) == ["bob", "bobby"]
+
+    assert client.get("/userlist/", {"limit": "many"}).status_code == 400
+
+
+def test_user_list_sees_new_users():
+    XBlockState.user_ids_changed()
+    client = Client()
+    assert json.loads(client.get("/userlist/").content.decode('utf-8')) == []
+    # The first write of a new student shows up straight away.
+    WORKBENCH_KVS.set(KeyValueStore.Key(Scope.user_state, "newcomer", "s.t.d0.u0", "count"), 1)
+    assert json.loads(client.get("/userlist/").content.decode('utf-8')) == ["newcomer"]
+
+
+def test_metrics():
+    client = Client()
+    client.get("/scenario/html_demo.0/")
+
+    result = client.get("/metrics/")
+    assert result.status_code == 200
+    metrics = json.loads(result.content.decode('utf-8'))
+    assert metrics["workbench_kvs_operations_total"]["type"] == "counter"
+    assert metrics["workbench_kvs_operations_total"]["samples"]
+
+    result = client.get("/metrics/", {"format": "prometheus"})
+    assert result.status_code == 200
+    assert result["Content-Type"].startswith("text/plain")
+    assert "# TYPE workbench_kvs_operation_seconds histogram" in result.content.decode('utf-8')
+
+
+def test_scenario_state_is_prefetched():
+    # Rendering a scenario reads its state with the same number of queries,
+    # however many blocks it has.
+    state_queries = []
+    for size in (1, 10):
+        scenarios.add_xml_scenario(
+            f"prefetch_{size}", f"Prefetch {size}",
+            "<vertical_demo>%s</vertical_demo>" % "".join(
+                "<sequence_demo><html_demo>Block %d</html_demo><problem_demo/></sequence_demo>" % i
+                for i in range(size)
+            ),
+        )
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                response = Client().get(f"/view/prefetch_{size}/")
+            assert response.status_code == 200
+        finally:
+            scenarios.remove_scenario(f"prefetch_{size}")
+        state_queries.append(len([
+            query for query in queries.captured_queries
+            if query["sql"].startswith("SELECT") and "workbench_xblockstate" in query["sql"]
+        ]))
+    # The keys and versions of the rows, then the state of those that aren't cached.
+    assert state_queries[0] == state_queries[1] == 2
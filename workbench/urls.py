@@ -22,6 +22,9 @@ urlpatterns = [
     re_path(r'^userlist/$',
         views.user_list,
         name='userlist'),
+    re_path(r'^metrics/$',
+        views.metrics,
+        name='metrics'),
     re_path(
         r'^scenario/(?P<scenario_id>[^/]+)/$',
         views.show_scenario,
@@ -8,6 +8,7 @@ This code is in the Workbench layer.
 
 import logging
 import mimetypes
+from urllib.parse import urlencode
 
 from xblock.core import XBlock, XBlockAside
 from xblock.django.request import django_to_webob_request, webob_to_django_response
@@ -15,19 +16,24 @@ from xblock.exceptions import NoSuchUsage
 from xblock.plugin import PluginMissingError
 
 from django.conf import settings
-from django.http import Http404, HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import redirect, render
+from django.template.defaultfilters import slugify
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 
+from .metrics import REGISTRY
 from .models import XBlockState
-from .runtime import WorkbenchRuntime
+from .runtime import WORKBENCH_KVS, WorkbenchRuntime
 from .runtime_util import reset_global_state
-from .scenarios import get_scenarios
+from .scenarios import get_scenarios, reload_scenario
 
 log = logging.getLogger(__name__)
 
 KNOWN_BLOCK_VIEWS = ['student_view', 'author_view', 'studio_view']
 
+USER_LIST_PAGE_SIZE = 1000
+USER_LIST_MAX_PAGE_SIZE = 10000
+
 # We don't really have authentication and multiple students, just accept their
 # id on the URL.
 def get_student_id(request):
@@ -88,14 +94,15 @@ def show_scenario(request, scenario_id, view_name='student_view', template='work
 
     usage_id = scenario.usage_id
     runtime = WorkbenchRuntime(student_id)
-    block = runtime.get_block(usage_id)
     render_context = {
         'activate_block_id': request.GET.get('activate_block_id', None)
     }
 
-    other_views = sorted(get_block_views(block) - {view_name})
-
-    frag = block.render(view_name, render_context)
+    with WORKBENCH_KVS.unit_of_work():
+        WORKBENCH_KVS.prefetch_scenario(slugify(scenario.description), student_id)
+        block = runtime.get_block(usage_id)
+        other_views = sorted(get_block_views(block) - {view_name})
+        frag = block.render(view_name, render_context)
     log.info("End show_scenario %s", scenario_id)
     return render(request, template, {
         'scenario_id': scenario_id,
@@ -110,17 +117,41 @@ def show_scenario(request, scenario_id, view_name='student_view', template='work
     })
 
 
-def user_list(_request):
+def user_list(request):
+    """
+    Return a page of the sorted ids of the users with state in the database.
+
+    The GET parameters are `after`, a cursor that the page starts after (the
+    last id of the previous page), `prefix`, which the ids must start with,
+    and `limit`, the page size. When there may be more users, a ``Link``
+    header points to the next page.
     """
-    This will return a list of all users in the database
+    after = request.GET.get('after')
+    prefix = request.GET.get('prefix')
+    try:
+        limit = int(request.GET.get('limit', USER_LIST_PAGE_SIZE))
+    except ValueError:
+        return HttpResponseBadRequest("limit must be an integer")
+    limit = max(1, min(limit, USER_LIST_MAX_PAGE_SIZE))
+
+    users = XBlockState.user_ids(after=after, prefix=prefix, limit=limit)
+    response = JsonResponse(users, safe=False)
+    if len(users) == limit:
+        params = {'after': users[-1], 'limit': limit}
+        if prefix:
+            params['prefix'] = prefix
+        response['Link'] = f'<{request.path}?{urlencode(params)}>; rel="next"'
+    return response
+
+
+def metrics(request):
+    """
+    Return the metrics of this process as JSON, or in the Prometheus text
+    format with ``?format=prometheus``.
     """
-    # We'd really like to do .distinct, but sqlite+django does not support this;
-    # hence the hack with sorted(set(...))
-    users = sorted(
-        user_id[0]
-        for user_id in set(XBlockState.objects.values_list('user_id'))
-    )
-    return JsonResponse(users, safe=False)
+    if request.GET.get('format') == 'prometheus':
+        return HttpResponse(REGISTRY.as_prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    return JsonResponse(REGISTRY.as_dict())
 
 
 def handler(request, usage_id, handler_slug, suffix='', authenticated=True):
@@ -134,15 +165,16 @@ def handler(request, usage_id, handler_slug, suffix='', authenticated=True):
 
     runtime = WorkbenchRuntime(student_id)
 
-    try:
-        block = runtime.get_block(usage_id)
-    except NoSuchUsage as ex:
-        raise Http404 from ex
+    with WORKBENCH_KVS.unit_of_work():
+        try:
+            block = runtime.get_block(usage_id)
+        except NoSuchUsage as ex:
+            raise Http404 from ex
 
-    request = django_to_webob_request(request)
-    request.path_info_pop()
-    request.path_info_pop()
-    result = block.runtime.handle(block, handler_slug, request, suffix)
+        request = django_to_webob_request(request)
+        request.path_info_pop()
+        request.path_info_pop()
+        result = block.runtime.handle(block, handler_slug, request, suffix)
     log.info("End handler %s/%s", usage_id, handler_slug)
     return webob_to_django_response(result)
 
@@ -158,15 +190,16 @@ def aside_handler(request, aside_id, handler_slug, suffix='', authenticated=True
 
     runtime = WorkbenchRuntime(student_id)
 
-    try:
-        block = runtime.get_aside(aside_id)
-    except NoSuchUsage as ex:
-        raise Http404 from ex
+    with WORKBENCH_KVS.unit_of_work():
+        try:
+            block = runtime.get_aside(aside_id)
+        except NoSuchUsage as ex:
+            raise Http404 from ex
 
-    request = django_to_webob_request(request)
-    request.path_info_pop()
-    request.path_info_pop()
-    result = block.runtime.handle(block, handler_slug, request, suffix)
+        request = django_to_webob_request(request)
+        request.path_info_pop()
+        request.path_info_pop()
+        result = block.runtime.handle(block, handler_slug, request, suffix)
     log.info("End handler %s/%s", aside_id, handler_slug)
     return webob_to_django_response(result)
 
@@ -193,9 +226,21 @@ def package_resource(_request, block_type, resource):
 
 @csrf_exempt
 def reset_state(request):
-    """Delete all state and reload the scenarios."""
-    log.info("RESETTING ALL STATE")
-    reset_global_state()
+    """
+    Delete state and reload the scenarios.
+
+    With a `scenario` in the POST data, only the state of that scenario is
+    reset, otherwise all state is.
+    """
+    scenario_id = request.POST.get('scenario')
+    if scenario_id:
+        if scenario_id not in get_scenarios():
+            raise Http404
+        log.info("RESETTING STATE OF SCENARIO %s", scenario_id)
+        reload_scenario(scenario_id)
+    else:
+        log.info("RESETTING ALL STATE")
+        reset_global_state()
     referrer_url = request.META['HTTP_REFERER']
 
     return redirect(referrer_url)